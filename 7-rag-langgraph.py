@@ -2,6 +2,7 @@
 from write_graph.write_graph_to_a_file import GraphSaver
 from dotenv import load_dotenv
 import os
+import uuid
 
 load_dotenv('../.env')  # Load environment variables from .env file
 
@@ -10,208 +11,39 @@ if not os.getenv("USER_AGENT"):
     os.environ["USER_AGENT"] = "MyLangGraphBot/1.0"
 
 
-from langchain.tools import Tool
-
-from support_portal_cases_search import get_case_descriptions_wrapper
-
-
-from langchain_community.tools.tavily_search import TavilySearchResults
-
-##############################################
-# BT - Langchain community tools.
-##############################################
-search_internet_tool = TavilySearchResults(max_results=2)
-
-from vectorstore_builder_class import VectorstoreBuilder
-
-vs = VectorstoreBuilder(pdf_directory="./docs", persist_directory="./chroma_db")
-
-retriever_tool = vs.get_retriever_tool()
-
-tools = [retriever_tool, search_internet_tool]
-
-# tools = [get_case_descriptions_wrapper]
-
-# Use the retriever_tool in your agent/toolchain
-
-
-from typing import Annotated, Sequence
-from typing_extensions import TypedDict
-
-from langchain_core.messages import BaseMessage
-
-from langgraph.graph.message import add_messages
-
-
-class AgentState(TypedDict):
-    # The add_messages function defines how an update should be processed
-    # Default is to replace. add_messages says "append"
-    messages: Annotated[Sequence[BaseMessage], add_messages]
-
-
-from typing import Annotated, Literal, Sequence
-from typing_extensions import TypedDict
-
-from langchain import hub
-from langchain_core.messages import BaseMessage, HumanMessage
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
-
-from pydantic import BaseModel, Field
-
-
-from langgraph.prebuilt import tools_condition
-
-from langchain_core.prompts import PromptTemplate
-
-
-
-from langchain_core.messages import SystemMessage
-
-
-SYSTEM_MSG = SystemMessage(
-    content="""
-            You are an expert Multitech Technical Support assistant for question-answering tasks.
-
-            1. Use only the provided Multitech internal documents to answer the question.
-            2. If internal context is insufficient, use the Tavily search tool. When using the Tavily search tool, make sure it is
-               related to Multitech products. For example, the product names are MTCDT, MTCDTIP, MTCAP, MTCAP2, MTCAP3, xDot, mDot...etc.
-            3. Do not mix information from different sources — clearly state if the answer is from internal documents or web search.
-            4. Look for the keyword from the user questions and try to match it with an exact word from the search Multitech internal documents or
-               a similar word. For example, if the keyword is 'at+pp', the exact is 'at+pp' or the similar word is 'at+ppxxx', the xxx can be any
-               any characters from [a to z or A to Z, 1 - 9]...etc.
-            5. Provide complete, step-by-step instructions. Include links, screenshots, or examples exactly as shown.
-            6. Cite the source (e.g., document name or URL).
-            7. If no answer is found, say: "I don’t know."
-            """
-)
-
-
-### Edges
-
-# Import the GradeDocumentEdges class
-from grade_document_edges import GradeDocumentEdges
-
-# Instantiate the class
-grade_document_edges = GradeDocumentEdges()
-
-# Use the class method as the callback
-def grade_documents(state):
-    return grade_document_edges.grade_documents(state)
-
-
-
-# Import the Agent class and use it for the agent node
-from agent import Agent
-
-# Instantiate the Agent class
-agent_instance = Agent(SYSTEM_MSG, tools)
-
-# Use the class method as the callback
-def agent(state):
-    return agent_instance.agent(state)
-
-
-
-# Import the RewriteAgent class and use it for the rewrite node
-from rewrite_agent import RewriteAgent
-
-# Instantiate the RewriteAgent class
-rewrite_agent_instance = RewriteAgent()
-
-# Use the class method as the callback
-def rewrite(state):
-    return rewrite_agent_instance.rewrite(state)
-
-# Import the GenerateAgent class and use it for the generate node
-from generate_agent import GenerateAgent
-
-# Instantiate the GenerateAgent class
-generate_agent_instance = GenerateAgent()
-
-# Use the class method as the callback
-def generate(state):
-    return generate_agent_instance.generate(state)
-
-
-from langgraph.graph import END, StateGraph, START
-from langgraph.prebuilt import ToolNode
-
-# Define a new graph
-workflow = StateGraph(AgentState)
-
-# Define the nodes we will cycle between
-workflow.add_node("agent", agent)  # agent
-retrieve = ToolNode([retriever_tool])
-# workflow.add_node("retrieve", retrieve)  # retrieval
-workflow.add_node("use_tools", retrieve)  # retrieval
-workflow.add_node("rewrite", rewrite)  # Re-writing the question
-workflow.add_node("generate", generate)  # Generating a response after we know the documents are relevant
-# Call agent node to decide to retrieve or not
-workflow.add_edge(START, "agent")
-
-# Decide whether to retrieve
-workflow.add_conditional_edges(
-    "agent",
-    # Assess agent decision
-    # BT - If the LLM responses a 'tool_calls', then tool_condition will return 'tools'
-    tools_condition,
-    {
-        # Translate the condition outputs to nodes in our graph
-        ##############################################################################################
-        # BT - The return 'tools' from tools_condition it will invoke the "retrieve" tool in 
-        #      call the RAG.
-        ##############################################################################################
-        # "tools": "retrieve",
-        "tools": "use_tools",
-        END: END,
-    },
-)
-
-# Edges taken after the `action` node is called.
-workflow.add_conditional_edges(
-    # "retrieve",
-    "use_tools",
-    ########################################################################################################
-    # BT - When 'retrieve' return, it will run the 'grade_documents'. The 'grade_documents' will rate
-    #      the message and it will return either 'generate' or 'rewrite'. 
-    #      If it is 'rewrite' then the 'rewrite' will back to 'agent'. Otherwise, if it is 'generate',
-    #      then it will goes to END
-    ########################################################################################################
-    # Assess agent decision
-    grade_documents,
-)
-######################################################################################################
-# BT - So,down here is where the decision is made based on the grading of the documents.
-#      if the grade_documents returns 'generate', then it will go to END.
-#      otherwise, it will go to 'rewrite' and then back to 'agent'.
-######################################################################################################
-workflow.add_edge("generate", END)
-workflow.add_edge("rewrite", "agent")
+import resources
+import streamlit as st
+from chat_client import ChatServiceError
+from chat_session import chat_turn
+from context_assembler import format_references
 
-# Compile
-# graph = workflow.compile()
+# Logging level and the JSONL trace file come from LOG_LEVEL and TRACE_PATH.
+resources.configure_telemetry()
 
-##########################################################################
-# BT - Memory Saver SECTION: Save the state of the graph for streaming.
-##########################################################################
-from langgraph.checkpoint.memory import MemorySaver
+# With CHAT_SERVICE_URL set this app is a thin client: chat_service.py owns the graph,
+# the index and ingestion. Otherwise everything runs inside the Streamlit process.
+service = resources.get_chat_service_client() if resources.CHAT_SERVICE_URL else None
 
-# Initialize MemorySaver for in-memory state management
-memory = MemorySaver()
+if service is None:
+    # Embedding progress for new or changed docs is shown in the sidebar while indexing runs.
+    index_progress = st.sidebar.empty()
 
+    def show_index_progress(file_name, done, total, elapsed):
+        rate = done / elapsed if elapsed else 0.0
+        index_progress.progress(done / total, text=f"Indexing {file_name}: {done}/{total} chunks ({rate:.1f} chunks/s)")
 
-# Compile the workflow with the memory checkpointer
-graph = workflow.compile(checkpointer=memory)
+    # The vectorstore, tools, agents and compiled graph are built once per process and
+    # reused across Streamlit reruns. Indexing only runs again when ./docs changes.
+    resources.ensure_index_current(progress_callback=show_index_progress)
+    graph = resources.get_graph()
+    index_progress.empty()
 
-# Save the workflow graph as a PNG
-# graph_saver = GraphSaver(graph)
-# result = graph_saver.save_graph()
-# print("Graph save result:", result)
+    # Save the workflow graph as a PNG
+    # graph_saver = GraphSaver(graph)
+    # result = graph_saver.save_graph()
+    # print("Graph save result:", result)
 
-# Configuration for the workflow execution
-config = {"configurable": {"thread_id": "1"}}
+    checkpoint_store = resources.get_checkpoint_store()
 
 
 #####################################
@@ -228,26 +60,60 @@ def convert_messages(messages):
             converted.append(AIMessage(content=msg["content"]))
     return converted
 
-import streamlit as st
-
 
 st.title("BT - Multitech Chatbot")
 
 # Sidebar file uploader for user documents
 st.sidebar.title("Upload Your Document")
-docs_folder = "./docs"
-if not os.path.exists(docs_folder):
-    os.makedirs(docs_folder)
+docs_folder = resources.DOCS_DIRECTORY
+if service is None:
+    if not os.path.exists(docs_folder):
+        os.makedirs(docs_folder)
+
+    # Uploads and deletes are indexed by a background worker; chat keeps using the current index meanwhile.
+    ingestion_worker = resources.get_ingestion_worker()
+    # Files dropped into ./docs directly (not through the uploader) are picked up by the watcher.
+    if resources.WATCH_DOCS:
+        resources.get_docs_watcher()
+if "handled_uploads" not in st.session_state:
+  st.session_state.handled_uploads = set()
 
 uploaded_file = st.sidebar.file_uploader("Choose a file to upload (PDF, TXT, etc.)", type=["pdf", "txt", "docx","md", "csv", "xlsx"])
-if uploaded_file is not None:
+replace_existing = st.sidebar.checkbox("Replace a file with the same name")
+# The uploader returns the same file on every rerun; queue each upload only once.
+if uploaded_file is not None and uploaded_file.file_id not in st.session_state.handled_uploads and service is not None:
+    try:
+        service.upload_document(uploaded_file.name, uploaded_file.getvalue(), replace=replace_existing)
+        st.sidebar.success(f"Uploaded: {uploaded_file.name}")
+        st.session_state.handled_uploads.add(uploaded_file.file_id)
+    except ChatServiceError as e:
+        st.sidebar.warning(f"{e} Upload aborted.")
+elif uploaded_file is not None and uploaded_file.file_id not in st.session_state.handled_uploads:
     save_path = os.path.join(docs_folder, uploaded_file.name)
-    if os.path.exists(save_path):
+    exists = os.path.exists(save_path)
+    if exists and not replace_existing:
         st.sidebar.warning(f"A file named '{uploaded_file.name}' already exists in the docs folder. Upload aborted.")
     else:
         with open(save_path, "wb") as f:
             f.write(uploaded_file.getbuffer())
         st.sidebar.success(f"Uploaded: {uploaded_file.name}")
+        ingestion_worker.submit("replace" if exists else "add", uploaded_file.name)
+        st.session_state.handled_uploads.add(uploaded_file.file_id)
+
+@st.fragment(run_every=2)
+def show_ingestion_jobs():
+    # Refreshes on its own every 2 seconds, so job status updates without a full rerun.
+    if service is not None:
+        jobs = [job["description"] for job in service.recent_jobs(5)]
+    else:
+        jobs = [job.describe() for job in ingestion_worker.recent_jobs()[:5]]
+    if jobs:
+        st.subheader("Indexing Jobs:")
+        for job in jobs:
+            st.caption(job)
+
+with st.sidebar:
+    show_ingestion_jobs()
 
 # List and delete docs in the folder
 st.sidebar.markdown("---")
@@ -272,33 +138,36 @@ st.markdown(
     """,
     unsafe_allow_html=True,
 )
-doc_files = [f for f in os.listdir(docs_folder) if os.path.isfile(os.path.join(docs_folder, f))]
+if service is not None:
+    doc_files = service.list_documents()
+else:
+    doc_files = [f for f in os.listdir(docs_folder) if os.path.isfile(os.path.join(docs_folder, f))]
 for doc in doc_files:
     col1, col2 = st.sidebar.columns([4, 1], gap="small")  # Move button to the right
     with col1:
         st.write(doc)
     with col2:
         if st.button("Delete", key=f"delete_{doc}"):
-            os.remove(os.path.join(docs_folder, doc))
-            # Remove from vectorstore as well
-            from vectorstore_builder_class import VectorstoreBuilder
-            vs = VectorstoreBuilder(pdf_directory=docs_folder, persist_directory="./chroma_db")
-            vs.delete_file_from_vectorstore(doc)
-            # Remove doc from processed_files.json
-            processed_files_path = vs.processed_files_record
-            if os.path.exists(processed_files_path):
-                import json
-                with open(processed_files_path, "r") as f:
-                    processed_files = set(json.load(f))
-                if doc in processed_files:
-                    processed_files.remove(doc)
-                    with open(processed_files_path, "w") as f:
-                        json.dump(list(processed_files), f)
+            if service is not None:
+                service.delete_document(doc)
+            else:
+                os.remove(os.path.join(docs_folder, doc))
+                # Remove from vectorstore as well, in the background
+                ingestion_worker.submit("delete", doc)
             st.rerun()
 
 if "messages" not in st.session_state:
   st.session_state.messages = []
 
+# Each browser session gets its own checkpointer thread. Starting a session is also
+# when threads left idle past their TTL are cleaned up.
+if "thread_id" not in st.session_state:
+  if service is not None:
+    st.session_state.thread_id = service.new_thread()
+  else:
+    st.session_state.thread_id = uuid.uuid4().hex
+    checkpoint_store.purge_idle_threads()
+
 for message in st.session_state.messages:
   with st.chat_message(message["role"]):
     st.markdown(message["content"])
@@ -309,15 +178,39 @@ if prompt := st.chat_input("What is up?"):
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
+        # Stream tokens from the agent/generate nodes into one updating placeholder,
+        # whether the turn runs in this process or in the chat service.
+        placeholder = st.empty()
         response = ""
-        for event in graph.stream({"messages": [{"role": "user", "content": prompt}] + st.session_state.messages},config):
-        # converted_history = convert_messages(st.session_state.messages)
-        # for event in graph.stream({"messages": converted_history}, config):
-            # print('BT - What is this: ', event)
-            if 'retrieve' not in event:
-                for value in event.values():
-                    st.markdown(value["messages"][-1].content)
-                    print("Assistant:", value["messages"][-1].content)
-                    response += value["messages"][-1].content
-        
+        result = None
+        if service is not None:
+            events = service.stream_chat(prompt, st.session_state.thread_id)
+        else:
+            events = chat_turn(
+                graph, prompt, st.session_state.thread_id, resources.get_answer_cache(), checkpoint_store
+            )
+        try:
+            for event in events:
+                if event["event"] == "reset":
+                    response = ""
+                elif event["event"] == "token":
+                    response += event["data"]["text"]
+                    placeholder.markdown(response + "▌")
+                elif event["event"] == "done":
+                    result = event["data"]
+        except ChatServiceError as e:
+            st.error(f"The chat service failed to answer: {e}")
+
+        if result is not None:
+            response = result["answer"]
+            placeholder.markdown(response)
+            if result["cached_question"]:
+                st.caption(f"Answered from cache (similar question: \"{result['cached_question']}\")")
+            else:
+                if result["sources"]:
+                    # Citations are rendered from the chunk metadata, not from whatever the model wrote.
+                    st.caption("Sources:  \n" + format_references(result["sources"]).replace("\n", "  \n"))
+                usage = result["usage"]
+                st.caption(f"Retrieval loops: {usage['rewrites']} · LLM tokens: {usage['tokens']}")
+
         st.session_state.messages.append({"role": "assistant", "content": response})
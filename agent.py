@@ -1,10 +1,27 @@
-from langchain_openai import ChatOpenAI
+import logging
+
 from langchain_core.messages import SystemMessage
 
+from model_registry import get_default_registry
+from retrieval_budget import token_usage
+
+logger = logging.getLogger(__name__)
+
+
 class Agent:
-    def __init__(self, system_msg, tools):
+    def __init__(self, system_msg, tools, model=None):
         self.system_msg = system_msg
         self.tools = tools
+        model = model or get_default_registry().get_chat_model("agent")
+        # Bind the tools once; the bound runnable is reused for every turn.
+        logger.info("binding tools: %s", [tool.name for tool in self.tools])
+        self.model = model.bind_tools(self.tools)
+
+    def _with_system_message(self, messages):
+        # Insert system message once at the beginning
+        if not any(isinstance(m, SystemMessage) for m in messages):
+            messages = [self.system_msg] + messages
+        return messages
 
     def agent(self, state):
         """
@@ -17,19 +34,19 @@ class Agent:
         Returns:
             dict: The updated state with the agent response appended to messages
         """
-        print('BT - Agent called...')
-        print("---CALL AGENT---")
         messages = state["messages"]
-        print('BT - Agent receiving messages: ', messages)
+        logger.debug("agent called with %d messages", len(messages))
 
-        # Insert system message once at the beginning
-        if not any(isinstance(m, SystemMessage) for m in messages):
-            messages = [self.system_msg] + messages
-
-        model = ChatOpenAI(temperature=0, streaming=True, model="gpt-4o")
-        print("Binding tools:", [tool.name for tool in self.tools])
-        model = model.bind_tools(self.tools)
-        response = model.invoke(messages)
-        print('BT - Agent receiving message back from LLM: ', response)
+        response = self.model.invoke(self._with_system_message(messages))
+        logger.debug("agent response: %s", response)
         # We return a list, because this will get added to the existing list
-        return {"messages": [response]}
+        return {"messages": [response], "tokens_used": token_usage(response)}
+
+    async def aagent(self, state):
+        """
+        Async version of agent(), used when the graph is driven by astream/ainvoke.
+        """
+        logger.debug("agent called (async) with %d messages", len(state["messages"]))
+        response = await self.model.ainvoke(self._with_system_message(state["messages"]))
+        logger.debug("agent response: %s", response)
+        return {"messages": [response], "tokens_used": token_usage(response)}
@@ -0,0 +1,206 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.messages import HumanMessage, ToolMessage
+
+from lexical_index import tokenize
+
+# The file name is the first field of "[Source: file | pages 2-3 | section | chunk 4]".
+SOURCE_PATTERN = re.compile(r"^\[Source: ([^\]|]+?)(?: \|[^\]]*)?\]", re.MULTILINE)
+NO_ANSWER_MARKERS = ("i don’t know", "i don't know")
+
+
+def collect_sources(messages):
+    """
+    File names cited by the retrieval tool calls of the latest turn.
+    """
+    sources = []
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            break
+        if isinstance(message, ToolMessage):
+            for source in SOURCE_PATTERN.findall(str(message.content)):
+                if source not in sources:
+                    sources.append(source)
+    return sources
+
+
+def reference_sources(references):
+    """
+    File names behind the context references of a turn, web results excluded.
+
+    Spreadsheet lookup rows are labelled "file.xlsx / sheet / row N"; only the file name is kept.
+    """
+    sources = []
+    for ref in references:
+        source = ref["source"].split(" / ")[0].strip()
+        if not ref.get("web") and source not in sources:
+            sources.append(source)
+    return sources
+
+
+def identifier_terms(question):
+    """
+    The question's terms that name something exactly: SKUs, AT commands, API paths, versions, numbers.
+
+    Questions that differ only in these ("bands for MTCDT-L4G1" vs "bands for MTCAP-L4E1")
+    embed almost identically, so a cached answer is only served when they match exactly.
+    """
+    return frozenset(term for term in tokenize(question) if not term.isalpha())
+
+
+class SemanticAnswerCache:
+    """
+    Disk-backed cache of past answers looked up by question-embedding similarity.
+
+    A question whose cosine similarity to a stored question is at or above
+    `similarity_threshold`, and which names the same identifiers (SKUs, AT
+    commands, ...), gets the stored answer back without running the graph.
+    Entries expire after `ttl_seconds`, the least recently used are evicted past
+    `max_entries`, and an entry is dropped as soon as the index manifest shows
+    that one of its source documents changed or was deleted; answers without any
+    indexed source (web results only, or no retrieval) are never stored. Each entry
+    keeps the references its answer cited, so a cache hit shows the same sources.
+    """
+
+    def __init__(self, db_path, embedding, manifest, similarity_threshold=0.92, ttl_seconds=7 * 24 * 3600, max_entries=1000):
+        self.db_path = db_path
+        self.embedding = embedding
+        self.manifest = manifest
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._ids = []
+        self._identifiers = []
+        self._matrix = None
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY, question TEXT, embedding BLOB, "
+                "answer TEXT, sources TEXT, created REAL, last_used REAL, citations TEXT)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(answers)")]
+            if "citations" not in columns:
+                conn.execute("ALTER TABLE answers ADD COLUMN citations TEXT")
+        self._load_matrix()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _load_matrix(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, embedding, question FROM answers ORDER BY id").fetchall()
+        self._ids = [row[0] for row in rows]
+        self._identifiers = [identifier_terms(row[2]) for row in rows]
+        self._matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) if rows else None
+
+    def _embed(self, question):
+        vector = np.asarray(self.embedding.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _delete(self, conn, entry_ids):
+        if entry_ids:
+            conn.executemany("DELETE FROM answers WHERE id = ?", [(i,) for i in entry_ids])
+
+    def _sources_current(self, sources):
+        for source in sources:
+            entry = self.manifest.get(source["file_key"])
+            if entry is None or entry["sha256"] != source["sha256"]:
+                return False
+        return True
+
+    def lookup(self, question):
+        """
+        Return {"question", "answer", "sources", "references", "similarity"} for a near-duplicate question, or None.
+        """
+        with self._lock:
+            self.purge_expired()
+            if self._matrix is None:
+                return None
+            similarities = self._matrix @ self._embed(question)
+            identifiers = identifier_terms(question)
+            candidates = [
+                i for i in np.argsort(-similarities)
+                if similarities[i] >= self.similarity_threshold and self._identifiers[i] == identifiers
+            ][:1]
+            if not candidates:
+                return None
+            best = int(candidates[0])
+            similarity = float(similarities[best])
+
+            entry_id = self._ids[best]
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT question, answer, sources, citations FROM answers WHERE id = ?", (entry_id,)
+                ).fetchone()
+                sources = json.loads(row[2])
+                if not self._sources_current(sources):
+                    self._delete(conn, [entry_id])
+                    stale = True
+                else:
+                    conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), entry_id))
+                    stale = False
+            if stale:
+                self._load_matrix()
+                return None
+            return {
+                "question": row[0],
+                "answer": row[1],
+                "sources": [source["source"] for source in sources],
+                "references": json.loads(row[3] or "[]"),
+                "similarity": similarity,
+            }
+
+    def store(self, question, answer, sources, references=()):
+        """
+        Cache an answer with the file names it drew on and its reference dicts.
+        "I don't know" answers and answers with no indexed source file are not cached.
+        """
+        if not answer or any(marker in answer.lower() for marker in NO_ANSWER_MARKERS):
+            return
+        cited = []
+        for source in dict.fromkeys(sources):
+            for file_key in self.manifest.find_by_source(source):
+                cited.append({"source": source, "file_key": file_key, "sha256": self.manifest.get(file_key)["sha256"]})
+        if not cited:
+            # Nothing in the manifest could ever invalidate it.
+            return
+        vector = self._embed(question)
+        now = time.time()
+        with self._lock:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO answers (question, embedding, answer, sources, created, last_used, citations) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (question, vector.tobytes(), answer, json.dumps(cited), now, now, json.dumps(list(references))),
+                )
+                overflow = conn.execute(
+                    "SELECT id FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+                ).fetchall()
+                self._delete(conn, [row[0] for row in overflow])
+            self._load_matrix()
+
+    def purge_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._connect() as conn:
+            removed = conn.execute("DELETE FROM answers WHERE created < ?", (cutoff,)).rowcount
+        if removed:
+            self._load_matrix()
+
+    def clear(self):
+        with self._lock:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM answers")
+            self._load_matrix()
@@ -0,0 +1,73 @@
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), "results")
+
+
+def percentile(values, q):
+    """
+    q-th percentile of `values` (linear interpolation), or None for an empty list.
+    """
+    return float(np.percentile(values, q)) if values else None
+
+
+def latency_summary(seconds):
+    """
+    Count, p50, p95, max and total of a list of durations, in milliseconds.
+    """
+    ms = [s * 1000 for s in seconds]
+    return {
+        "count": len(ms),
+        "p50_ms": _round(percentile(ms, 50)),
+        "p95_ms": _round(percentile(ms, 95)),
+        "max_ms": _round(max(ms) if ms else None),
+        "total_ms": _round(sum(ms)),
+    }
+
+
+def _round(value, digits=2):
+    return round(value, digits) if value is not None else None
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, timeout=10)
+        return revision.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(kind, results, output=None):
+    """
+    Write a benchmark run as JSON, with the revision and environment it ran on.
+
+    Args:
+        kind (str): Benchmark name, used in the default file name
+        results (dict): The benchmark's config, summary and details
+        output (str): Output path; defaults to benchmarks/results/<kind>-<timestamp>.json
+
+    Returns:
+        str: The path written
+    """
+    started = time.strftime("%Y%m%d-%H%M%S")
+    if output is None:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        output = os.path.join(RESULTS_DIRECTORY, f"{kind}-{started}.json")
+    document = {
+        "benchmark": kind,
+        "timestamp": started,
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        **results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2, ensure_ascii=False)
+    print(f"BT - benchmark results written to {output}")
+    return output
@@ -0,0 +1,60 @@
+"""
+Compare the numeric summary metrics of two benchmark result files.
+
+    python -m benchmarks.compare benchmarks/results/graph-before.json benchmarks/results/graph-after.json
+"""
+import argparse
+import json
+
+
+def flatten(summary, prefix=""):
+    """
+    {"nodes.agent.p95_ms": 1.2, ...} for every numeric leaf of a summary dict.
+    """
+    values = {}
+    for key, value in summary.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def compare(before, after):
+    """
+    [(metric, before, after, relative change)] for the metrics in either summary.
+    """
+    old, new = flatten(before["summary"]), flatten(after["summary"])
+    rows = []
+    for name in sorted(old.keys() | new.keys()):
+        a, b = old.get(name), new.get(name)
+        change = (b - a) / a if a not in (None, 0) and b is not None else None
+        rows.append((name, a, b, change))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--changed-only", action="store_true", help="Hide metrics that did not change")
+    args = parser.parse_args(argv)
+
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    if before.get("benchmark") != after.get("benchmark"):
+        parser.error(f"cannot compare a {before.get('benchmark')} run with a {after.get('benchmark')} run")
+
+    print(f"{before.get('git_revision')} -> {after.get('git_revision')}")
+    for name, a, b, change in compare(before, after):
+        if args.changed_only and a == b:
+            continue
+        delta = f"{change:+.1%}" if change is not None else ""
+        print(f"{name:55} {a!s:>12} {b!s:>12} {delta:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import hashlib
+import re
+import time
+import uuid
+from typing import Any, Dict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from embedding_pipeline import estimate_tokens
+from lexical_index import tokenize
+from model_registry import MODEL_CONFIG, ModelRegistry
+
+# Model and band names worth an exact spreadsheet lookup: MTCDT-L4G1, L4G1, LNA7, B13.
+TABLE_TERM_PATTERN = re.compile(r"\b(?:[A-Z]{2,}[A-Z0-9]*-[A-Z0-9-]+|[A-Z]\d[A-Z0-9]{2,}|[A-Z]{3}\d+[A-Z]?|B\d{1,2})\b")
+GRADER_QUESTION_PATTERN = re.compile(r"User Question:\n(.*?)\n\nRetrieved Documents:", re.DOTALL)
+GRADER_DOCUMENT_PATTERN = re.compile(r"^Document (\d+):\n(.*?)(?=^Document \d+:\n|\nGrade every document)", re.MULTILINE | re.DOTALL)
+GENERATE_CONTEXT_PATTERN = re.compile(r"Context: (.*)\s+Answer:\s*$", re.DOTALL)
+
+
+class HashingEmbedding(Embeddings):
+    """
+    Deterministic bag-of-words embedding: every lexical token is hashed into one of
+    `size` buckets and the counts are L2-normalised.
+
+    Unlike a random fake embedding, texts that share terms end up close together,
+    so dense retrieval behaves plausibly and hit rates are meaningful offline.
+    """
+
+    def __init__(self, size=384, latency_ms=0.0):
+        self.size = size
+        self.latency_ms = latency_ms
+        self.model = f"hashing-{size}"
+        self.calls = 0
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest, "little") % self.size] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _usage(messages, text):
+    input_tokens = sum(estimate_tokens(str(message.content)) for message in messages)
+    output_tokens = estimate_tokens(text) if text else 1
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for the chat model of one graph role.
+
+    agent: calls the internal retriever with the latest question (or rewrite),
+        plus the spreadsheet lookup when the question names a model or band.
+    grade: answers "yes" for a document covering at least `grade_threshold`
+        of the question's terms, via the same tool call structured output uses.
+    rewrite: reduces the question to its lexical terms.
+    generate: cites the first context block.
+
+    Token usage is estimated from the prompt and reply, and every call can be
+    slowed by `latency_ms` to mimic a real provider.
+    """
+
+    role: str
+    latency_ms: float = 0.0
+    grade_threshold: float = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-" + self.role
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"role": self.role}
+
+    def bind_tools(self, tools, **kwargs):
+        # Tool calls are generated from the role alone, so binding changes nothing.
+        return self
+
+    def _agent_reply(self, messages):
+        query = str(messages[-1].content)
+        tool_calls = [{"name": "technical_docs_retriever", "args": {"query": query}, "id": uuid.uuid4().hex}]
+        question = next((str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), query)
+        terms = TABLE_TERM_PATTERN.findall(question)
+        if terms:
+            tool_calls.append({"name": "spreadsheet_table_lookup", "args": {"tool_input": " ".join(terms)}, "id": uuid.uuid4().hex})
+        return AIMessage("", tool_calls=tool_calls)
+
+    def _grade_reply(self, prompt):
+        question = GRADER_QUESTION_PATTERN.search(prompt)
+        question_terms = set(tokenize(question.group(1))) if question else set()
+        grades = []
+        for match in GRADER_DOCUMENT_PATTERN.finditer(prompt):
+            terms = set(tokenize(match.group(2)))
+            covered = len(question_terms & terms) / len(question_terms) if question_terms else 0.0
+            grades.append({"document_id": int(match.group(1)), "binary_score": "yes" if covered >= self.grade_threshold else "no"})
+        return AIMessage("", tool_calls=[{"name": "grades", "args": {"grades": grades}, "id": uuid.uuid4().hex}])
+
+    def _generate_reply(self, prompt):
+        context = GENERATE_CONTEXT_PATTERN.search(prompt)
+        blocks = re.findall(r"^\[1\] [^\n]*\n([^\n]*)", context.group(1), re.MULTILINE) if context else []
+        if not blocks:
+            return AIMessage("I don’t know.")
+        return AIMessage(f"According to the internal documents [1]: {blocks[0][:300]}")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        prompt = str(messages[-1].content)
+        if self.role == "agent":
+            message = self._agent_reply(messages)
+        elif self.role == "grade":
+            message = self._grade_reply(prompt)
+        elif self.role == "rewrite":
+            match = re.search(r"-------\s*\n\s*(.*?)\s*\n\s*-------", prompt, re.DOTALL)
+            message = AIMessage(" ".join(tokenize(match.group(1) if match else prompt)))
+        else:
+            message = self._generate_reply(prompt)
+        message.usage_metadata = _usage(messages, str(message.content) + str(message.tool_calls))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def fake_model_registry(latency_ms=0.0, embedding=None):
+    """
+    A ModelRegistry whose chat models are FakeChatModels and whose embeddings never leave the process.
+    """
+    embedding = embedding or HashingEmbedding()
+    return ModelRegistry(
+        model_config=MODEL_CONFIG,
+        chat_model_factory=lambda role, params: FakeChatModel(role=role, latency_ms=latency_ms),
+        embeddings_factory=lambda config: embedding,
+    )
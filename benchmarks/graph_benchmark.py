@@ -0,0 +1,269 @@
+"""
+Replay a labelled question set through the compiled RAG graph with deterministic
+fake LLM and embedding backends, and report latency, LLM usage, rewrite loops and
+retrieval hit rate as JSON.
+
+    python -m benchmarks.graph_benchmark
+    python -m benchmarks.graph_benchmark --llm-latency-ms 200 --repeat 3 --output before.json
+    python -m benchmarks.graph_benchmark --repeat 2 --llm-cache grade rewrite
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from benchmarks.common import latency_summary, write_results
+from benchmarks.fake_backends import HashingEmbedding, fake_model_registry
+from context_assembler import ContextChunk
+from grade_document_edges import split_chunks
+from graph_builder import build_graph
+from llm_cache import SQLiteLLMCache
+from retrieval_budget import turn_usage
+from retrieval_node import stub_web_search_tool
+from vectorstore_builder_class import VectorstoreBuilder
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(__file__), "questions.json")
+# "[file.xlsx / sheet / row 14] ..." rows returned by the spreadsheet lookup tool
+LOOKUP_LABEL_PATTERN = re.compile(r"^(.+?) / (.+) / row (\d+)$")
+
+
+class GraphProfiler(BaseCallbackHandler):
+    """
+    Callback handler that times every graph node run and counts LLM calls and tokens per node.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = {}
+        self._llm_nodes = {}
+        self.node_seconds = defaultdict(list)
+        self.llm_calls = defaultdict(int)
+        self.llm_tokens = defaultdict(int)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        # Only the node's own run, not the prompts and parsers running inside it, nor a
+        # node function that happens to share the node's name.
+        node = (metadata or {}).get("langgraph_node")
+        if not node or node.startswith("__") or kwargs.get("name") != node:
+            return
+        with self._lock:
+            if self._started.get(parent_run_id, (None,))[0] != node:
+                self._started[run_id] = (node, time.perf_counter())
+
+    def _finish(self, run_id):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started:
+                node, start = started
+                self.node_seconds[node].append(time.perf_counter() - start)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node", "unknown")
+        with self._lock:
+            self._llm_nodes[run_id] = node
+            self.llm_calls[node] += 1
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                tokens += usage.get("total_tokens", 0) if usage else 0
+        with self._lock:
+            self.llm_tokens[self._llm_nodes.pop(run_id, "unknown")] += tokens
+
+
+def matches(expected, source, page_start=None, page_end=None, sheet=None, row_start=None, row_end=None):
+    """
+    True if a retrieved chunk or cited reference covers one labelled location.
+    """
+    lookup = LOOKUP_LABEL_PATTERN.match(source)
+    if lookup:
+        source, sheet = lookup.group(1), lookup.group(2)
+        row_start = row_end = int(lookup.group(3))
+    if source != expected["source"]:
+        return False
+    if expected.get("pages"):
+        return page_start is not None and any(page_start <= page <= page_end for page in expected["pages"])
+    if expected.get("rows"):
+        if row_start is None or (expected.get("sheet") and sheet != expected["sheet"]):
+            return False
+        return any(row_start <= row <= row_end for row in expected["rows"])
+    return True
+
+
+def _chunk_matches(question, chunk):
+    return any(
+        matches(expected, chunk.source, chunk.page_start, chunk.page_end, chunk.sheet, chunk.row_start, chunk.row_end)
+        for expected in question["expected"]
+    )
+
+
+def _reference_matches(question, ref):
+    return any(
+        matches(expected, ref["source"], ref["page_start"], ref["page_end"], ref["sheet"], ref["row_start"], ref["row_end"])
+        for expected in question["expected"]
+    )
+
+
+def build_index(docs_directory, index_directory, embedding, vector_backend="chroma"):
+    builder = VectorstoreBuilder(
+        pdf_directory=docs_directory, persist_directory=index_directory, embedding=embedding, vector_backend=vector_backend
+    )
+    started = time.perf_counter()
+    vectorstore = builder.build_or_update_vectorstore()
+    print(f"BT - benchmark index ready in {time.perf_counter() - started:.2f}s")
+    return builder, vectorstore
+
+
+def run_question(graph, question, thread_id, profiler):
+    """
+    Run one question and score its retrieval against the labelled locations.
+    """
+    config = {"configurable": {"thread_id": thread_id}, "callbacks": [profiler]}
+    inputs = {"messages": [{"role": "user", "content": question["question"]}]}
+    retrieved, nodes = [], []
+    started = time.perf_counter()
+    for update in graph.stream(inputs, config, stream_mode="updates"):
+        for node, values in update.items():
+            nodes.append(node)
+            if node == "use_tools":
+                # Retrieval output before grading, one list of chunks per retrieval round
+                retrieved.append([
+                    ContextChunk.parse(chunk)
+                    for message in values["messages"]
+                    if isinstance(message, ToolMessage) and message.status != "error"
+                    for chunk in split_chunks(str(message.content))
+                ])
+    seconds = time.perf_counter() - started
+
+    state = graph.get_state(config).values
+    first_round = retrieved[0] if retrieved else []
+    hit_rank = next((rank for rank, chunk in enumerate(first_round, start=1) if _chunk_matches(question, chunk)), None)
+    usage = turn_usage(state)
+    return {
+        "id": question["id"],
+        "category": question["category"],
+        "seconds": round(seconds, 4),
+        "rewrites": usage["rewrites"],
+        "tokens": usage["tokens"],
+        "fallback": "fallback" in nodes,
+        "retrieval_rounds": len(retrieved),
+        "retrieval_hit": any(_chunk_matches(question, chunk) for chunk in sum(retrieved, [])),
+        "first_round_hit_rank": hit_rank,
+        "context_hit": any(_reference_matches(question, ref) for ref in state.get("sources") or []),
+        "answer": str(state["messages"][-1].content)[:200],
+    }
+
+
+def summarize(runs, profiler, wall_seconds):
+    def rate(key):
+        return round(sum(1 for run in runs if run[key]) / len(runs), 4) if runs else None
+
+    by_category = defaultdict(list)
+    for run in runs:
+        by_category[run["category"]].append(run)
+    return {
+        "questions": len(runs),
+        "wall_seconds": round(wall_seconds, 3),
+        "end_to_end": latency_summary([run["seconds"] for run in runs]),
+        "nodes": {node: latency_summary(seconds) for node, seconds in sorted(profiler.node_seconds.items())},
+        "llm_calls": dict(sorted(profiler.llm_calls.items())),
+        "llm_calls_total": sum(profiler.llm_calls.values()),
+        "llm_tokens": dict(sorted(profiler.llm_tokens.items())),
+        "tokens_total": sum(run["tokens"] for run in runs),
+        "rewrites_total": sum(run["rewrites"] for run in runs),
+        "rewrites_max": max((run["rewrites"] for run in runs), default=0),
+        "fallback_rate": rate("fallback"),
+        "retrieval_hit_rate": rate("retrieval_hit"),
+        "context_hit_rate": rate("context_hit"),
+        # Mean reciprocal rank of the first labelled chunk in the first retrieval round
+        "mrr": round(sum(1 / run["first_round_hit_rank"] for run in runs if run["first_round_hit_rank"]) / len(runs), 4) if runs else None,
+        "retrieval_hit_rate_by_category": {
+            category: round(sum(run["retrieval_hit"] for run in items) / len(items), 4)
+            for category, items in sorted(by_category.items())
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", default="./docs", help="Documents to index (default: ./docs)")
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="Labelled question set (JSON)")
+    parser.add_argument("--index-dir", help="Reuse this index directory instead of a fresh temporary one")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated latency per LLM call")
+    parser.add_argument("--embedding-size", type=int, default=384)
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the question set this many times")
+    parser.add_argument("--vector-backend", choices=("chroma", "mmap"), default="chroma", help="Vector index to build and search")
+    parser.add_argument("--llm-cache", nargs="*", metavar="ROLE", help="Cache these roles' LLM calls in the index directory")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/graph-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    with open(args.questions, encoding="utf-8") as f:
+        questions = json.load(f)
+    index_directory = args.index_dir or tempfile.mkdtemp(prefix="rag-bench-index-")
+    embedding = HashingEmbedding(size=args.embedding_size)
+    try:
+        builder, vectorstore = build_index(args.docs, index_directory, embedding, args.vector_backend)
+        retrieval_tools = [builder.get_retriever_tool(vectorstore=vectorstore), builder.table_store.as_tool()]
+        web_search_tool = stub_web_search_tool()
+        model_registry = fake_model_registry(args.llm_latency_ms, embedding)
+        llm_caches = {
+            role: SQLiteLLMCache(os.path.join(index_directory, "llm_cache.sqlite"), namespace=role)
+            for role in args.llm_cache or []
+        }
+        model_registry.use_caches(llm_caches)
+        graph = build_graph(
+            retrieval_tools,
+            [web_search_tool],
+            checkpointer=MemorySaver(),
+            model_registry=model_registry,
+            fallback_search_tool=web_search_tool,
+        )
+
+        profiler = GraphProfiler()
+        runs = []
+        started = time.perf_counter()
+        for repeat in range(args.repeat):
+            for question in questions:
+                runs.append(run_question(graph, question, f"bench-{repeat}-{question['id']}", profiler))
+        summary = summarize(runs, profiler, time.perf_counter() - started)
+        if llm_caches:
+            summary["llm_cache"] = {role: cache.stats() for role, cache in llm_caches.items()}
+    finally:
+        if not args.index_dir:
+            shutil.rmtree(index_directory, ignore_errors=True)
+
+    print(json.dumps({key: summary[key] for key in (
+        "questions", "end_to_end", "llm_calls_total", "tokens_total", "rewrites_total",
+        "retrieval_hit_rate", "context_hit_rate", "mrr",
+    )}, indent=2))
+    config = {
+        "docs": args.docs,
+        "questions": args.questions,
+        "llm_latency_ms": args.llm_latency_ms,
+        "llm_cache": args.llm_cache or [],
+        "vector_backend": args.vector_backend,
+        "embedding": embedding.model,
+        "repeat": args.repeat,
+    }
+    return write_results("graph", {"config": config, "summary": summary, "runs": runs}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Measure ingestion throughput: loading and chunking each file, a full index build
+into an empty directory and a no-op rescan, with a deterministic local embedding.
+
+    python -m benchmarks.ingestion_benchmark
+    python -m benchmarks.ingestion_benchmark --embedding-latency-ms 150 --repeat 3
+    python -m benchmarks.ingestion_benchmark --repeat 2 --embedding-cache   # later builds re-use the vectors
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.common import latency_summary, write_results
+from benchmarks.fake_backends import HashingEmbedding
+from embedding_cache import CachedEmbeddings, EmbeddingStore
+from vectorstore_builder_class import VectorstoreBuilder, load_and_split_file
+
+
+def _rate(count, seconds):
+    return round(count / seconds, 3) if seconds else None
+
+
+def profile_files(builder):
+    """
+    Load and chunk every source file in this process, one at a time, without embedding.
+    """
+    files = []
+    for file_path, stat in builder.list_source_files().items():
+        started = time.perf_counter()
+        _, _, doc_splits, error = load_and_split_file(file_path, table_store_path=builder.table_store.db_path)
+        seconds = time.perf_counter() - started
+        chunks = len(doc_splits or [])
+        files.append({
+            "file": os.path.basename(file_path),
+            "bytes": stat.st_size,
+            "chunks": chunks,
+            "load_split_seconds": round(seconds, 4),
+            "chunks_per_sec": _rate(chunks, seconds),
+            "error": error,
+        })
+    return files
+
+
+def full_build(docs_directory, embedding, embedding_store=None):
+    """
+    Index the docs into a fresh directory, then rescan it unchanged. With an
+    `embedding_store` the vectors are looked up there before `embedding` is called.
+    """
+    index_directory = tempfile.mkdtemp(prefix="rag-bench-ingest-")
+    try:
+        if embedding_store is not None:
+            builder_embedding = CachedEmbeddings(embedding, embedding_store)
+        else:
+            builder_embedding = embedding
+        builder = VectorstoreBuilder(pdf_directory=docs_directory, persist_directory=index_directory, embedding=builder_embedding)
+        source_files = builder.list_source_files()
+        calls_before = embedding.calls
+        started = time.perf_counter()
+        builder.build_or_update_vectorstore()
+        build_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        builder.build_or_update_vectorstore()
+        rescan_seconds = time.perf_counter() - started
+        chunks = sum(len(entry["chunk_ids"]) for entry in builder.manifest.files.values())
+        size = sum(stat.st_size for stat in source_files.values())
+        return {
+            "docs": len(source_files),
+            "chunks": chunks,
+            "bytes": size,
+            "build_seconds": round(build_seconds, 4),
+            "rescan_seconds": round(rescan_seconds, 4),
+            "docs_per_sec": _rate(len(source_files), build_seconds),
+            "chunks_per_sec": _rate(chunks, build_seconds),
+            "mb_per_sec": _rate(size / 1_000_000, build_seconds),
+            "embedding_calls": embedding.calls - calls_before,
+        }
+    finally:
+        shutil.rmtree(index_directory, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", default="./docs", help="Documents to index (default: ./docs)")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0.0, help="Simulated latency per embedding batch")
+    parser.add_argument("--embedding-size", type=int, default=384)
+    parser.add_argument("--repeat", type=int, default=1, help="Number of full builds")
+    parser.add_argument("--embedding-cache", action="store_true", help="Share one embedding cache between the builds")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/ingestion-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    embedding = HashingEmbedding(size=args.embedding_size, latency_ms=args.embedding_latency_ms)
+    scratch = tempfile.mkdtemp(prefix="rag-bench-files-")
+    try:
+        files = profile_files(VectorstoreBuilder(pdf_directory=args.docs, persist_directory=scratch, embedding=embedding))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    cache_directory = tempfile.mkdtemp(prefix="rag-bench-embeddings-") if args.embedding_cache else None
+    try:
+        embedding_store = EmbeddingStore(cache_directory) if cache_directory else None
+        builds = [full_build(args.docs, embedding, embedding_store) for _ in range(args.repeat)]
+    finally:
+        if cache_directory:
+            shutil.rmtree(cache_directory, ignore_errors=True)
+
+    load_split_seconds = sum(f["load_split_seconds"] for f in files)
+    chunks = sum(f["chunks"] for f in files)
+    summary = {
+        "docs": len(files),
+        "chunks": chunks,
+        "load_split": {
+            "seconds": round(load_split_seconds, 4),
+            "docs_per_sec": _rate(len(files), load_split_seconds),
+            "chunks_per_sec": _rate(chunks, load_split_seconds),
+        },
+        "build": latency_summary([b["build_seconds"] for b in builds]),
+        "rescan": latency_summary([b["rescan_seconds"] for b in builds]),
+        "docs_per_sec": max(b["docs_per_sec"] or 0 for b in builds),
+        "chunks_per_sec": max(b["chunks_per_sec"] or 0 for b in builds),
+        "mb_per_sec": max(b["mb_per_sec"] or 0 for b in builds),
+    }
+    print(json.dumps(summary, indent=2))
+    config = {
+        "docs": args.docs,
+        "embedding": embedding.model,
+        "embedding_latency_ms": args.embedding_latency_ms,
+        "repeat": args.repeat,
+        "embedding_cache": args.embedding_cache,
+    }
+    return write_results("ingestion", {"config": config, "summary": summary, "files": files, "builds": builds}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import json
+
+import httpx
+from httpx_sse import connect_sse
+
+
+class ChatServiceError(Exception):
+    pass
+
+
+class ChatServiceClient:
+    """
+    Client for chat_service.py, used by the Streamlit app when CHAT_SERVICE_URL is set.
+
+    Args:
+        base_url (str): Where the service (or the load balancer in front of it) listens
+        timeout (float): Connect/read timeout for ordinary requests
+        chat_timeout (float): Read timeout between streamed chat events
+    """
+
+    def __init__(self, base_url, timeout=30.0, chat_timeout=120.0):
+        self.base_url = base_url.rstrip("/")
+        self.chat_timeout = chat_timeout
+        self._client = httpx.Client(base_url=self.base_url, timeout=timeout)
+
+    def _json(self, response):
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get("detail", response.text)
+            except ValueError:
+                detail = response.text
+            raise ChatServiceError(detail)
+        return response.json()
+
+    def health(self):
+        return self._json(self._client.get("/health"))
+
+    def new_thread(self):
+        return self._json(self._client.post("/threads"))["thread_id"]
+
+    def stream_chat(self, message, thread_id):
+        """
+        Yield {"event": ..., "data": ...} for each server-sent event of one chat turn,
+        the same events chat_session.chat_turn() yields in process.
+        """
+        timeout = httpx.Timeout(self._client.timeout.connect, read=self.chat_timeout)
+        with connect_sse(
+            self._client, "POST", "/chat", json={"message": message, "thread_id": thread_id}, timeout=timeout
+        ) as event_source:
+            if event_source.response.status_code >= 400:
+                event_source.response.read()
+                self._json(event_source.response)
+            for sse in event_source.iter_sse():
+                data = json.loads(sse.data) if sse.data else {}
+                if sse.event == "error":
+                    raise ChatServiceError(data.get("detail", "chat failed"))
+                yield {"event": sse.event, "data": data}
+
+    def list_documents(self):
+        return self._json(self._client.get("/documents"))["documents"]
+
+    def upload_document(self, file_name, content, replace=False):
+        """
+        Upload a document; raises ChatServiceError if it exists and `replace` is False.
+        """
+        return self._json(self._client.put(
+            f"/documents/{file_name}", content=content, params={"replace": str(replace).lower()}
+        ))
+
+    def delete_document(self, file_name):
+        return self._json(self._client.delete(f"/documents/{file_name}"))
+
+    def recent_jobs(self, limit=5):
+        return self._json(self._client.get("/jobs", params={"limit": limit}))["jobs"]
@@ -0,0 +1,221 @@
+"""
+Headless HTTP service for the chatbot: owns the compiled graph and the retriever
+and serves chat over Server-Sent Events, document ingestion and health checks.
+
+    python chat_service.py                  # one worker, indexes ./docs itself
+    python chat_service.py --workers 4      # run `python docs_watcher.py` alongside to index
+
+Prometheus metrics are served at /metrics; with several workers they are aggregated
+across processes through PROMETHEUS_MULTIPROC_DIR.
+
+With several workers every process serves from the shared on-disk index and the
+shared SQLite checkpoints, so any worker can continue any thread and the service
+can sit behind a load balancer. Only one process may write the index: with one
+worker that is the service itself, otherwise the docs watcher daemon.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import uuid
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv('../.env')  # Load environment variables from .env file
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+
+import resources
+import telemetry
+from chat_session import achat_turn
+from docs_watcher import is_watched_file
+from index_manifest import IndexManifest
+
+logger = logging.getLogger(__name__)
+resources.configure_telemetry()
+
+
+class ChatRequest(BaseModel):
+    message: str
+    thread_id: Optional[str] = None
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _doc_path(file_name):
+    # Plain file names inside the docs folder only; lock, temp and unsupported files are refused.
+    if os.path.basename(file_name) != file_name or not is_watched_file(file_name):
+        raise HTTPException(status_code=400, detail=f"Unsupported document name: {file_name}")
+    return os.path.join(resources.DOCS_DIRECTORY, file_name)
+
+
+def _job_dict(job):
+    return {
+        "job_id": job.job_id,
+        "action": job.action,
+        "file_name": job.file_name,
+        "status": job.status,
+        "progress": job.progress,
+        "error": job.error,
+        "description": job.describe(),
+    }
+
+
+def _submit(action, file_name):
+    """
+    Queue an ingestion job when this process owns the index; otherwise the docs watcher picks the change up.
+    """
+    if not resources.INDEX_IN_PROCESS:
+        return None
+    return _job_dict(resources.get_ingestion_worker().submit(action, file_name))
+
+
+def _graph():
+    if not resources.INDEX_IN_PROCESS:
+        resources.reload_index_if_changed()
+    return resources.get_graph()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    os.makedirs(resources.DOCS_DIRECTORY, exist_ok=True)
+    # Build the index (when this process owns it), tools and graph before taking traffic.
+    await asyncio.to_thread(_graph)
+    if resources.INDEX_IN_PROCESS and resources.WATCH_DOCS:
+        resources.get_docs_watcher()
+    yield
+
+
+app = FastAPI(title="Multitech Chatbot", lifespan=lifespan)
+
+
+@app.get("/health")
+def health():
+    # A fresh read of the manifest file: reloading the builder's own copy could race with the ingestion worker.
+    files = IndexManifest(resources.get_vectorstore_builder().manifest_path).files
+    return {
+        "status": "ok",
+        "ingestion": "in-process" if resources.INDEX_IN_PROCESS else "external",
+        "index": {"files": len(files), "chunks": sum(len(entry["chunk_ids"]) for entry in files.values())},
+        "ingesting": resources.INDEX_IN_PROCESS and resources.get_ingestion_worker().busy(),
+    }
+
+
+@app.post("/threads")
+def new_thread():
+    """
+    Start a conversation. Threads left idle past their TTL are cleaned up here.
+    """
+    resources.get_checkpoint_store().purge_idle_threads()
+    return {"thread_id": uuid.uuid4().hex}
+
+
+@app.post("/chat")
+async def chat(request: ChatRequest, http_request: Request):
+    """
+    Answer one message as an SSE stream of "token", "reset" and a final "done" (or "error") event.
+    """
+    thread_id = request.thread_id or uuid.uuid4().hex
+    graph = await asyncio.to_thread(_graph)
+
+    async def events():
+        try:
+            async for event in achat_turn(
+                graph,
+                request.message,
+                thread_id,
+                answer_cache=resources.get_answer_cache(),
+                checkpoint_store=resources.get_checkpoint_store(),
+            ):
+                if await http_request.is_disconnected():
+                    logger.info("client disconnected from thread %s", thread_id)
+                    return
+                data = dict(event["data"], thread_id=thread_id) if event["event"] == "done" else event["data"]
+                yield _sse(event["event"], data)
+        except Exception as e:
+            logger.exception("chat turn failed")
+            yield _sse("error", {"detail": str(e), "thread_id": thread_id})
+
+    # No buffering by proxies in front of the service, so tokens arrive as they are generated.
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Node, LLM, retrieval, turn and ingestion metrics in the Prometheus text format.
+    """
+    content, content_type = telemetry.render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@app.get("/documents")
+def list_documents():
+    docs_folder = resources.DOCS_DIRECTORY
+    names = sorted(f for f in os.listdir(docs_folder) if os.path.isfile(os.path.join(docs_folder, f)) and is_watched_file(f))
+    return {"documents": names}
+
+
+@app.put("/documents/{file_name}", status_code=202)
+async def put_document(file_name: str, request: Request, replace: bool = False):
+    """
+    Upload a document as the raw request body and queue it for indexing.
+    """
+    save_path = _doc_path(file_name)
+    exists = await asyncio.to_thread(os.path.exists, save_path)
+    if exists and not replace:
+        raise HTTPException(status_code=409, detail=f"A file named '{file_name}' already exists in the docs folder.")
+    # Written under an ignored temp name and renamed, so the watcher never sees a partial file.
+    # File I/O runs in worker threads so a large upload does not block the event loop.
+    partial_path = save_path + ".part"
+    f = await asyncio.to_thread(open, partial_path, "wb")
+    try:
+        async for chunk in request.stream():
+            await asyncio.to_thread(f.write, chunk)
+    finally:
+        await asyncio.to_thread(f.close)
+    await asyncio.to_thread(os.replace, partial_path, save_path)
+    return {"file_name": file_name, "job": _submit("replace" if exists else "add", file_name)}
+
+
+@app.delete("/documents/{file_name}", status_code=202)
+def delete_document(file_name: str):
+    save_path = _doc_path(file_name)
+    if not os.path.exists(save_path):
+        raise HTTPException(status_code=404, detail=f"No document named '{file_name}'.")
+    os.remove(save_path)
+    return {"file_name": file_name, "job": _submit("delete", file_name)}
+
+
+@app.get("/jobs")
+def list_jobs(limit: int = 20):
+    if not resources.INDEX_IN_PROCESS:
+        return {"jobs": []}
+    return {"jobs": [_job_dict(job) for job in resources.get_ingestion_worker().recent_jobs()[:limit]]}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the chatbot HTTP service.")
+    parser.add_argument("--host", default=resources.CHAT_SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=resources.CHAT_SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=resources.CHAT_SERVICE_WORKERS)
+    args = parser.parse_args()
+    if args.workers > 1 and resources.INDEX_IN_PROCESS:
+        # Workers are separate processes and inherit this; they must not all write the index.
+        os.environ["INDEX_IN_PROCESS"] = "0"
+        logger.warning("several workers: serving read-only, run `python docs_watcher.py` to keep ./docs indexed")
+    if args.workers > 1:
+        # Each worker writes its metric values here so /metrics can report all of them.
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="rag-metrics-"))
+    uvicorn.run("chat_service:app", host=args.host, port=args.port, workers=args.workers)
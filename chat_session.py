@@ -0,0 +1,174 @@
+import asyncio
+import logging
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from answer_cache import collect_sources, reference_sources
+from context_assembler import cited_references
+from retrieval_budget import turn_usage
+
+logger = logging.getLogger(__name__)
+
+# Only these nodes produce answer text; the rewrite node's rephrased question and
+# the grader's structured output must never reach the user.
+ANSWER_NODES = ("agent", "generate", "fallback")
+
+
+class AnswerAccumulator:
+    """
+    Builds the visible answer from LangGraph "messages" stream events.
+
+    Each LLM call starts a new answer, so text the agent streams before
+    handing off to generate is replaced rather than concatenated. An agent call
+    that turns out to be a tool call is discarded.
+    """
+
+    def __init__(self):
+        self.answer = ""
+        self._message_id = None
+        self._is_tool_call = False
+
+    def add(self, chunk, metadata):
+        """
+        Feed one (message_chunk, metadata) event. Returns True if the visible answer changed.
+        """
+        if metadata.get("langgraph_node") not in ANSWER_NODES or not isinstance(chunk, AIMessage):
+            return False
+        if chunk.id != self._message_id:
+            self._message_id = chunk.id
+            self._is_tool_call = False
+            if chunk.content or chunk.tool_calls or getattr(chunk, "tool_call_chunks", None):
+                self.answer = ""
+        if chunk.tool_calls or getattr(chunk, "tool_call_chunks", None):
+            self._is_tool_call = True
+            self.answer = ""
+            return True
+        if self._is_tool_call or not isinstance(chunk.content, str) or not chunk.content:
+            return False
+        self.answer += chunk.content
+        return True
+
+
+def stream_answer(graph, inputs, config):
+    """
+    Run the graph and yield the answer text accumulated so far after every new token.
+    """
+    accumulator = AnswerAccumulator()
+    for chunk, metadata in graph.stream(inputs, config, stream_mode="messages"):
+        if accumulator.add(chunk, metadata):
+            yield accumulator.answer
+
+
+async def astream_answer(graph, inputs, config):
+    """
+    Async version of stream_answer(), driven by graph.astream.
+    """
+    accumulator = AnswerAccumulator()
+    async for chunk, metadata in graph.astream(inputs, config, stream_mode="messages"):
+        if accumulator.add(chunk, metadata):
+            yield accumulator.answer
+
+
+def _deltas(previous, answer):
+    """
+    Events that turn the text already sent into `answer`: a token with the new text,
+    preceded by a reset when the answer was replaced rather than extended.
+    """
+    if answer.startswith(previous):
+        return [{"event": "token", "data": {"text": answer[len(previous):]}}] if len(answer) > len(previous) else []
+    return [{"event": "reset", "data": {}}] + ([{"event": "token", "data": {"text": answer}}] if answer else [])
+
+
+def _finish_turn(prompt, state, answer_cache):
+    messages = state["messages"]
+    answer = messages[-1].content
+    usage = turn_usage(state)
+    logger.info("turn usage: %s", usage)
+    logger.debug("answer: %s", answer)
+    context = state.get("sources") or []
+    references = cited_references(answer, context)
+    if answer_cache is not None:
+        # Every file in the context can shape the answer, so any of them changing invalidates it.
+        answer_cache.store(prompt, answer, collect_sources(messages) + reference_sources(context), references)
+    return {
+        "answer": answer,
+        "cached_question": None,
+        "usage": usage,
+        "sources": references,
+    }
+
+
+def _cached_turn(cached):
+    return {"answer": cached["answer"], "cached_question": cached["question"], "usage": None, "sources": cached["references"]}
+
+
+def chat_turn(graph, prompt, thread_id, answer_cache=None, checkpoint_store=None):
+    """
+    Answer one user message in a checkpointed thread, yielding events as it goes.
+
+    A near-duplicate question is answered from `answer_cache` and recorded in the
+    thread without running the graph. Only a thread's first question uses the
+    cache: a follow-up depends on the conversation before it, so it is neither
+    looked up nor stored. On a cache miss the graph streams and every visible
+    change of the answer yields a "token" event (or "reset" then "token" when an
+    earlier answer was discarded). The turn ends with one "done" event carrying
+    the answer, the cached question (if any), the turn's usage and the references
+    the answer cites.
+
+    Args:
+        graph: The compiled workflow
+        prompt (str): The user's message
+        thread_id (str): Checkpointer thread holding the conversation
+        answer_cache (SemanticAnswerCache): Optional cache consulted before and filled after the graph
+        checkpoint_store (SessionCheckpointStore): Optional store whose thread housekeeping runs after the turn
+
+    Yields:
+        dict: {"event": "token" | "reset" | "done", "data": dict}
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    if answer_cache is not None and graph.get_state(config).values.get("messages"):
+        answer_cache = None
+    cached = answer_cache.lookup(prompt) if answer_cache is not None else None
+    if cached:
+        # Record the cached exchange in the thread so follow-up questions have context.
+        graph.update_state(config, {"messages": [HumanMessage(content=prompt), AIMessage(content=cached["answer"])]}, as_node="generate")
+        result = _cached_turn(cached)
+    else:
+        sent = ""
+        # Earlier turns already live in the checkpointed thread; send only the new prompt.
+        for answer in stream_answer(graph, {"messages": [{"role": "user", "content": prompt}]}, config):
+            yield from _deltas(sent, answer)
+            sent = answer
+        result = _finish_turn(prompt, graph.get_state(config).values, answer_cache)
+        if checkpoint_store is not None:
+            checkpoint_store.prune_thread(thread_id)
+    if checkpoint_store is not None:
+        checkpoint_store.touch(thread_id)
+    yield {"event": "done", "data": result}
+
+
+async def achat_turn(graph, prompt, thread_id, answer_cache=None, checkpoint_store=None):
+    """
+    Async version of chat_turn(), driven by graph.astream. Cache and checkpoint
+    housekeeping run in worker threads so they do not block the event loop.
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    if answer_cache is not None and (await graph.aget_state(config)).values.get("messages"):
+        answer_cache = None
+    cached = await asyncio.to_thread(answer_cache.lookup, prompt) if answer_cache is not None else None
+    if cached:
+        await graph.aupdate_state(config, {"messages": [HumanMessage(content=prompt), AIMessage(content=cached["answer"])]}, as_node="generate")
+        result = _cached_turn(cached)
+    else:
+        sent = ""
+        async for answer in astream_answer(graph, {"messages": [{"role": "user", "content": prompt}]}, config):
+            for event in _deltas(sent, answer):
+                yield event
+            sent = answer
+        state = (await graph.aget_state(config)).values
+        result = await asyncio.to_thread(_finish_turn, prompt, state, answer_cache)
+        if checkpoint_store is not None:
+            await asyncio.to_thread(checkpoint_store.prune_thread, thread_id)
+    if checkpoint_store is not None:
+        await asyncio.to_thread(checkpoint_store.touch, thread_id)
+    yield {"event": "done", "data": result}
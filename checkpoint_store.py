@@ -0,0 +1,95 @@
+import asyncio
+import sqlite3
+import time
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+
+class ThreadedSqliteSaver(SqliteSaver):
+    """
+    SqliteSaver whose async methods run the sync ones in a worker thread.
+
+    The stock SqliteSaver only supports the sync API; this lets one compiled graph
+    be driven by both graph.stream and graph.astream over the same connection.
+    """
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+
+class SessionCheckpointStore:
+    """
+    SQLite-backed LangGraph checkpointer with per-thread housekeeping.
+
+    Every chat session gets its own thread ID. Only the newest `keep_checkpoints`
+    checkpoints of a thread are retained after each turn, and threads idle for
+    longer than `idle_ttl_seconds` are deleted outright.
+    """
+
+    def __init__(self, db_path, idle_ttl_seconds=24 * 3600, keep_checkpoints=2):
+        self.db_path = db_path
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.keep_checkpoints = keep_checkpoints
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.saver = ThreadedSqliteSaver(self.conn)
+        self.saver.setup()
+        with self.saver.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS thread_activity (thread_id TEXT PRIMARY KEY, last_seen REAL NOT NULL)"
+            )
+
+    def touch(self, thread_id):
+        with self.saver.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO thread_activity (thread_id, last_seen) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (thread_id, time.time()),
+            )
+
+    def prune_thread(self, thread_id):
+        """
+        Drop all but the newest checkpoints of a thread; checkpoint IDs sort by creation time.
+        """
+        with self.saver.lock, self.conn:
+            old = self.conn.execute(
+                "SELECT checkpoint_ns, checkpoint_id FROM checkpoints WHERE thread_id = ? "
+                "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+                (thread_id, self.keep_checkpoints),
+            ).fetchall()
+            for table in ("checkpoints", "writes"):
+                self.conn.executemany(
+                    f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    [(thread_id, ns, checkpoint_id) for ns, checkpoint_id in old],
+                )
+
+    def delete_thread(self, thread_id):
+        with self.saver.lock, self.conn:
+            for table in ("checkpoints", "writes", "thread_activity"):
+                self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def purge_idle_threads(self):
+        """
+        Delete every thread not used within idle_ttl_seconds. Returns the purged thread IDs.
+        """
+        cutoff = time.time() - self.idle_ttl_seconds
+        with self.saver.lock:
+            rows = self.conn.execute(
+                "SELECT thread_id FROM thread_activity WHERE last_seen < ?", (cutoff,)
+            ).fetchall()
+        thread_ids = [row[0] for row in rows]
+        for thread_id in thread_ids:
+            self.delete_thread(thread_id)
+        return thread_ids
@@ -0,0 +1,303 @@
+import logging
+import re
+
+from embedding_pipeline import estimate_tokens
+from lexical_index import tokenize
+
+# "[Source: manual.pdf | pages 21-23 | GENERAL AT COMMANDS > AT+FOTA | chunk 12]"
+SOURCE_HEADER_PATTERN = re.compile(r"^\[Source: ([^\]|]+?)((?: \| [^\]|]+)*)\]\n?")
+WEB_HEADER_PATTERN = re.compile(r"^\[Web source: ([^\]]+)\]\n?")
+PAGES_FIELD = re.compile(r"^pages? (\d+)(?:-(\d+))?$")
+ROWS_FIELD = re.compile(r"^(.+) rows (\d+)-(\d+)$")
+CHUNK_FIELD = re.compile(r"^chunk (\d+)$")
+CITATION_PATTERN = re.compile(r"\[(\d+)\]")
+
+logger = logging.getLogger(__name__)
+
+
+def _field(text):
+    # Header fields are separated by " | " and closed by "]", so neither may appear inside one.
+    return str(text).replace("|", "/").replace("[", "(").replace("]", ")").strip()
+
+
+def source_header(metadata):
+    """
+    Chunk header for a retrieved document, carrying its citation metadata.
+
+    The file name comes first so "[Source: file" stays parseable by the grader
+    and the answer cache; pages (PDF/text) or sheet rows (spreadsheets), the
+    section path and the chunk's position in the file follow as " | " fields.
+    """
+    fields = [_field(metadata.get("source", "unknown"))]
+    if metadata.get("page_start"):
+        start, end = metadata["page_start"], metadata.get("page_end", metadata["page_start"])
+        fields.append(f"page {start}" if start == end else f"pages {start}-{end}")
+    elif metadata.get("row_start"):
+        fields.append(f"{_field(metadata.get('sheet', 'sheet'))} rows {metadata['row_start']}-{metadata['row_end']}")
+    if metadata.get("section_path"):
+        fields.append(_field(metadata["section_path"]))
+    if metadata.get("chunk_index") is not None:
+        fields.append(f"chunk {metadata['chunk_index']}")
+    return "[Source: " + " | ".join(fields) + "]"
+
+
+def format_documents(docs):
+    """
+    Render retrieved documents as the retriever tool's text output, one headed chunk per document.
+    """
+    return "\n\n".join(source_header(doc.metadata) + "\n" + doc.page_content for doc in docs)
+
+
+class ContextChunk:
+    """
+    One retrieved chunk with the citation metadata parsed from its header.
+    """
+
+    def __init__(self, text, source, web=False, page_start=None, page_end=None, sheet=None,
+                 row_start=None, row_end=None, section=None, chunk_index=None):
+        self.text = text
+        self.source = source
+        self.web = web
+        self.page_start = page_start
+        self.page_end = page_end
+        self.sheet = sheet
+        self.row_start = row_start
+        self.row_end = row_end
+        self.section = section
+        self.chunk_index = chunk_index
+        self.terms = set(tokenize(text))
+        self.tokens = estimate_tokens(text)
+
+    @classmethod
+    def parse(cls, chunk):
+        """
+        Parse a "[Source: ...]" or "[Web source: url]" headed chunk. Other chunks (spreadsheet
+        lookup rows) are kept whole, with their first bracketed label as the source.
+        """
+        match = WEB_HEADER_PATTERN.match(chunk)
+        if match:
+            return cls(chunk[match.end():].strip(), match.group(1), web=True)
+        match = SOURCE_HEADER_PATTERN.match(chunk)
+        if not match:
+            label = re.match(r"^\[([^\]]+)\]", chunk)
+            return cls(chunk, label.group(1) if label else "unknown")
+        kwargs = {}
+        for field in filter(None, match.group(2).split(" | ")):
+            pages, rows, index = PAGES_FIELD.match(field), ROWS_FIELD.match(field), CHUNK_FIELD.match(field)
+            if pages:
+                kwargs["page_start"] = int(pages.group(1))
+                kwargs["page_end"] = int(pages.group(2) or pages.group(1))
+            elif rows:
+                kwargs.update(sheet=rows.group(1), row_start=int(rows.group(2)), row_end=int(rows.group(3)))
+            elif index:
+                kwargs["chunk_index"] = int(index.group(1))
+            else:
+                kwargs["section"] = field
+        return cls(chunk[match.end():].strip(), match.group(1), **kwargs)
+
+    def follows(self, other):
+        """
+        True if this chunk continues `other` directly in the same file.
+        """
+        if self.web or other.web or self.source != other.source:
+            return False
+        if self.chunk_index is not None and other.chunk_index is not None:
+            return self.chunk_index == other.chunk_index + 1
+        if self.row_start is not None and other.row_end is not None:
+            return self.sheet == other.sheet and self.row_start == other.row_end + 1
+        return False
+
+    def similarity(self, other):
+        """
+        Jaccard overlap of the two chunks' terms.
+        """
+        if not self.terms or not other.terms:
+            return 0.0
+        return len(self.terms & other.terms) / len(self.terms | other.terms)
+
+
+class Reference:
+    """
+    A numbered, citable block of the assembled context: one source with its page or row span.
+    """
+
+    def __init__(self, number, source, web=False, page_start=None, page_end=None, sheet=None,
+                 row_start=None, row_end=None, section=None, text=""):
+        self.number = number
+        self.source = source
+        self.web = web
+        self.page_start = page_start
+        self.page_end = page_end
+        self.sheet = sheet
+        self.row_start = row_start
+        self.row_end = row_end
+        self.section = section
+        self.text = text
+
+    @classmethod
+    def from_chunks(cls, number, chunks):
+        first, last = chunks[0], chunks[-1]
+        return cls(
+            number,
+            first.source,
+            web=first.web,
+            page_start=min((c.page_start for c in chunks if c.page_start), default=None),
+            page_end=max((c.page_end for c in chunks if c.page_end), default=None),
+            sheet=first.sheet,
+            row_start=first.row_start,
+            row_end=last.row_end,
+            section=first.section,
+            text="\n\n".join(chunk.text for chunk in chunks),
+        )
+
+    def location(self):
+        if self.page_start:
+            return f"p. {self.page_start}" if self.page_start == self.page_end else f"pp. {self.page_start}-{self.page_end}"
+        if self.row_start:
+            return f"{self.sheet}, rows {self.row_start}-{self.row_end}"
+        return ""
+
+    def label(self):
+        """
+        "[2] manual.pdf, pp. 21-23, GENERAL AT COMMANDS > AT+FOTA"
+        """
+        parts = [self.source] + [part for part in (self.location(), self.section) if part]
+        return f"[{self.number}] " + ", ".join(parts)
+
+    def to_dict(self):
+        return {
+            "number": self.number,
+            "source": self.source,
+            "web": self.web,
+            "page_start": self.page_start,
+            "page_end": self.page_end,
+            "sheet": self.sheet,
+            "row_start": self.row_start,
+            "row_end": self.row_end,
+            "section": self.section,
+        }
+
+
+def cited_references(answer, references):
+    """
+    The references whose "[n]" markers appear in the answer, or all of them if it cites none.
+    """
+    cited = {int(n) for n in CITATION_PATTERN.findall(answer or "")}
+    selected = [ref for ref in references if ref["number"] in cited]
+    return selected or list(references)
+
+
+def format_references(references):
+    """
+    One line per reference, for display under an answer.
+    """
+    return "\n".join(Reference(**ref).label() for ref in references)
+
+
+class ContextAssembler:
+    """
+    Turns the graded retrieval chunks into the generator's context.
+
+    1. Chunks are taken in retrieval order and selected by maximal marginal
+       relevance, with term-set overlap as the similarity: a chunk that repeats
+       one already selected (overlap >= `duplicate_threshold`) is dropped, and
+       near-duplicates are pushed behind chunks that add new information.
+    2. Selection stops adding chunks once `max_tokens` is used, so the prompt
+       stays within a known budget however many tools returned results.
+    3. Selected chunks that are consecutive in the same file (by chunk index,
+       or by spreadsheet row) are merged back into one block.
+    4. Each block is numbered and labelled with its file, pages or rows and
+       section from the chunk metadata, so the model cites "[n]" and the
+       displayed sources come from the index rather than from the model.
+
+    Args:
+        max_tokens (int): Token budget for the chunk text in the context
+        mmr_lambda (float): Weight of retrieval rank against novelty, 1.0 = rank only
+        duplicate_threshold (float): Term overlap at which a chunk counts as a duplicate
+    """
+
+    def __init__(self, max_tokens=3000, mmr_lambda=0.7, duplicate_threshold=0.8):
+        self.max_tokens = max_tokens
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+
+    def _select(self, candidates):
+        # Relevance decays with the retrieval rank each tool reported.
+        relevance = {id(chunk): 1.0 / (1 + rank) for rank, chunk in candidates}
+        remaining = [chunk for _, chunk in candidates]
+        selected, used = [], 0
+        while remaining:
+            scored = []
+            for chunk in remaining:
+                overlap = max((chunk.similarity(s) for s in selected), default=0.0)
+                scored.append((self.mmr_lambda * relevance[id(chunk)] - (1 - self.mmr_lambda) * overlap, overlap, chunk))
+            _, overlap, best = max(scored, key=lambda item: item[0])
+            remaining.remove(best)
+            if overlap >= self.duplicate_threshold:
+                continue
+            if used + best.tokens > self.max_tokens:
+                # Too big for what is left of the budget; a smaller chunk may still fit.
+                continue
+            selected.append(best)
+            used += best.tokens
+        return selected
+
+    @staticmethod
+    def _merge(selected):
+        """
+        Group selected chunks into blocks of consecutive chunks from the same file,
+        ordered by the best-ranked chunk in each block.
+        """
+        blocks = []
+        for chunk in selected:
+            for block in blocks:
+                if chunk.follows(block[-1]):
+                    block.append(chunk)
+                    break
+                if block[0].follows(chunk):
+                    block.insert(0, chunk)
+                    break
+            else:
+                blocks.append([chunk])
+        # A chunk can bridge two blocks that were selected before it.
+        merged = True
+        while merged:
+            merged = False
+            for a in blocks:
+                for b in blocks:
+                    if a is not b and b[0].follows(a[-1]):
+                        a.extend(b)
+                        blocks.remove(b)
+                        merged = True
+                        break
+                if merged:
+                    break
+        return blocks
+
+    def assemble(self, results):
+        """
+        Build the context text and its references from headed chunks.
+
+        Args:
+            results (list[list[str]]): The chunks of each tool result, in that tool's rank order
+
+        Returns:
+            tuple: (context text, list of reference dicts)
+        """
+        # Rank within each tool's result, so the top chunk of every tool starts level.
+        candidates = [(rank, ContextChunk.parse(chunk)) for chunks in results for rank, chunk in enumerate(chunks)]
+        blocks = self._merge(self._select(candidates))
+        # Number internal blocks before web ones, matching the order they appear in the context.
+        blocks.sort(key=lambda block: block[0].web)
+
+        references = [Reference.from_chunks(number, block) for number, block in enumerate(blocks, start=1)]
+        internal = [ref for ref in references if not ref.web]
+        web = [ref for ref in references if ref.web]
+        sections = []
+        if internal:
+            sections.append("Internal documents:\n\n" + "\n\n".join(f"{ref.label()}\n{ref.text}" for ref in internal))
+        if web:
+            sections.append("Web search results:\n\n" + "\n\n".join(f"{ref.label()}\n{ref.text}" for ref in web))
+        logger.debug("context assembled: %d chunks -> %d blocks", len(candidates), len(references))
+        return "\n\n".join(sections), [ref.to_dict() for ref in references]
+
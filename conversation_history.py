@@ -0,0 +1,81 @@
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+
+def latest_question(messages):
+    """
+    The user's question for the current turn: the most recent HumanMessage.
+    """
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message.content
+    return messages[0].content if messages else ""
+
+
+def latest_tool_messages(messages):
+    """
+    The ToolMessages answering the most recent round of tool calls, in call order.
+    """
+    results = []
+    for message in reversed(messages):
+        if not isinstance(message, ToolMessage):
+            break
+        results.append(message)
+    return results[::-1]
+
+
+def split_turns(messages):
+    """
+    Group messages into turns, each starting at a HumanMessage.
+    """
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+class HistoryTrimmer:
+    """
+    Keeps the checkpointed conversation within a token budget before the agent runs.
+
+    Earlier turns are compacted to the user's question and the final answer
+    (retrieved documents, tool calls and rewritten questions are dropped), then
+    the oldest turns are removed until the history fits in `max_tokens`. The
+    current turn is always kept in full.
+    """
+
+    def __init__(self, max_tokens=4000):
+        self.max_tokens = max_tokens
+
+    def _compact(self, turn):
+        kept = [turn[0]]
+        final = turn[-1]
+        if len(turn) > 1 and isinstance(final, AIMessage) and not final.tool_calls:
+            kept.append(final)
+        return kept
+
+    def trim_history(self, state):
+        """
+        Graph node: remove old messages from state so neither the checkpoint nor the prompt grows without bound.
+
+        Args:
+            state (messages): The current state
+
+        Returns:
+            dict: RemoveMessage updates for the dropped messages
+        """
+        messages = state["messages"]
+        turns = split_turns(messages)
+        if len(turns) <= 1:
+            return {"messages": []}
+
+        current = turns[-1]
+        history = [self._compact(turn) for turn in turns[:-1]]
+        budget = self.max_tokens - count_tokens_approximately(current)
+        while history and count_tokens_approximately([m for turn in history for m in turn]) > budget:
+            history.pop(0)
+
+        kept_ids = {m.id for turn in history for m in turn} | {m.id for m in current}
+        return {"messages": [RemoveMessage(id=m.id) for m in messages if m.id not in kept_ids]}
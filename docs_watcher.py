@@ -0,0 +1,191 @@
+import fnmatch
+import logging
+import os
+import threading
+import time
+
+from vectorstore_builder_class import SUPPORTED_EXTENSIONS
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is optional; fall back to polling the directory
+    FileSystemEventHandler = object
+    Observer = None
+
+logger = logging.getLogger(__name__)
+
+# Editor and office lock/temp files that appear next to documents while they are open.
+IGNORED_PATTERNS = (".~lock.*#", "~$*", ".*", "*.tmp", "*.swp", "*.part", "*.crdownload")
+
+
+def is_watched_file(file_name):
+    if any(fnmatch.fnmatch(file_name, pattern) for pattern in IGNORED_PATTERNS):
+        return False
+    return file_name.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def snapshot(directory):
+    """
+    {file_name: (mtime_ns, size)} for every watched file directly inside `directory`.
+    """
+    files = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and is_watched_file(entry.name):
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        pass
+    return files
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        for path in (getattr(event, "src_path", None), getattr(event, "dest_path", None)):
+            if path:
+                self.watcher.notify(os.path.basename(path))
+
+
+class DocsWatcher:
+    """
+    Watches the docs directory and reports changed files once a burst of changes settles.
+
+    Uses inotify/FSEvents through watchdog when it is installed, otherwise polls
+    the directory every `poll_interval` seconds. Events only mark a file name as
+    dirty; `debounce_seconds` after the last event the directory is compared with
+    the previous snapshot and `on_changes({file_name: "add"|"replace"|"delete"})`
+    is called with just the files whose mtime or size actually changed. Lock and
+    temp files and unsupported extensions are ignored.
+
+    Args:
+        docs_directory (str): Directory to watch (not recursive, like the indexer)
+        on_changes (callable): Receives a dict of changed file names to actions
+        debounce_seconds (float): Quiet period before a burst of changes is reported
+        poll_interval (float): Scan interval when watchdog is unavailable
+        use_watchdog (bool): Set False to force polling
+    """
+
+    def __init__(self, docs_directory, on_changes, debounce_seconds=2.0, poll_interval=2.0, use_watchdog=True):
+        self.docs_directory = docs_directory
+        self.on_changes = on_changes
+        self.debounce_seconds = debounce_seconds
+        self.poll_interval = poll_interval
+        self.use_watchdog = use_watchdog and Observer is not None
+        self._known = snapshot(docs_directory)
+        self._dirty = set()
+        self._last_event = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._observer = None
+        self._thread = None
+
+    def notify(self, file_name):
+        if not is_watched_file(file_name):
+            return
+        with self._lock:
+            self._dirty.add(file_name)
+            self._last_event = time.monotonic()
+
+    def _poll(self):
+        current = snapshot(self.docs_directory)
+        with self._lock:
+            changed = {name for name in current.keys() | self._known.keys() if current.get(name) != self._known.get(name)}
+            if changed - self._dirty:
+                self._dirty |= changed
+                self._last_event = time.monotonic()
+
+    def flush(self):
+        """
+        Report the dirty files now, without waiting for the debounce period.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            self._last_event = None
+        if not dirty:
+            return {}
+        current = snapshot(self.docs_directory)
+        changes = {}
+        for name in sorted(dirty):
+            before, after = self._known.get(name), current.get(name)
+            if before == after:
+                continue
+            changes[name] = "delete" if after is None else ("add" if before is None else "replace")
+        for name in dirty:
+            if name in current:
+                self._known[name] = current[name]
+            else:
+                self._known.pop(name, None)
+        if changes:
+            logger.info("docs changed: %s", changes)
+            self.on_changes(changes)
+        return changes
+
+    def _run(self):
+        tick = min(self.poll_interval, self.debounce_seconds / 2)
+        next_poll = 0.0
+        while not self._stop.wait(tick):
+            if not self.use_watchdog and time.monotonic() >= next_poll:
+                self._poll()
+                next_poll = time.monotonic() + self.poll_interval
+            with self._lock:
+                settled = self._last_event is not None and time.monotonic() - self._last_event >= self.debounce_seconds
+            if settled:
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.warning("docs watcher failed to report changes: %s", e)
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        os.makedirs(self.docs_directory, exist_ok=True)
+        if self.use_watchdog:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), self.docs_directory, recursive=False)
+            self._observer.daemon = True
+            self._observer.start()
+        self._thread = threading.Thread(target=self._run, name="docs-watcher", daemon=True)
+        self._thread.start()
+        logger.info("watching %s (%s)", self.docs_directory, "watchdog" if self.use_watchdog else "polling")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def submit_changes(ingestion_worker):
+    """
+    on_changes callback that queues one ingestion job per changed file.
+    """
+    def on_changes(changes):
+        for file_name, action in changes.items():
+            ingestion_worker.submit(action, file_name)
+
+    return on_changes
+
+
+if __name__ == "__main__":
+    import resources
+
+    # Standalone daemon: bring the index up to date once, then follow ./docs.
+    resources.configure_telemetry()
+    resources.ensure_index_current()
+    watcher = resources.get_docs_watcher()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        watcher.stop()
@@ -0,0 +1,230 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import telemetry
+
+# SQLite allows at most 999 bound parameters per statement in older builds.
+LOOKUP_BATCH = 500
+
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Content-addressed store of embedding vectors, keyed by (embedding model, SHA-256 of the text).
+
+    Each model's vectors are rows of one float16 matrix in a flat file that is
+    read through a memory map, so a large store costs little memory and its pages
+    are shared between processes. A SQLite index maps each key to its row. Rows
+    are only ever appended; a writer reserves them inside a SQLite write
+    transaction, so several processes can fill the same store.
+
+    Args:
+        directory (str): Folder holding index.sqlite and one <model>.f16 file per model
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.db_path = os.path.join(directory, "index.sqlite")
+        self._lock = threading.Lock()
+        self._matrices = {}
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS models (model TEXT PRIMARY KEY, dim INTEGER, rows INTEGER)")
+            conn.execute("CREATE TABLE IF NOT EXISTS vectors (model TEXT, sha TEXT, row INTEGER, PRIMARY KEY (model, sha))")
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit mode, so put() can take the write lock up front with BEGIN IMMEDIATE.
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _stored_keys(conn, model, keys):
+        stored = set()
+        for i in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[i:i + LOOKUP_BATCH]
+            stored.update(sha for (sha,) in conn.execute(
+                f"SELECT sha FROM vectors WHERE model = ? AND sha IN ({','.join('?' * len(batch))})",
+                [model, *batch],
+            ))
+        return stored
+
+    def _matrix_path(self, model):
+        return os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]+", "_", model) + ".f16")
+
+    def _matrix(self, model, dim, rows_needed):
+        """
+        Read-only memory map of the model's matrix, reopened once another writer has grown it past `rows_needed`.
+        """
+        with self._lock:
+            matrix = self._matrices.get(model)
+            if matrix is None or matrix.shape[0] < rows_needed:
+                path = self._matrix_path(model)
+                rows = os.path.getsize(path) // (dim * 2)
+                matrix = np.memmap(path, dtype=np.float16, mode="r", shape=(rows, dim))
+                self._matrices[model] = matrix
+            return matrix
+
+    def get(self, model, keys):
+        """
+        {key: float32 vector} for the keys stored for `model`.
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        with self._connect() as conn:
+            info = conn.execute("SELECT dim FROM models WHERE model = ?", (model,)).fetchone()
+            if info is None:
+                return {}
+            rows = []
+            for i in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[i:i + LOOKUP_BATCH]
+                rows += conn.execute(
+                    f"SELECT sha, row FROM vectors WHERE model = ? AND sha IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                ).fetchall()
+        if not rows:
+            return {}
+        matrix = self._matrix(model, info[0], max(row for _, row in rows) + 1)
+        return {sha: np.asarray(matrix[row], dtype=np.float32) for sha, row in rows}
+
+    def put(self, model, vectors):
+        """
+        Store {key: vector} for `model`, skipping keys already present.
+        """
+        if not vectors:
+            return
+        dim = len(next(iter(vectors.values())))
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                info = conn.execute("SELECT dim, rows FROM models WHERE model = ?", (model,)).fetchone()
+                if info is not None and info[0] != dim:
+                    raise ValueError(f"{model} vectors have {info[0]} dimensions, got {dim}")
+                rows = info[1] if info else 0
+                stored = self._stored_keys(conn, model, list(vectors))
+                new_keys = [key for key in vectors if key not in stored]
+                if new_keys:
+                    block = np.asarray([vectors[key] for key in new_keys], dtype=np.float16)
+                    path = self._matrix_path(model)
+                    # Rows past the recorded count are leftovers of an interrupted write and are overwritten.
+                    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                        f.seek(rows * dim * 2)
+                        f.write(block.tobytes())
+                        f.flush()
+                        os.fsync(f.fileno())
+                    conn.executemany(
+                        "INSERT INTO vectors (model, sha, row) VALUES (?, ?, ?)",
+                        [(model, key, rows + i) for i, key in enumerate(new_keys)],
+                    )
+                    conn.execute(
+                        "INSERT OR REPLACE INTO models (model, dim, rows) VALUES (?, ?, ?)", (model, dim, rows + len(new_keys))
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def missing(self, model, keys):
+        """
+        The keys not yet stored for `model`, in their original order.
+        """
+        keys = list(keys)
+        with self._connect() as conn:
+            stored = self._stored_keys(conn, model, keys)
+        return [key for key in keys if key not in stored]
+
+    def count(self, model=None):
+        with self._connect() as conn:
+            if model is None:
+                return conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+            return conn.execute("SELECT COUNT(*) FROM vectors WHERE model = ?", (model,)).fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings that consult an EmbeddingStore before calling the wrapped provider.
+
+    Only texts never embedded with this model before reach the provider, so
+    re-chunking, rebuilding the collection or re-indexing an unchanged file costs
+    no embedding calls. Query vectors are never written to the store, whose
+    rows are append-only and would grow with every distinct question; the most
+    recent `max_queries` are kept in a per-process LRU instead, which covers the
+    same question being embedded by the answer cache and the retriever.
+
+    Args:
+        embedding (Embeddings): The provider's embeddings
+        store (EmbeddingStore): Where document vectors are kept
+        model (str): Model name the vectors are stored under; defaults to the wrapped model's name
+        max_queries (int): Query vectors kept in memory
+    """
+
+    def __init__(self, embedding, store, model=None, max_queries=1024):
+        self.embedding = embedding
+        self.store = store
+        self.model = model or getattr(embedding, "model", None) or type(embedding).__name__
+        self.max_queries = max_queries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._queries = OrderedDict()
+
+    def _count(self, kind, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        if hits:
+            telemetry.EMBEDDING_CACHE_REQUESTS.labels(kind, "hit").inc(hits)
+        if misses:
+            telemetry.EMBEDDING_CACHE_REQUESTS.labels(kind, "miss").inc(misses)
+
+    def uncached(self, texts):
+        """
+        The texts that embed_documents() would send to the provider.
+        """
+        texts = list(texts)
+        keys = [text_key(text) for text in texts]
+        missing = set(self.store.missing(self.model, keys))
+        return [text for key, text in zip(keys, texts) if key in missing]
+
+    def embed_documents(self, texts):
+        keys = [text_key(text) for text in texts]
+        vectors = self.store.get(self.model, set(keys))
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                pending.setdefault(key, text)
+        if pending:
+            fresh = dict(zip(pending, self.embedding.embed_documents(list(pending.values()))))
+            self.store.put(self.model, fresh)
+            vectors.update(fresh)
+        self._count("document", len(texts) - len(pending), len(pending))
+        return [[float(x) for x in vectors[key]] for key in keys]
+
+    def embed_query(self, text):
+        with self._lock:
+            vector = self._queries.get(text)
+            if vector is not None:
+                self._queries.move_to_end(text)
+        self._count("query", int(vector is not None), int(vector is None))
+        if vector is None:
+            vector = [float(x) for x in self.embedding.embed_query(text)]
+            with self._lock:
+                self._queries[text] = vector
+                while len(self._queries) > self.max_queries:
+                    self._queries.popitem(last=False)
+        return list(vector)
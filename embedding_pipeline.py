@@ -0,0 +1,140 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    """
+    Rough token estimate (~4 characters per token) used for rate limiting.
+    """
+    return max(1, len(text) // 4)
+
+
+class TokenRateLimiter:
+    """
+    Sliding one-minute window that blocks callers until their tokens fit under
+    the provider's tokens-per-minute limit.
+    """
+
+    def __init__(self, tokens_per_minute):
+        self.tokens_per_minute = tokens_per_minute
+        self._window = deque()
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens):
+        if not self.tokens_per_minute:
+            return
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._window and now - self._window[0][0] >= 60:
+                    self._used -= self._window.popleft()[1]
+                if self._used + tokens <= self.tokens_per_minute:
+                    self._window.append((now, tokens))
+                    self._used += tokens
+                    return
+                wait = 60 - (now - self._window[0][0])
+            time.sleep(max(wait, 0.05))
+
+
+class EmbeddingPipeline:
+    """
+    Embed chunks in fixed-size batches on a bounded thread pool and checkpoint
+    every finished batch into the vector collection.
+
+    Chunk IDs are deterministic, so after a crash the next run asks the store
+    which IDs already exist and only embeds what is missing.
+
+    Args:
+        embedding: Any LangChain Embeddings object
+        upsert_fn (callable): upsert_fn(ids, texts, metadatas, embeddings) writes one batch
+        existing_ids_fn (callable): existing_ids_fn(ids) returns the subset already stored
+        batch_size (int): Chunks per embedding request
+        max_workers (int): Concurrent embedding requests
+        tokens_per_minute (int): Provider token budget; 0 disables limiting
+        max_retries (int): Attempts per batch before the run fails
+        progress_callback (callable): progress_callback(done, total, elapsed_seconds)
+    """
+
+    def __init__(
+        self,
+        embedding,
+        upsert_fn,
+        existing_ids_fn,
+        batch_size=64,
+        max_workers=4,
+        tokens_per_minute=1_000_000,
+        max_retries=5,
+        progress_callback=None,
+    ):
+        self.embedding = embedding
+        self.upsert_fn = upsert_fn
+        self.existing_ids_fn = existing_ids_fn
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.rate_limiter = TokenRateLimiter(tokens_per_minute)
+        self.max_retries = max_retries
+        self.progress_callback = progress_callback
+        self._write_lock = threading.Lock()
+
+    def _embed_with_retry(self, texts):
+        # Texts a CachedEmbeddings already holds never reach the provider, so they cost no quota.
+        uncached = self.embedding.uncached(texts) if hasattr(self.embedding, "uncached") else texts
+        if uncached:
+            self.rate_limiter.acquire(sum(estimate_tokens(t) for t in uncached))
+        for attempt in range(self.max_retries):
+            try:
+                return self.embedding.embed_documents(texts)
+            except Exception as error:
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = min(2 ** attempt, 30) + random.uniform(0, 1)
+                logger.warning("embedding batch failed (%s); retrying in %.1fs", error, delay)
+                time.sleep(delay)
+
+    def _process_batch(self, batch):
+        ids = [chunk_id for chunk_id, _ in batch]
+        texts = [doc.page_content for _, doc in batch]
+        metadatas = [doc.metadata for _, doc in batch]
+        embeddings = self._embed_with_retry(texts)
+        with self._write_lock:
+            self.upsert_fn(ids, texts, metadatas, embeddings)
+        return len(batch)
+
+    def run(self, documents, ids):
+        """
+        Embed and store `documents` under `ids`, skipping IDs already in the store.
+
+        Returns:
+            int: Number of chunks embedded in this run
+        """
+        existing = set(self.existing_ids_fn(ids)) if ids else set()
+        pending = [(chunk_id, doc) for chunk_id, doc in zip(ids, documents) if chunk_id not in existing]
+        total = len(ids)
+        done = total - len(pending)
+        if existing:
+            logger.info("resuming: %d of %d chunks already stored", len(existing), total)
+        if not pending:
+            return 0
+
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), self.batch_size)]
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._process_batch, batch) for batch in batches]
+            try:
+                for future in as_completed(futures):
+                    done += future.result()
+                    if self.progress_callback:
+                        self.progress_callback(done, total, time.monotonic() - start)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        return len(pending)
@@ -1,42 +1,82 @@
-from langchain_openai import ChatOpenAI
+import logging
+
 from langchain_core.prompts import PromptTemplate
+from context_assembler import ContextAssembler
+from conversation_history import latest_question, latest_tool_messages
+from grade_document_edges import NO_RELEVANT_DOCUMENTS, split_chunks
+from model_registry import get_default_registry
+from retrieval_budget import token_usage
 
-class GenerateAgent:
-    def __init__(self):
-        pass
+logger = logging.getLogger(__name__)
 
-    def generate(self, state):
-        """
-        Generate answer
-
-        Args:
-            state (messages): The current state
-
-        Returns:
-             dict: The updated state with re-phrased question
-        """
-        print('BT - generate called...')
-        print("---GENERATE---")
-        messages = state["messages"]
-        question = messages[0].content
-        last_message = messages[-1]
-        docs = last_message.content
 
+class GenerateAgent:
+    def __init__(self, model=None, context_assembler=None):
+        model = model or get_default_registry().get_chat_model("generate")
+        self.context_assembler = context_assembler or ContextAssembler()
         prompt = PromptTemplate(
             template="""You are a helpful assistant for question-answering tasks. Use the following instructions to respond accurately and reliably:
                 1. First, use only the retrieved internal context below to answer the question. If not enough information, use the Tavily web search tool to find an appropriate answer.
                 2. Do **not** mix information from different sources. Clearly state whether your answer is based on internal documents or external web results.
                 3. Clearly distinguish between the Multitech Dot and the Conduit/Multitech Gateway — do not confuse or substitute one for the other under any circumstances.
                 4. Provide a complete, step-by-step instruction when applicable, and include any screenshots, links, or examples exactly as they appear in the context or search results.
-                5. Always cite the source of the information (e.g., document name or URL).
+                5. Each context block starts with a numbered label such as "[1] file.pdf, pp. 3-4, Section". Cite the blocks you use by their number, e.g. [1], and never invent a source, page or URL.
                 6. If no relevant information is found from either internal documents or web search, respond with: \"I don’t know.\"
                 Question: {question}
                 Context: {context}
                 Answer:""",
             input_variables=["context", "question"],
         )
+        # Built once and reused for every turn
+        self.rag_chain = prompt | model
+
+    def build_inputs(self, question, results):
+        """
+        Assemble the prompt inputs from retrieved chunks.
+
+        The context assembler dedups the chunks, packs them into its token budget
+        and groups them under "Internal documents" and "Web search results" so the
+        model can keep the two sources apart.
+
+        Args:
+            question (str): The user's question
+            results (list[list[str]]): The chunks of each tool result, in rank order
 
-        llm = ChatOpenAI(model_name="gpt-4o", temperature=0, streaming=True)
-        rag_chain = prompt | llm
-        response = rag_chain.invoke({"context": docs, "question": question})
-        return {"messages": [response]}
+        Returns:
+            tuple: (prompt inputs, list of reference dicts the answer may cite)
+        """
+        context, references = self.context_assembler.assemble(results)
+        return {"context": context, "question": question}, references
+
+    def _build_inputs(self, messages):
+        # Only the chunks that survived grading remain in the tool results
+        results = [
+            split_chunks(message.content)
+            for message in latest_tool_messages(messages)
+            if message.status != "error" and message.content != NO_RELEVANT_DOCUMENTS
+        ]
+        return self.build_inputs(latest_question(messages), results)
+
+    def generate(self, state):
+        """
+        Generate answer
+
+        Args:
+            state (messages): The current state
+
+        Returns:
+             dict: The updated state with the answer and the sources it may cite
+        """
+        logger.debug("generate called")
+        inputs, references = self._build_inputs(state["messages"])
+        response = self.rag_chain.invoke(inputs)
+        return {"messages": [response], "tokens_used": token_usage(response), "sources": references}
+
+    async def agenerate(self, state):
+        """
+        Async version of generate().
+        """
+        logger.debug("generate called (async)")
+        inputs, references = self._build_inputs(state["messages"])
+        response = await self.rag_chain.ainvoke(inputs)
+        return {"messages": [response], "tokens_used": token_usage(response), "sources": references}
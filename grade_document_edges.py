@@ -1,19 +1,81 @@
-from typing import Literal
+import logging
+import re
+from typing import List, Literal
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
+from conversation_history import latest_question, latest_tool_messages
+from lexical_index import is_command_token, tokenize
+from model_registry import get_default_registry
+from retrieval_budget import token_usage
+
+logger = logging.getLogger(__name__)
+
+# Retriever chunks start with "[Source: file]", web results with "[Web source: url]",
+# spreadsheet rows with "[file / sheet / row N]".
+CHUNK_HEADER_PATTERN = re.compile(r"^(?=\[Source: |\[Web source: |\[[^\]\n]+ / [^\]\n]+ / row \d+\] )", re.MULTILINE)
+NO_RELEVANT_DOCUMENTS = "No relevant documents found."
+
+
+def split_chunks(content):
+    """
+    Split a retrieval tool's output back into its individual chunks.
+    """
+    content = str(content).strip()
+    if not content:
+        return []
+    return [chunk.strip() for chunk in CHUNK_HEADER_PATTERN.split(content) if chunk.strip()]
+
+
+def lexical_score(question_terms, chunk):
+    """
+    Weighted fraction of the question's terms found in the chunk, from 0 to 1.
+
+    Identifiers (AT commands, SKUs, API paths) count double; AT commands also
+    match any longer command sharing their prefix (at+pp -> at+ppxxx).
+    """
+    if not question_terms:
+        return None
+    chunk_terms = set(tokenize(chunk))
+    total = matched = 0.0
+    for term in question_terms:
+        weight = 1.0 if term.isalnum() else 2.0
+        total += weight
+        if term in chunk_terms or (is_command_token(term) and any(t.startswith(term) for t in chunk_terms)):
+            matched += weight
+    return matched / total
+
+
+class chunk_grade(BaseModel):
+    """Relevance grade for one retrieved document."""
+    document_id: int = Field(description="The number of the document being graded")
+    binary_score: str = Field(description="Relevance score: 'yes' or 'no'")
+
+
+class grades(BaseModel):
+    """Binary relevance scores for a batch of retrieved documents."""
+    grades: List[chunk_grade] = Field(description="One grade per document")
+
 
 class GradeDocumentEdges:
     """
     Class to encapsulate the logic for grading document relevance.
+
+    Every retrieved chunk is graded on its own. A local lexical score rejects
+    chunks sharing almost no terms with the question and accepts chunks covering
+    nearly all of them; only the uncertain middle band is sent to the LLM grader,
+    in one batched structured call. Rejected chunks are removed from the tool
+    results before they reach 'generate'.
     """
-    def __init__(self):
-        self.model = ChatOpenAI(temperature=0, model="gpt-4o", streaming=True)
+    REJECT_BELOW = 0.2
+    ACCEPT_FROM = 0.75
+
+    def __init__(self, model=None):
+        self.model = model or get_default_registry().get_chat_model("grade")
         self.prompt = PromptTemplate(
             template="""
-You are a strict grader that evaluates whether a retrieved document is relevant to a user's question.
+You are a strict grader that evaluates whether each retrieved document is relevant to a user's question.
 
-Your task is to return a binary score:
+For every document return a binary score:
 - "yes" if the document clearly contains keywords, phrases, or exact instructions that directly answer or explain the user’s question.
 - "no" if the document does not mention any of the keywords from the question or does not directly relate to the user's intent.
 
@@ -24,50 +86,115 @@ Do not infer or assume relevance based on vague similarities. Only return "yes"
 User Question:
 {question}
 
-Retrieved Document:
+Retrieved Documents:
 {context}
 
-Does the document directly answer or relate to the question? Reply with "yes" or "no".
+Grade every document above by its number. Reply with "yes" or "no" for each.
 """,
             input_variables=["context", "question"],
         )
+        # Structured-output grading chain, built once and reused for every call. The raw
+        # message is kept so its token usage counts against the turn's budget.
+        self.chain = self.prompt | self.model.with_structured_output(grades, include_raw=True)
 
-    def grade_documents(self, state) -> Literal["generate", "rewrite"]:
+    def _pre_rank(self, state):
         """
-        Determines whether the retrieved documents are relevant to the question.
-        Uses a quick keyword match as a pre-check, and then validates via LLM with strict prompt.
+        Score every chunk locally. Returns the question, the tool messages with their
+        chunks, the indexes of accepted chunks and the indexes left for the LLM.
         """
-        print('BT - grade_document called...')
-        print("---CHECK RELEVANCE---")
-
-        # Extract user question and retrieved docs
         messages = state["messages"]
-        question = messages[0].content
-        docs = messages[-1].content
-
-        # --- Quick keyword overlap check ---
-        def contains_keywords(question, docs):
-            question_keywords = set(question.lower().split())
-            doc_text = docs.lower()
-            return any(keyword in doc_text for keyword in question_keywords)
-
-        if not contains_keywords(question, docs):
-            print("---PRE-CHECK FAILED: No keyword match---")
-            return "rewrite"
-
-        # --- If keyword check passes, do strict LLM grading ---
-        class grade(BaseModel):
-            """Binary score for relevance check."""
-            binary_score: str = Field(description="Relevance score: 'yes' or 'no'")
-
-        llm_with_tool = self.model.with_structured_output(grade)
-        chain = self.prompt | llm_with_tool
-        scored_result = chain.invoke({"question": question, "context": docs})
-        score = scored_result.binary_score.strip().lower()
-
-        if score == "yes":
-            print("---DECISION: DOCS RELEVANT---")
+        question = latest_question(messages)
+        question_terms = set(tokenize(question))
+        tool_messages = latest_tool_messages(messages)
+        # Failed or timed-out tool calls contribute no chunks
+        chunks = [
+            (message, split_chunks(message.content) if message.status != "error" else [])
+            for message in tool_messages
+        ]
+
+        accepted, uncertain = set(), []
+        position = 0
+        for _, message_chunks in chunks:
+            for chunk in message_chunks:
+                score = lexical_score(question_terms, chunk)
+                if score is None or self.REJECT_BELOW <= score < self.ACCEPT_FROM:
+                    uncertain.append((position, chunk))
+                elif score >= self.ACCEPT_FROM:
+                    accepted.add(position)
+                position += 1
+        logger.debug("pre-rank: %d accepted, %d uncertain, %d rejected",
+                     len(accepted), len(uncertain), position - len(accepted) - len(uncertain))
+        return question, chunks, accepted, uncertain
+
+    def _build_inputs(self, question, uncertain):
+        context = "\n\n".join(f"Document {i}:\n{chunk}" for i, (_, chunk) in enumerate(uncertain))
+        return {"question": question, "context": context}
+
+    def _llm_accepted(self, result, uncertain):
+        accepted = set()
+        scored_result = result["parsed"]
+        if scored_result is None:
+            logger.warning("LLM grading failed: %s", result["parsing_error"])
+            return accepted
+        for item in scored_result.grades:
+            if 0 <= item.document_id < len(uncertain) and item.binary_score.strip().lower() == "yes":
+                accepted.add(uncertain[item.document_id][0])
+        return accepted
+
+    def _filter(self, chunks, accepted, tokens_used=0):
+        """
+        Rewrite each tool message so it carries only the accepted chunks.
+        """
+        updates = []
+        position = 0
+        for message, message_chunks in chunks:
+            kept = [chunk for i, chunk in enumerate(message_chunks, start=position) if i in accepted]
+            position += len(message_chunks)
+            content = "\n\n".join(kept) if kept else NO_RELEVANT_DOCUMENTS
+            if content != message.content:
+                # Same message ID, so add_messages replaces the original tool output
+                updates.append(message.model_copy(update={"content": content}))
+        logger.debug("graded: %d of %d chunks kept", len(accepted), position)
+        return {"messages": updates, "tokens_used": tokens_used}
+
+    def grade_documents(self, state):
+        """
+        Graph node: drop the retrieved chunks that are not relevant to the question.
+
+        Args:
+            state (messages): The current state
+
+        Returns:
+            dict: The tool messages rewritten to hold only the relevant chunks, and the grader's token usage
+        """
+        logger.debug("grade_documents called")
+        question, chunks, accepted, uncertain = self._pre_rank(state)
+        tokens_used = 0
+        if uncertain:
+            result = self.chain.invoke(self._build_inputs(question, uncertain))
+            accepted |= self._llm_accepted(result, uncertain)
+            tokens_used = token_usage(result["raw"])
+        return self._filter(chunks, accepted, tokens_used)
+
+    async def agrade_documents(self, state):
+        """
+        Async version of grade_documents().
+        """
+        logger.debug("grade_documents called (async)")
+        question, chunks, accepted, uncertain = self._pre_rank(state)
+        tokens_used = 0
+        if uncertain:
+            result = await self.chain.ainvoke(self._build_inputs(question, uncertain))
+            accepted |= self._llm_accepted(result, uncertain)
+            tokens_used = token_usage(result["raw"])
+        return self._filter(chunks, accepted, tokens_used)
+
+    def decide(self, state) -> Literal["generate", "rewrite"]:
+        """
+        Route to 'generate' if any retrieved chunk survived grading, else 'rewrite'.
+        """
+        if any(message.content != NO_RELEVANT_DOCUMENTS for message in latest_tool_messages(state["messages"])):
+            logger.debug("decision: docs relevant")
             return "generate"
-        else:
-            print("---DECISION: DOCS NOT RELEVANT---")
-            return "rewrite"
+        logger.debug("decision: docs not relevant")
+        return "rewrite"
@@ -0,0 +1,149 @@
+import operator
+from typing import Annotated, Sequence
+from typing_extensions import TypedDict
+
+from langchain_core.messages import BaseMessage, SystemMessage
+from langgraph.graph import END, StateGraph, START
+from langgraph.graph.message import add_messages
+from langgraph.prebuilt import tools_condition
+from langgraph.utils.runnable import RunnableCallable
+
+from agent import Agent
+from context_assembler import ContextAssembler
+from conversation_history import HistoryTrimmer
+from generate_agent import GenerateAgent
+from grade_document_edges import GradeDocumentEdges
+from model_registry import get_default_registry
+from retrieval_budget import RetrievalBudget
+from retrieval_node import RetrievalNode
+from rewrite_agent import RewriteAgent
+
+
+SYSTEM_MSG = SystemMessage(
+    content="""
+            You are an expert Multitech Technical Support assistant for question-answering tasks.
+
+            1. Use only the provided Multitech internal documents to answer the question.
+            2. If internal context may be insufficient, call the Tavily search tool in the same turn as the internal retriever;
+               both run in parallel. When using the Tavily search tool, make sure it is
+               related to Multitech products. For example, the product names are MTCDT, MTCDTIP, MTCAP, MTCAP2, MTCAP3, xDot, mDot...etc.
+            3. Do not mix information from different sources — clearly state if the answer is from internal documents or web search.
+            4. Look for the keyword from the user questions and try to match it with an exact word from the search Multitech internal documents or
+               a similar word. For example, if the keyword is 'at+pp', the exact is 'at+pp' or the similar word is 'at+ppxxx', the xxx can be any
+               any characters from [a to z or A to Z, 1 - 9]...etc.
+            5. Provide complete, step-by-step instructions. Include links, screenshots, or examples exactly as shown.
+            6. Cite the source (e.g., document name or URL).
+            7. If no answer is found, say: "I don’t know."
+            """
+)
+
+
+class AgentState(TypedDict):
+    # The add_messages function defines how an update should be processed
+    # Default is to replace. add_messages says "append"
+    messages: Annotated[Sequence[BaseMessage], add_messages]
+    # Retrieval budget bookkeeping. tokens_used accumulates over the whole thread;
+    # the other fields are reset at the start of every turn.
+    rewrites: int
+    tokens_used: Annotated[int, operator.add]
+    turn_start_tokens: int
+    deadline: float
+    # Numbered references (file, pages/rows, section or URL) behind the latest answer's [n] citations.
+    sources: list
+
+
+def build_graph(retrieval_tools, web_tools, checkpointer=None, history_max_tokens=4000, model_registry=None,
+                max_rewrites=2, max_turn_tokens=20000, turn_deadline_seconds=60, fallback_search_tool=None,
+                tool_timeouts=None, context_max_tokens=3000, callbacks=None):
+    """
+    Build and compile the RAG workflow graph.
+
+    Args:
+        retrieval_tools (list): Internal document and table retrieval tools
+        web_tools (list): Web search tools; run by 'use_tools' in parallel with retrieval_tools
+        checkpointer: Optional LangGraph checkpointer used to persist conversation state
+        history_max_tokens (int): Token budget for earlier turns kept in the conversation
+        model_registry (ModelRegistry): Source of the chat models; defaults to the process-wide registry
+        max_rewrites (int): Question rewrites allowed per turn before falling back
+        max_turn_tokens (int): LLM tokens allowed per turn before falling back
+        turn_deadline_seconds (float): Wall-clock time allowed per turn before falling back
+        fallback_search_tool: Optional web search tool the fallback answers from; without it the fallback says "I don't know"
+        tool_timeouts (dict): Per-tool timeout in seconds for 'use_tools', keyed by tool name
+        context_max_tokens (int): Token budget for the retrieved chunks passed to 'generate'
+        callbacks (list): Callback handlers attached to every run of the graph, e.g. telemetry.GraphTelemetry
+
+    Returns:
+        CompiledStateGraph: The compiled workflow
+    """
+    model_registry = model_registry or get_default_registry()
+    tools = list(retrieval_tools) + list(web_tools)
+    history_trimmer = HistoryTrimmer(max_tokens=history_max_tokens)
+    grade_document_edges = GradeDocumentEdges(model_registry.get_chat_model("grade"))
+    agent_instance = Agent(SYSTEM_MSG, tools, model_registry.get_chat_model("agent"))
+    rewrite_agent_instance = RewriteAgent(model_registry.get_chat_model("rewrite"))
+    generate_agent_instance = GenerateAgent(
+        model_registry.get_chat_model("generate"), ContextAssembler(max_tokens=context_max_tokens)
+    )
+    retrieval_budget = RetrievalBudget(
+        max_rewrites=max_rewrites,
+        max_tokens=max_turn_tokens,
+        deadline_seconds=turn_deadline_seconds,
+        generate_agent=generate_agent_instance,
+        web_search_tool=fallback_search_tool,
+    )
+
+    # Define a new graph
+    workflow = StateGraph(AgentState)
+
+    # Define the nodes we will cycle between
+    workflow.add_node("start_turn", retrieval_budget.start_turn)  # Reset the per-turn retrieval budget
+    workflow.add_node("trim_history", history_trimmer.trim_history)  # Bound the checkpointed history
+    # Each node has a sync and an async implementation, so the same compiled graph
+    # serves graph.stream (Streamlit) and graph.astream (async servers).
+    workflow.add_node("agent", RunnableCallable(agent_instance.agent, agent_instance.aagent))  # agent
+    retrieve = RetrievalNode(tools, web_tools=web_tools, timeouts=tool_timeouts)
+    workflow.add_node("use_tools", RunnableCallable(retrieve.retrieve, retrieve.aretrieve))  # parallel internal + web retrieval
+    workflow.add_node("grade_documents", RunnableCallable(grade_document_edges.grade_documents, grade_document_edges.agrade_documents))  # Per-chunk relevance grading
+    workflow.add_node("rewrite", RunnableCallable(rewrite_agent_instance.rewrite, rewrite_agent_instance.arewrite))  # Re-writing the question
+    workflow.add_node("generate", RunnableCallable(generate_agent_instance.generate, generate_agent_instance.agenerate))  # Generating a response after we know the documents are relevant
+    workflow.add_node("fallback", RunnableCallable(retrieval_budget.fallback, retrieval_budget.afallback))  # Answer once the retrieval budget is spent
+    # Trim earlier turns, then call agent node to decide to retrieve or not
+    workflow.add_edge(START, "start_turn")
+    workflow.add_edge("start_turn", "trim_history")
+    workflow.add_edge("trim_history", "agent")
+
+    # Decide whether to retrieve
+    workflow.add_conditional_edges(
+        "agent",
+        # Assess agent decision
+        # BT - If the LLM responses a 'tool_calls', then tool_condition will return 'tools'
+        tools_condition,
+        {
+            # Translate the condition outputs to nodes in our graph
+            "tools": "use_tools",
+            END: END,
+        },
+    )
+
+    # Edges taken after the `action` node is called.
+    workflow.add_edge("use_tools", "grade_documents")
+    workflow.add_conditional_edges(
+        "grade_documents",
+        ########################################################################################################
+        # BT - When 'retrieve' return, 'grade_documents' drops the irrelevant chunks from the tool results.
+        #      If any chunk survives it goes to 'generate', otherwise to 'rewrite'. Once the turn's
+        #      retrieval budget is spent, 'rewrite' becomes 'fallback' so the loop always terminates.
+        #      If it is 'rewrite' then the 'rewrite' will back to 'agent'. Otherwise, if it is 'generate',
+        #      then it will goes to END
+        ########################################################################################################
+        # Assess agent decision
+        retrieval_budget.guard(grade_document_edges.decide),
+        ["generate", "rewrite", "fallback"],
+    )
+    workflow.add_edge("generate", END)
+    workflow.add_edge("fallback", END)
+    workflow.add_edge("rewrite", "agent")
+
+    graph = workflow.compile(checkpointer=checkpointer)
+    # with_config returns a copy of the compiled graph, so stream/get_state/update_state all keep working.
+    return graph.with_config(callbacks=list(callbacks)) if callbacks else graph
@@ -0,0 +1,62 @@
+import asyncio
+from typing import Any, List
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=60):
+    """
+    Fuse several ranked ID lists: each ID scores sum(1 / (rrf_k + rank)) over the lists it appears in.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense vectorstore similarity search fused with the BM25 lexical index by reciprocal rank fusion.
+
+    Embeddings are weak at exact command tokens such as AT+PP or /api/remoteAccess;
+    the lexical side catches those while the dense side handles paraphrases.
+    """
+
+    vectorstore: Any
+    lexical_index: Any
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    def _fuse(self, dense_docs, lexical_hits):
+        by_id = {doc.id: doc for doc in dense_docs if doc.id}
+        dense_ids = [doc.id for doc in dense_docs if doc.id]
+        lexical_ids = [doc_id for doc_id, _ in lexical_hits]
+        fused_ids = reciprocal_rank_fusion([dense_ids, lexical_ids], self.rrf_k)[: self.k]
+        missing = [doc_id for doc_id in fused_ids if doc_id not in by_id]
+        if missing:
+            for doc in self.vectorstore.get_by_ids(missing):
+                by_id[doc.id] = doc
+        return [by_id[doc_id] for doc_id in fused_ids if doc_id in by_id]
+
+    def _lexical_search(self, query):
+        self.lexical_index.reload_if_changed()
+        return self.lexical_index.search(query, k=self.fetch_k)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        dense_docs = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        return self._fuse(dense_docs, self._lexical_search(query))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        dense_docs, lexical_hits = await asyncio.gather(
+            self.vectorstore.asimilarity_search(query, k=self.fetch_k),
+            asyncio.to_thread(self._lexical_search, query),
+        )
+        return await asyncio.to_thread(self._fuse, dense_docs, lexical_hits)
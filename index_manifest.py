@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import tempfile
+
+
+def file_sha256(file_path, block_size=1 << 20):
+    """
+    Hash a file's content in fixed-size blocks so large PDFs are never held in memory.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_chunk_id(file_key, content_hash, index, chunker=None):
+    """
+    Deterministic chunk ID: the same file content always yields the same IDs, so
+    re-indexing upserts in place instead of creating duplicates. `chunker` names the
+    chunking scheme, so re-chunked content never reuses an ID of the old chunks.
+    """
+    key = f"{file_key}|{content_hash}|{index}" + (f"|{chunker}" if chunker else "")
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+class IndexManifest:
+    """
+    Record of what is stored in the vectorstore, keyed by file path.
+
+    Each entry holds the file's content hash, mtime, size, the IDs of its chunks,
+    the embedding model and the chunker version used, so the builder can skip unchanged files with a
+    single stat call and replace or purge exactly the chunks of a changed file.
+    """
+
+    # v2: PDF and text chunks come from the structure-aware chunker. A v1 manifest is
+    # ignored, so every file is re-chunked once and its old chunks are purged by source.
+    VERSION = 2
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.files = {}
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self.files = data.get("files", {})
+        return self
+
+    def save(self):
+        """
+        Write the manifest atomically so a crash never leaves a half-written file.
+        """
+        directory = os.path.dirname(self.manifest_path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".manifest-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": self.VERSION, "files": self.files}, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.manifest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, file_key):
+        return self.files.get(file_key)
+
+    def is_unchanged(self, file_key, stat, embedding_model):
+        """
+        True when the stored mtime, size and embedding model match, without reading the file.
+        """
+        entry = self.files.get(file_key)
+        return (
+            entry is not None
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and entry["size"] == stat.st_size
+            and entry["embedding_model"] == embedding_model
+        )
+
+    def set(self, file_key, content_hash, stat, chunk_ids, embedding_model, chunker=None):
+        self.files[file_key] = {
+            "source": os.path.basename(file_key),
+            "sha256": content_hash,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "chunk_ids": list(chunk_ids),
+            "embedding_model": embedding_model,
+            "chunker": chunker,
+        }
+
+    def touch(self, file_key, stat):
+        """
+        Refresh mtime and size for a file whose content hash did not change.
+        """
+        entry = self.files[file_key]
+        entry["mtime_ns"] = stat.st_mtime_ns
+        entry["size"] = stat.st_size
+
+    def remove(self, file_key):
+        return self.files.pop(file_key, None)
+
+    def find_by_source(self, source):
+        """
+        Return the manifest keys whose file name matches `source`.
+        """
+        return [key for key, entry in self.files.items() if entry.get("source") == source]
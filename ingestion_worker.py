@@ -0,0 +1,132 @@
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+JOB_ACTIONS = ("add", "replace", "delete")
+
+
+class IngestionJob:
+    """
+    One add/replace/delete request for a single file in the docs folder, and its status.
+    """
+
+    def __init__(self, action, file_name):
+        if action not in JOB_ACTIONS:
+            raise ValueError(f"Unknown ingestion action: {action}")
+        self.job_id = uuid.uuid4().hex
+        self.action = action
+        self.file_name = file_name
+        self.status = "queued"
+        self.error = None
+        self.progress = None
+        self.created = time.time()
+        self.finished = None
+
+    def describe(self):
+        text = f"{self.action} {self.file_name}: {self.status}"
+        if self.status == "running" and self.progress:
+            done, total = self.progress
+            text += f" ({done}/{total} chunks)"
+        elif self.status == "failed":
+            text += f" ({self.error})"
+        return text
+
+
+class IngestionWorker:
+    """
+    Background thread that applies file changes to the index one job at a time.
+
+    Each job touches only its own file: adds and replaces go through
+    VectorstoreBuilder.index_file(), deletes through delete_file_from_vectorstore(),
+    and both save the manifest atomically. The BM25 index is saved once per job. Chunks are upserted under new IDs before
+    stale ones are deleted, so retrieval keeps serving from the current index while
+    a job runs.
+
+    Args:
+        builder (VectorstoreBuilder): The builder owning the vectorstore, manifest and lexical index
+        docs_directory (str): Folder the UI writes uploaded files to
+        lock (threading.Lock): Lock shared with any other code that writes to the index
+        history (int): Number of finished jobs kept for display
+    """
+
+    def __init__(self, builder, docs_directory, lock=None, history=20):
+        self.builder = builder
+        self.docs_directory = docs_directory
+        self.lock = lock or threading.RLock()
+        self.history = history
+        self.jobs = []
+        self._queue = queue.Queue()
+        self._jobs_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="ingestion-worker", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, action, file_name):
+        """
+        Queue a job for `file_name` (a name inside docs_directory). Returns the IngestionJob.
+        """
+        job = IngestionJob(action, file_name)
+        with self._jobs_lock:
+            self.jobs.append(job)
+            finished = [j for j in self.jobs if j.finished is not None]
+            for old in finished[:max(0, len(finished) - self.history)]:
+                self.jobs.remove(old)
+        self._queue.put(job)
+        self.start()
+        return job
+
+    def busy(self):
+        """
+        True while any job is queued or running.
+        """
+        with self._jobs_lock:
+            return any(job.finished is None for job in self.jobs)
+
+    def recent_jobs(self):
+        with self._jobs_lock:
+            return list(reversed(self.jobs))
+
+    def _process(self, job):
+        if job.action == "delete":
+            self.builder.delete_file_from_vectorstore(job.file_name)
+            return
+        file_path = os.path.join(self.docs_directory, job.file_name)
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f"{job.file_name} is not in {self.docs_directory}")
+
+        def progress(file_name, done, total, elapsed):
+            job.progress = (done, total)
+
+        self.builder.index_file(file_path, progress_callback=progress)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job.status = "running"
+            logger.info("ingestion job started: %s %s", job.action, job.file_name)
+            try:
+                with self.lock:
+                    try:
+                        self._process(job)
+                    finally:
+                        self.builder.lexical_index.save_if_changed()
+                job.status = "done"
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                logger.warning("ingestion job failed: %s %s: %s", job.action, job.file_name, e)
+            finally:
+                job.finished = time.time()
+                telemetry.record_job(job)
+                self._queue.task_done()
@@ -0,0 +1,189 @@
+import bisect
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+
+# Order matters: the more specific patterns must win over plain words.
+TOKEN_PATTERN = re.compile(
+    r"""
+    at[+&%$#^][a-z0-9_+]*           # AT commands: at+pp, at+ppxxx, at&f
+    | (?:/[a-z0-9_.{}-]+){2,}        # API paths: /api/remoteaccess, /api/lora/devices
+    | [a-z0-9]+(?:[-.][a-z0-9]+)+    # SKUs and versions: mtcdt-l4g1, 5.3.0
+    | \w+
+    """,
+    re.VERBOSE,
+)
+SUB_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in into is it of on or "
+    "please show tell that the this to what when where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    """
+    Lower-case tokenizer that keeps AT commands, API paths and product SKUs whole.
+
+    Compound tokens are also emitted as their alphanumeric parts, so a query for
+    "mtcdt" still matches a chunk that only mentions "MTCDT-L4G1".
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group(0)
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum() and not is_command_token(token):
+            tokens.extend(p for p in SUB_TOKEN_PATTERN.findall(token) if p not in STOPWORDS and p != token)
+    return tokens
+
+
+def is_command_token(token):
+    return token.startswith("at") and len(token) > 2 and not token[2].isalnum()
+
+
+class LexicalIndex:
+    """
+    Persisted BM25 inverted index over chunk texts, keyed by the same chunk IDs as the vectorstore.
+
+    AT-command query terms are also expanded to every indexed term sharing the
+    prefix (at+pp -> at+ppxxx), and any query term ending in '*' is treated as a
+    prefix; expanded terms score at half weight so exact hits rank first.
+    """
+
+    K1 = 1.5
+    B = 0.75
+    PREFIX_WEIGHT = 0.5
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.postings = {}
+        self.doc_lengths = {}
+        self._vocabulary = None
+        self._loaded_mtime = None
+        self._lock = threading.RLock()
+        self.changed = False
+        self.load()
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def exists(self):
+        return os.path.exists(self.index_path)
+
+    def load(self):
+        with self._lock:
+            if not self.exists():
+                return self
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+            self.postings = data.get("postings", {})
+            self.doc_lengths = data.get("doc_lengths", {})
+            self._vocabulary = None
+            self._loaded_mtime = os.path.getmtime(self.index_path)
+            self.changed = False
+            return self
+
+    def reload_if_changed(self):
+        """
+        Pick up an index file rewritten by another process.
+        """
+        if self.exists() and os.path.getmtime(self.index_path) != self._loaded_mtime:
+            self.load()
+
+    def save(self):
+        with self._lock:
+            directory = os.path.dirname(self.index_path) or "."
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".lexical-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"postings": self.postings, "doc_lengths": self.doc_lengths}, f, separators=(",", ":"))
+                os.replace(tmp_path, self.index_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._loaded_mtime = os.path.getmtime(self.index_path)
+            self.changed = False
+
+    def save_if_changed(self):
+        """
+        Save once after a batch of add/remove calls; a no-op when nothing changed since the last load or save.
+        """
+        with self._lock:
+            if self.changed:
+                self.save()
+
+    def add(self, ids, texts):
+        with self._lock:
+            self.remove(ids)
+            for doc_id, text in zip(ids, texts):
+                counts = Counter(tokenize(text))
+                self.doc_lengths[doc_id] = sum(counts.values())
+                for term, tf in counts.items():
+                    self.postings.setdefault(term, {})[doc_id] = tf
+            self._vocabulary = None
+            self.changed = self.changed or bool(ids)
+
+    def remove(self, ids):
+        with self._lock:
+            ids = [doc_id for doc_id in ids if doc_id in self.doc_lengths]
+            if not ids:
+                return
+            drop = set(ids)
+            for doc_id in ids:
+                del self.doc_lengths[doc_id]
+            for term in list(self.postings):
+                docs = self.postings[term]
+                for doc_id in drop.intersection(docs):
+                    del docs[doc_id]
+                if not docs:
+                    del self.postings[term]
+            self._vocabulary = None
+            self.changed = True
+
+    def _expand(self, term):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        start = bisect.bisect_left(self._vocabulary, term)
+        matches = []
+        for candidate in self._vocabulary[start:]:
+            if not candidate.startswith(term):
+                break
+            if candidate != term:
+                matches.append(candidate)
+        return matches
+
+    def search(self, query, k=20):
+        """
+        Return up to k (chunk_id, bm25_score) pairs for the query, best first.
+        """
+        with self._lock:
+            total_docs = len(self.doc_lengths)
+            if not total_docs:
+                return []
+            avg_length = sum(self.doc_lengths.values()) / total_docs
+
+            weighted_terms = {}
+            for raw in query.lower().split():
+                prefix = raw.endswith("*")
+                for term in tokenize(raw.rstrip("*")):
+                    weighted_terms[term] = max(weighted_terms.get(term, 0.0), 1.0)
+                    if prefix or is_command_token(term):
+                        for expanded in self._expand(term):
+                            weighted_terms.setdefault(expanded, self.PREFIX_WEIGHT)
+
+            scores = Counter()
+            for term, weight in weighted_terms.items():
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, tf in docs.items():
+                    norm = tf + self.K1 * (1 - self.B + self.B * self.doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] += weight * idf * tf * (self.K1 + 1) / norm
+            return scores.most_common(k)
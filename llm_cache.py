@@ -0,0 +1,165 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.caches import BaseCache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration
+
+import telemetry
+
+# Per-message fields that differ between otherwise identical prompts.
+VOLATILE_MESSAGE_FIELDS = ("id", "response_metadata", "usage_metadata")
+NO_USAGE = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+_bypassed = ContextVar("llm_cache_bypassed", default=False)
+
+
+@contextmanager
+def bypass_llm_cache():
+    """
+    Skip every LLM cache, for lookups and stores, for model calls made inside this block.
+    """
+    token = _bypassed.set(True)
+    try:
+        yield
+    finally:
+        _bypassed.reset(token)
+
+
+def normalize_prompt(prompt):
+    """
+    The serialized messages of a chat model call without message IDs and response metadata.
+    """
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    for message in messages if isinstance(messages, list) else []:
+        fields = message.get("kwargs") if isinstance(message, dict) else None
+        if isinstance(fields, dict):
+            for name in VOLATILE_MESSAGE_FIELDS:
+                fields.pop(name, None)
+    return json.dumps(messages, sort_keys=True, ensure_ascii=False)
+
+
+def cache_key(prompt, llm_string):
+    """
+    SHA-256 of the model's name, parameters and bound tools (`llm_string`) and the normalized messages.
+    """
+    return hashlib.sha256(f"{llm_string}\x00{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    Disk-backed exact-match cache of chat model responses, for one graph role.
+
+    Set as a chat model's `cache`, it is consulted before every call: an identical
+    request (same model, parameters, bound tools and messages) is answered from disk
+    without calling the provider. That is only sound for deterministic models, so it
+    is meant for the temperature-0 roles whose inputs repeat, like grading and
+    rewriting. Cached responses report no token usage and get a fresh message ID.
+    The least recently used entries are evicted past `max_entries`.
+
+    Args:
+        db_path (str): SQLite file, shared by the caches of every role
+        namespace (str): Role whose entries this cache holds
+        max_entries (int): Entries kept for this role
+        bypass (bool): Neither look up nor store anything
+    """
+
+    def __init__(self, db_path, namespace="default", max_entries=1000, bypass=False):
+        self.db_path = db_path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (namespace TEXT, key TEXT, generations TEXT, "
+                "created REAL, last_used REAL, PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_lru ON llm_cache (namespace, last_used)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _skipped(self):
+        return self.bypass or _bypassed.get()
+
+    def _count(self, result):
+        with self._lock:
+            if result == "hit":
+                self.hits += 1
+            else:
+                self.misses += 1
+        telemetry.LLM_CACHE_REQUESTS.labels(self.namespace, result).inc()
+
+    def lookup(self, prompt, llm_string):
+        if self._skipped():
+            return None
+        key = cache_key(prompt, llm_string)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT generations FROM llm_cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE llm_cache SET last_used = ? WHERE namespace = ? AND key = ?", (time.time(), self.namespace, key)
+                )
+        if row is None:
+            self._count("miss")
+            return None
+        self._count("hit")
+        generations = []
+        for stored in json.loads(row[0]):
+            message = messages_from_dict([stored["message"]])[0]
+            # A new ID, so add_messages appends the answer instead of replacing the original one.
+            message.id = f"cache-{uuid.uuid4().hex}"
+            if hasattr(message, "usage_metadata"):
+                message.usage_metadata = dict(NO_USAGE)
+            generations.append(ChatGeneration(message=message, generation_info=stored["generation_info"]))
+        return generations
+
+    def update(self, prompt, llm_string, return_val):
+        if self._skipped() or not return_val:
+            return
+        if not all(isinstance(generation, ChatGeneration) for generation in return_val):
+            return
+        stored = json.dumps([
+            {"message": message_to_dict(generation.message), "generation_info": generation.generation_info}
+            for generation in return_val
+        ])
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (namespace, key, generations, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, cache_key(prompt, llm_string), stored, now, now),
+            )
+            conn.execute(
+                "DELETE FROM llm_cache WHERE namespace = ? AND key IN ("
+                "SELECT key FROM llm_cache WHERE namespace = ? ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_entries),
+            )
+
+    def clear(self, **kwargs):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_cache WHERE namespace = ?", (self.namespace,))
+
+    def stats(self):
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM llm_cache WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
@@ -0,0 +1,350 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# Rows scored per step of the int8 scan; bounds the float32 scratch space of a query.
+SCAN_BLOCK_ROWS = 4096
+# SQLite allows at most 999 bound parameters per statement in older builds.
+SQL_BATCH = 500
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _quantize(vectors):
+    """
+    Symmetric per-row int8 quantization of unit vectors: (int8 rows, float32 scales).
+    """
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def _write_at(path, offset, data):
+    # Rows past the recorded count are leftovers of an interrupted write and are overwritten.
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        f.seek(offset)
+        f.write(data)
+
+
+class MmapVectorStore(VectorStore):
+    """
+    Vector store kept in memory-mapped files, as a lighter alternative to Chroma.
+
+    Every vector is normalized and stored twice, row-aligned: int8 with a per-row
+    scale for the scan, and float16 for re-ranking. A query scores the int8
+    matrix block by block, then re-scores the best `rerank_factor * k` candidates
+    exactly against their float16 rows. Texts and metadata live in a SQLite
+    sidecar that is only read for the results. Opening the store maps the files
+    and reads the IDs and sources, so it is near instant and the OS shares the
+    pages between worker processes.
+
+    Rows are append-only: upserting an existing ID or deleting one marks its row
+    dead. Once dead rows make up `compact_ratio` of the store, the live rows are
+    copied to the next generation of files; the switch is a single SQLite commit.
+    Compaction renumbers rows, so results are read from the sidecar by chunk ID,
+    never by row number. The previous generation's files are only deleted by the
+    compaction after next, so a reader in another process that loaded just
+    before a switch can still map them.
+
+    Besides the VectorStore interface it answers the get/upsert/delete calls
+    (by IDs or an equality `where` filter on metadata) that VectorstoreBuilder
+    makes on a Chroma collection.
+
+    Args:
+        directory (str): Folder holding chunks.sqlite and the vector files
+        embedding_function (Embeddings): Embeds documents and queries
+        rerank_factor (int): Candidates re-scored exactly, per result requested
+        compact_ratio (float): Share of dead rows that triggers compaction
+    """
+
+    def __init__(self, directory, embedding_function, rerank_factor=4, compact_ratio=0.25):
+        self.directory = directory
+        self.embedding_function = embedding_function
+        self.rerank_factor = rerank_factor
+        self.compact_ratio = compact_ratio
+        self.db_path = os.path.join(directory, "chunks.sqlite")
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, id TEXT, source TEXT, "
+                "document TEXT, metadata TEXT, alive INTEGER)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS chunks_id ON chunks (id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+        self._load()
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _paths(self, generation):
+        return {
+            name: os.path.join(self.directory, f"{name}-{generation}.{ext}")
+            for name, ext in (("int8", "i8"), ("scales", "f32"), ("float16", "f16"))
+        }
+
+    def _load(self):
+        with self._connect() as conn:
+            # One read transaction, so the generation and the row numbering always match.
+            conn.execute("BEGIN")
+            info = dict(conn.execute("SELECT key, value FROM info").fetchall())
+            rows = conn.execute("SELECT id, source, alive FROM chunks ORDER BY row").fetchall()
+        self._dim = int(info["dim"]) if "dim" in info else None
+        self._generation = int(info.get("generation", 0))
+        self._ids = [row[0] for row in rows]
+        self._sources = np.array([row[1] or "" for row in rows], dtype=object)
+        self._alive = np.array([bool(row[2]) for row in rows], dtype=bool)
+        self._rows = {row[0]: i for i, row in enumerate(rows) if row[2]}
+        self._map()
+
+    def _map(self):
+        count = len(self._ids)
+        if not count or self._dim is None:
+            self._int8 = self._scales = self._float16 = None
+            return
+        paths = self._paths(self._generation)
+        self._int8 = np.memmap(paths["int8"], dtype=np.int8, mode="r", shape=(count, self._dim))
+        self._scales = np.memmap(paths["scales"], dtype=np.float32, mode="r", shape=(count,))
+        self._float16 = np.memmap(paths["float16"], dtype=np.float16, mode="r", shape=(count, self._dim))
+
+    def count(self):
+        return int(self._alive.sum())
+
+    def _where_mask(self, where):
+        """
+        Live rows whose metadata equals every key/value pair of `where`.
+        """
+        mask = self._alive.copy()
+        for key, value in (where or {}).items():
+            if key == "source":
+                mask &= self._sources == value
+                continue
+            with self._connect() as conn:
+                # By ID, since another process may have compacted and renumbered the sidecar's rows.
+                matching = [self._rows[doc_id] for (doc_id,) in conn.execute(
+                    "SELECT id FROM chunks WHERE alive = 1 AND json_extract(metadata, ?) = ?", (f"$.{key}", value)
+                ) if doc_id in self._rows]
+            key_mask = np.zeros_like(mask)
+            key_mask[matching] = True
+            mask &= key_mask
+        return mask
+
+    def _select_rows(self, ids=None, where=None):
+        if ids is None:
+            return np.flatnonzero(self._where_mask(where))
+        rows = [self._rows[doc_id] for doc_id in ids if doc_id in self._rows]
+        if where:
+            mask = self._where_mask(where)
+            rows = [row for row in rows if mask[row]]
+        return np.array(rows, dtype=np.int64)
+
+    def _fetch(self, ids):
+        """
+        {id: (document, metadata)} of the live chunks with these IDs, from the sidecar.
+        """
+        ids = list(ids)
+        found = {}
+        with self._connect() as conn:
+            for i in range(0, len(ids), SQL_BATCH):
+                batch = ids[i:i + SQL_BATCH]
+                for doc_id, document, metadata in conn.execute(
+                    f"SELECT id, document, metadata FROM chunks WHERE alive = 1 AND id IN ({','.join('?' * len(batch))})",
+                    batch,
+                ):
+                    found[doc_id] = (document, json.loads(metadata))
+        return found
+
+    def _documents(self, ids):
+        found = self._fetch(ids)
+        return [
+            Document(id=doc_id, page_content=found[doc_id][0], metadata=found[doc_id][1])
+            for doc_id in ids if doc_id in found
+        ]
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), **kwargs):
+        """
+        Chroma-style {"ids": [...], "documents": [...], "metadatas": [...]} for live rows by ID and/or filter.
+        """
+        with self._lock:
+            result = {"ids": [self._ids[row] for row in self._select_rows(ids, where)]}
+        if "documents" in include or "metadatas" in include:
+            found = self._fetch(result["ids"])
+            # A chunk deleted since the rows were selected is left out.
+            result["ids"] = [doc_id for doc_id in result["ids"] if doc_id in found]
+            if "documents" in include:
+                result["documents"] = [found[doc_id][0] for doc_id in result["ids"]]
+            if "metadatas" in include:
+                result["metadatas"] = [found[doc_id][1] for doc_id in result["ids"]]
+        return result
+
+    def get_by_ids(self, ids, /):
+        with self._lock:
+            found_ids = [self._ids[row] for row in self._select_rows(list(ids))]
+        return self._documents(found_ids)
+
+    def upsert(self, ids, documents, metadatas=None, embeddings=None):
+        """
+        Store chunks under `ids`, replacing any stored under the same IDs.
+        """
+        if not ids:
+            return
+        metadatas = metadatas or [{} for _ in ids]
+        if embeddings is None:
+            embeddings = self.embedding_function.embed_documents(list(documents))
+        # The last occurrence of a repeated ID wins.
+        latest = {doc_id: i for i, doc_id in enumerate(ids)}
+        order = sorted(latest.values())
+        vectors = _normalize([embeddings[i] for i in order])
+        int8, scales = _quantize(vectors)
+        with self._lock:
+            dim = vectors.shape[1]
+            if self._dim is not None and dim != self._dim:
+                raise ValueError(f"vectors have {dim} dimensions, the store holds {self._dim}")
+            start = len(self._ids)
+            replaced = [self._rows[ids[i]] for i in order if ids[i] in self._rows]
+            paths = self._paths(self._generation)
+            _write_at(paths["int8"], start * dim, int8.tobytes())
+            _write_at(paths["scales"], start * 4, scales.tobytes())
+            _write_at(paths["float16"], start * dim * 2, vectors.astype(np.float16).tobytes())
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('dim', ?)", (str(dim),))
+                conn.executemany(
+                    "INSERT INTO chunks (row, id, source, document, metadata, alive) VALUES (?, ?, ?, ?, ?, 1)",
+                    [
+                        (start + n, ids[i], (metadatas[i] or {}).get("source"), documents[i], json.dumps(metadatas[i] or {}))
+                        for n, i in enumerate(order)
+                    ],
+                )
+                conn.executemany("UPDATE chunks SET alive = 0 WHERE row = ?", [(row,) for row in replaced])
+            self._dim = dim
+            self._ids.extend(ids[i] for i in order)
+            self._sources = np.concatenate([self._sources, np.array(
+                [(metadatas[i] or {}).get("source") or "" for i in order], dtype=object,
+            )])
+            self._alive = np.concatenate([self._alive, np.ones(len(order), dtype=bool)])
+            self._alive[replaced] = False
+            self._rows.update({ids[i]: start + n for n, i in enumerate(order)})
+            self._map()
+            self._compact_if_needed()
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        self.upsert(ids, texts, list(metadatas) if metadatas else None)
+        return ids
+
+    def delete(self, ids=None, where=None, **kwargs):
+        """
+        Delete chunks by ID and/or by an equality filter on their metadata, e.g. where={"source": "manual.pdf"}.
+        """
+        if ids is None and not where:
+            return False
+        with self._lock:
+            rows = [int(row) for row in self._select_rows(ids, where)]
+            if not rows:
+                return True
+            with self._connect() as conn:
+                conn.executemany("UPDATE chunks SET alive = 0 WHERE row = ?", [(row,) for row in rows])
+            self._alive[rows] = False
+            for row in rows:
+                self._rows.pop(self._ids[row], None)
+            self._compact_if_needed()
+        return True
+
+    def _compact_if_needed(self):
+        total = len(self._ids)
+        if total and (total - self.count()) / total >= self.compact_ratio:
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrite the store without its dead rows.
+        """
+        with self._lock:
+            keep = np.flatnonzero(self._alive)
+            # The generation before the current one; no reader can still be loading it.
+            expired_paths = self._paths(self._generation - 1)
+            generation = self._generation + 1
+            new_paths = self._paths(generation)
+            if self._int8 is not None:
+                for name, matrix in (("int8", self._int8), ("scales", self._scales), ("float16", self._float16)):
+                    with open(new_paths[name], "wb") as f:
+                        for start in range(0, len(keep), SCAN_BLOCK_ROWS):
+                            f.write(np.ascontiguousarray(matrix[keep[start:start + SCAN_BLOCK_ROWS]]).tobytes())
+            with self._connect() as conn:
+                conn.execute("DELETE FROM chunks WHERE alive = 0")
+                # Ascending, so each row moves into a number already vacated.
+                conn.executemany(
+                    "UPDATE chunks SET row = ? WHERE row = ?",
+                    [(new, int(old)) for new, old in enumerate(keep) if new != old],
+                )
+                conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('generation', ?)", (str(generation),))
+            for path in expired_paths.values():
+                if os.path.exists(path):
+                    os.remove(path)
+            self._load()
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        with self._lock:
+            # The ID list is only ever appended to or replaced, so it keeps naming this snapshot's rows.
+            int8, scales, float16, ids = self._int8, self._scales, self._float16, self._ids
+            mask = self._where_mask(filter)
+        if int8 is None or not mask.any():
+            return []
+        query = _normalize(embedding)
+        scores = np.empty(len(mask), dtype=np.float32)
+        for start in range(0, len(mask), SCAN_BLOCK_ROWS):
+            end = start + SCAN_BLOCK_ROWS
+            scores[start:end] = (int8[start:end].astype(np.float32) @ query) * scales[start:end]
+        scores[~mask] = -np.inf
+        candidates = min(int(mask.sum()), max(k * self.rerank_factor, k))
+        # Sorted, so the float16 rows are read front to back.
+        rows = np.sort(np.argpartition(-scores, candidates - 1)[:candidates])
+        exact = float16[rows].astype(np.float32) @ query
+        best = np.argsort(-exact)[:k]
+        scored = [(ids[row], float(score)) for row, score in zip(rows[best], exact[best])]
+        found = self._fetch(doc_id for doc_id, _ in scored)
+        return [
+            (Document(id=doc_id, page_content=found[doc_id][0], metadata=found[doc_id][1]), score)
+            for doc_id, score in scored if doc_id in found
+        ]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k=k, filter=filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k=k, filter=filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities of unit vectors; map [-1, 1] onto [0, 1].
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, directory="./chroma_db/mmap", **kwargs):
+        store = cls(directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,114 @@
+import importlib.util
+import threading
+
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+# Model name and parameters for every LLM role in the graph, set in one place.
+MODEL_CONFIG = {
+    "agent": {"model": "gpt-4o", "temperature": 0},
+    "grade": {"model": "gpt-4o", "temperature": 0},
+    "rewrite": {"model": "gpt-4-0125-preview", "temperature": 0},
+    "generate": {"model": "gpt-4o", "temperature": 0},
+}
+EMBEDDING_CONFIG = {"model": "text-embedding-ada-002"}
+
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=120)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+# HTTP/2 needs the optional 'h2' package; without it httpx falls back to HTTP/1.1 keep-alive.
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class ModelRegistry:
+    """
+    Shared, lazily built model clients.
+
+    All chat models and the embedding client share one pooled sync and one pooled
+    async HTTP client, so connections (and their TLS sessions) are reused across
+    turns instead of being re-established by a fresh client per call. Factories can
+    be swapped out to run the graph against fake models.
+
+    Args:
+        model_config (dict): Role name -> ChatOpenAI parameters
+        embedding_config (dict): OpenAIEmbeddings parameters
+        chat_model_factory (callable): chat_model_factory(role, params) -> chat model
+        embeddings_factory (callable): embeddings_factory(params) -> embeddings
+        caches (dict): Role -> LangChain cache consulted before that role's model calls the provider
+    """
+
+    def __init__(self, model_config=None, embedding_config=None, chat_model_factory=None, embeddings_factory=None,
+                 caches=None):
+        self.model_config = model_config or MODEL_CONFIG
+        self.embedding_config = embedding_config or EMBEDDING_CONFIG
+        self.chat_model_factory = chat_model_factory or self._openai_chat_model
+        self.embeddings_factory = embeddings_factory or self._openai_embeddings
+        self.caches = dict(caches or {})
+        self._models = {}
+        self._embeddings = None
+        self._http_client = None
+        self._http_async_client = None
+        self._lock = threading.Lock()
+
+    @property
+    def http_client(self):
+        if self._http_client is None:
+            self._http_client = httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT, http2=HTTP2_AVAILABLE)
+        return self._http_client
+
+    @property
+    def http_async_client(self):
+        if self._http_async_client is None:
+            self._http_async_client = httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT, http2=HTTP2_AVAILABLE)
+        return self._http_async_client
+
+    def _openai_chat_model(self, role, params):
+        return ChatOpenAI(
+            streaming=True,
+            stream_usage=True,  # report token usage on streamed responses for the retrieval budget
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+            **params,
+        )
+
+    def _openai_embeddings(self, params):
+        return OpenAIEmbeddings(
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+            **params,
+        )
+
+    def get_chat_model(self, role):
+        with self._lock:
+            if role not in self._models:
+                model = self.chat_model_factory(role, dict(self.model_config[role]))
+                if role in self.caches:
+                    model.cache = self.caches[role]
+                self._models[role] = model
+            return self._models[role]
+
+    def use_caches(self, caches):
+        """
+        Cache the calls of the given roles, including models already built.
+        """
+        with self._lock:
+            self.caches.update(caches)
+            for role, model in self._models.items():
+                if role in caches:
+                    model.cache = caches[role]
+        return self
+
+    def get_embeddings(self):
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = self.embeddings_factory(dict(self.embedding_config))
+            return self._embeddings
+
+
+_default_registry = None
+
+
+def get_default_registry():
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = ModelRegistry()
+    return _default_registry
@@ -0,0 +1,347 @@
+"""
+Process-wide registry for the expensive objects behind the chatbot.
+
+Streamlit re-executes the app script on every widget click or chat message, but
+imported modules stay loaded for the life of the process. Everything built here
+(embedding client, Chroma handle, tools, compiled graph, checkpointer) is created
+once per process and handed to every session; a rerun only renders UI.
+"""
+
+import logging
+import os
+import threading
+
+from chromadb.api.client import SharedSystemClient
+from langchain_community.tools.tavily_search import TavilySearchResults
+
+from answer_cache import SemanticAnswerCache
+from chat_client import ChatServiceClient
+from checkpoint_store import SessionCheckpointStore
+from docs_watcher import DocsWatcher, submit_changes
+from embedding_cache import CachedEmbeddings, EmbeddingStore
+from graph_builder import build_graph
+from ingestion_worker import IngestionWorker
+from llm_cache import SQLiteLLMCache
+from model_registry import get_default_registry
+from retrieval_node import stub_web_search_tool
+from support_case_indexer import SupportCaseIndexer, SupportCaseStore, SupportPortalClient
+import telemetry
+from vectorstore_builder_class import VectorstoreBuilder
+
+DOCS_DIRECTORY = "./docs"
+PERSIST_DIRECTORY = "./chroma_db"
+# Vector index: "chroma", or "mmap" for the memory-mapped int8/float16 store under PERSIST_DIRECTORY/mmap.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+# Semantic answer cache: cosine similarity needed to reuse an answer, entry lifetime and size bound.
+ANSWER_CACHE_SIMILARITY = 0.92
+ANSWER_CACHE_TTL_SECONDS = 7 * 24 * 3600
+ANSWER_CACHE_MAX_ENTRIES = 1000
+
+# LLM call cache: roles whose identical temperature-0 calls are answered from disk, with the entries
+# kept per role. LLM_CACHE_BYPASS=1 turns it off.
+LLM_CACHE_POLICY = {"grade": 20000, "rewrite": 2000}
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "") == "1"
+
+# Conversation state: token budget for earlier turns and idle time before a session's thread is deleted.
+HISTORY_MAX_TOKENS = 4000
+THREAD_IDLE_TTL_SECONDS = 24 * 3600
+
+# Retrieval budget per turn: question rewrites, LLM tokens and wall-clock seconds before falling back.
+MAX_REWRITES = 2
+MAX_TURN_TOKENS = 20000
+TURN_DEADLINE_SECONDS = 60
+
+# Token budget for the deduplicated, merged chunks the generate node answers from.
+CONTEXT_MAX_TOKENS = 3000
+
+# Docs watcher: run inside the app process (WATCH_DOCS=0 disables) and how long a burst of changes must settle.
+WATCH_DOCS = os.getenv("WATCH_DOCS", "1") == "1"
+DOCS_WATCH_DEBOUNCE_SECONDS = 2.0
+
+# Support-portal case sync: concurrent logged-in sessions used by the offline indexer.
+SUPPORT_PORTAL_SESSIONS = 4
+
+# Web search: per-call timeout inside the retrieval node, and an offline stub for tests (WEB_SEARCH_STUB=1).
+WEB_SEARCH_TIMEOUT_SECONDS = 8
+WEB_SEARCH_STUB = os.getenv("WEB_SEARCH_STUB", "") == "1"
+
+# Chat service: the Streamlit app becomes a thin client when CHAT_SERVICE_URL is set. A process with
+# INDEX_IN_PROCESS=0 only serves from the index; another process (docs_watcher.py) keeps it current.
+CHAT_SERVICE_URL = os.getenv("CHAT_SERVICE_URL", "")
+CHAT_SERVICE_HOST = os.getenv("CHAT_SERVICE_HOST", "0.0.0.0")
+CHAT_SERVICE_PORT = int(os.getenv("CHAT_SERVICE_PORT", "8000"))
+CHAT_SERVICE_WORKERS = int(os.getenv("CHAT_SERVICE_WORKERS", "1"))
+INDEX_IN_PROCESS = os.getenv("INDEX_IN_PROCESS", "1") == "1"
+
+# Telemetry: log level (LOG_LEVEL=OFF silences logging) and the JSONL trace file of graph turns,
+# LLM calls and ingestion stages (TRACE_PATH= disables it), rotated once it reaches TRACE_MAX_BYTES.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+TRACE_PATH = os.getenv("TRACE_PATH", "./logs/trace.jsonl")
+TRACE_MAX_BYTES = 50_000_000
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+# Serialises writes to the index between startup/rescan indexing and the ingestion worker.
+_index_lock = threading.RLock()
+_resources = {}
+_indexed_fingerprint = None
+# Manifest mtime the current retrieval objects were built against, for processes that only read the index.
+_served_manifest_mtime = None
+
+
+def _get_or_create(name, factory):
+    with _lock:
+        if name not in _resources:
+            _resources[name] = factory()
+        return _resources[name]
+
+
+def docs_fingerprint(docs_directory=None):
+    """
+    Cheap snapshot of the docs folder (name, size, mtime) used to detect changes
+    without reading any file contents.
+    """
+    docs_directory = docs_directory or DOCS_DIRECTORY
+    if not os.path.isdir(docs_directory):
+        return ()
+    entries = []
+    with os.scandir(docs_directory) as it:
+        for entry in it:
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(entries))
+
+
+def get_model_registry():
+    return _get_or_create("model_registry", lambda: get_default_registry().use_caches(get_llm_caches()))
+
+
+def get_llm_caches():
+    """
+    {role: SQLiteLLMCache} for the roles in LLM_CACHE_POLICY, sharing one SQLite file.
+    """
+    def build():
+        os.makedirs(PERSIST_DIRECTORY, exist_ok=True)
+        db_path = os.path.join(PERSIST_DIRECTORY, "llm_cache.sqlite")
+        return {
+            role: SQLiteLLMCache(db_path, namespace=role, max_entries=max_entries, bypass=LLM_CACHE_BYPASS)
+            for role, max_entries in LLM_CACHE_POLICY.items()
+        }
+
+    return _get_or_create("llm_caches", build)
+
+
+def get_embeddings():
+    """
+    The provider's embeddings behind the content-addressed cache in PERSIST_DIRECTORY/embedding_cache.
+    """
+    return _get_or_create(
+        "embeddings",
+        lambda: CachedEmbeddings(get_model_registry().get_embeddings(), get_embedding_store()),
+    )
+
+
+def get_embedding_store():
+    return _get_or_create("embedding_store", lambda: EmbeddingStore(os.path.join(PERSIST_DIRECTORY, "embedding_cache")))
+
+
+def get_vectorstore_builder():
+    return _get_or_create(
+        "vectorstore_builder",
+        lambda: VectorstoreBuilder(
+            pdf_directory=DOCS_DIRECTORY,
+            persist_directory=PERSIST_DIRECTORY,
+            embedding=get_embeddings(),
+            vector_backend=VECTOR_BACKEND,
+        ),
+    )
+
+
+def ensure_index_current(progress_callback=None):
+    """
+    Run incremental indexing only when the docs folder changed since the last run
+    in this process. Returns True if indexing was performed.
+
+    Args:
+        progress_callback (callable): Optional progress_callback(file_name, done, total, elapsed_seconds)
+    """
+    global _indexed_fingerprint
+    worker = _resources.get("ingestion_worker")
+    if worker is not None and worker.busy():
+        # The worker is already applying the change; keep serving the current index and
+        # let a later rerun's cheap stat-only rescan confirm everything is indexed.
+        return False
+    with _index_lock:
+        fingerprint = docs_fingerprint()
+        if fingerprint == _indexed_fingerprint:
+            return False
+        get_vectorstore_builder().build_or_update_vectorstore(progress_callback=progress_callback)
+        _indexed_fingerprint = fingerprint
+        return True
+
+
+def _manifest_mtime():
+    try:
+        index_directory = PERSIST_DIRECTORY if VECTOR_BACKEND == "chroma" else os.path.join(PERSIST_DIRECTORY, VECTOR_BACKEND)
+        return os.stat(os.path.join(index_directory, "index_manifest.json")).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def reload_index_if_changed():
+    """
+    In a process that only reads the index, drop the retrieval objects once another
+    process has rewritten the index manifest, so the next get_graph() reopens the vectorstore.
+
+    Chroma keeps each collection's vector index in memory per process and does not
+    see vectors added by other processes until its client is recreated; the mmap
+    store only maps the rows that existed when it was opened. Returns True if the
+    objects were dropped.
+    """
+    global _served_manifest_mtime
+    mtime = _manifest_mtime()
+    with _lock:
+        if _served_manifest_mtime is None or "graph" not in _resources:
+            _served_manifest_mtime = mtime
+            return False
+        if mtime == _served_manifest_mtime:
+            return False
+        for name in ("graph", "retriever_tool", "table_lookup_tool", "answer_cache", "vectorstore_builder"):
+            _resources.pop(name, None)
+        SharedSystemClient.clear_system_cache()
+        _served_manifest_mtime = mtime
+        logger.info("index changed by another process, reopening the vectorstore")
+        return True
+
+
+def get_ingestion_worker():
+    return _get_or_create(
+        "ingestion_worker",
+        lambda: IngestionWorker(get_vectorstore_builder(), DOCS_DIRECTORY, lock=_index_lock).start(),
+    )
+
+
+def get_docs_watcher():
+    """
+    Start (once per process) a watcher that queues ingestion jobs for files changed in DOCS_DIRECTORY.
+    """
+    return _get_or_create(
+        "docs_watcher",
+        lambda: DocsWatcher(
+            DOCS_DIRECTORY,
+            submit_changes(get_ingestion_worker()),
+            debounce_seconds=DOCS_WATCH_DEBOUNCE_SECONDS,
+        ).start(),
+    )
+
+
+def get_retriever_tool():
+    builder = get_vectorstore_builder()
+    return _get_or_create(
+        "retriever_tool",
+        lambda: builder.get_retriever_tool(vectorstore=builder.get_vectorstore()),
+    )
+
+
+def get_table_lookup_tool():
+    return _get_or_create("table_lookup_tool", lambda: get_vectorstore_builder().table_store.as_tool())
+
+
+def get_support_case_indexer():
+    return _get_or_create(
+        "support_case_indexer",
+        lambda: SupportCaseIndexer(
+            SupportPortalClient(pool_size=SUPPORT_PORTAL_SESSIONS),
+            SupportCaseStore(os.path.join(PERSIST_DIRECTORY, "support_cases.sqlite")),
+            embedding=get_embeddings(),
+            persist_directory=PERSIST_DIRECTORY,
+        ),
+    )
+
+
+def get_support_case_tool():
+    return _get_or_create("support_case_tool", lambda: get_support_case_indexer().as_tool())
+
+
+def get_search_internet_tool():
+    ##############################################
+    # BT - Langchain community tools.
+    ##############################################
+    if WEB_SEARCH_STUB:
+        return _get_or_create("search_internet_tool", stub_web_search_tool)
+    return _get_or_create("search_internet_tool", lambda: TavilySearchResults(max_results=2))
+
+
+def get_checkpoint_store():
+    return _get_or_create(
+        "checkpoint_store",
+        lambda: SessionCheckpointStore(
+            os.path.join(PERSIST_DIRECTORY, "checkpoints.sqlite"),
+            idle_ttl_seconds=THREAD_IDLE_TTL_SECONDS,
+        ),
+    )
+
+
+def get_checkpointer():
+    return get_checkpoint_store().saver
+
+
+def get_answer_cache():
+    return _get_or_create(
+        "answer_cache",
+        lambda: SemanticAnswerCache(
+            os.path.join(PERSIST_DIRECTORY, "answer_cache.sqlite"),
+            embedding=get_embeddings(),
+            manifest=get_vectorstore_builder().manifest,
+            similarity_threshold=ANSWER_CACHE_SIMILARITY,
+            ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+            max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        ),
+    )
+
+
+def get_graph():
+    """
+    Return the compiled workflow graph, building it (and indexing ./docs, unless
+    INDEX_IN_PROCESS is off) on first use.
+    """
+    if INDEX_IN_PROCESS:
+        ensure_index_current()
+
+    def build():
+        retrieval_tools = [get_retriever_tool(), get_table_lookup_tool()]
+        web_search_tool = get_search_internet_tool()
+        return build_graph(
+            retrieval_tools,
+            [web_search_tool],
+            checkpointer=get_checkpointer(),
+            history_max_tokens=HISTORY_MAX_TOKENS,
+            model_registry=get_model_registry(),
+            max_rewrites=MAX_REWRITES,
+            max_turn_tokens=MAX_TURN_TOKENS,
+            turn_deadline_seconds=TURN_DEADLINE_SECONDS,
+            fallback_search_tool=web_search_tool,
+            tool_timeouts={web_search_tool.name: WEB_SEARCH_TIMEOUT_SECONDS},
+            context_max_tokens=CONTEXT_MAX_TOKENS,
+            callbacks=[get_graph_telemetry()],
+        )
+
+    return _get_or_create("graph", build)
+
+
+def get_graph_telemetry():
+    return _get_or_create("graph_telemetry", telemetry.GraphTelemetry)
+
+
+def configure_telemetry():
+    """
+    Set up logging and the trace file for this process; called once by each entry point.
+    """
+    telemetry.configure(log_level=LOG_LEVEL, trace_path=TRACE_PATH, trace_max_bytes=TRACE_MAX_BYTES)
+
+
+def get_chat_service_client():
+    return _get_or_create("chat_service_client", lambda: ChatServiceClient(CHAT_SERVICE_URL))
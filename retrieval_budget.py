@@ -0,0 +1,135 @@
+import logging
+import time
+
+from langchain_core.messages import AIMessage
+
+from conversation_history import latest_question
+from retrieval_node import format_web_results
+
+logger = logging.getLogger(__name__)
+
+NO_ANSWER = "I don’t know."
+
+
+def token_usage(message):
+    """
+    Total tokens reported for one LLM response, or 0 if the provider sent no usage.
+    """
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("total_tokens", 0) if usage else 0
+
+
+def turn_usage(state):
+    """
+    How many rewrite loops and LLM tokens the latest turn used, from the graph state.
+    """
+    return {
+        "rewrites": state.get("rewrites", 0),
+        "tokens": state.get("tokens_used", 0) - state.get("turn_start_tokens", 0),
+    }
+
+
+class RetrievalBudget:
+    """
+    Per-turn limits on the rewrite -> agent -> use_tools -> grade_documents loop.
+
+    A turn may rewrite the question at most `max_rewrites` times, spend at most
+    `max_tokens` LLM tokens and run for at most `deadline_seconds`. Once any limit
+    is reached, a turn whose documents were judged irrelevant goes to the
+    fallback node instead of looping again. The fallback answers from a web
+    search if one is configured, otherwise with an explicit "I don't know".
+    """
+
+    def __init__(self, max_rewrites=2, max_tokens=20000, deadline_seconds=60, generate_agent=None, web_search_tool=None):
+        self.max_rewrites = max_rewrites
+        self.max_tokens = max_tokens
+        self.deadline_seconds = deadline_seconds
+        self.generate_agent = generate_agent
+        self.web_search_tool = web_search_tool
+
+    def start_turn(self, state):
+        """
+        Graph node: reset the loop counters and start the clock for a new turn.
+        """
+        return {
+            "rewrites": 0,
+            "sources": [],
+            "turn_start_tokens": state.get("tokens_used", 0),
+            "deadline": time.time() + self.deadline_seconds,
+        }
+
+    def exhausted(self, state):
+        """
+        The reason the turn's budget is used up, or None while it still has room.
+        """
+        usage = turn_usage(state)
+        if usage["rewrites"] >= self.max_rewrites:
+            return f"{usage['rewrites']} rewrites"
+        if usage["tokens"] >= self.max_tokens:
+            return f"{usage['tokens']} tokens"
+        if time.time() >= state.get("deadline", float("inf")):
+            return "deadline"
+        return None
+
+    def guard(self, decide):
+        """
+        Wrap a 'generate'/'rewrite' routing function so 'rewrite' becomes 'fallback' once the budget is spent.
+        """
+        def route(state):
+            decision = decide(state)
+            if decision == "rewrite":
+                reason = self.exhausted(state)
+                if reason:
+                    logger.info("retrieval budget exhausted (%s), falling back", reason)
+                    return "fallback"
+            return decision
+
+        return route
+
+    def _web_inputs(self, question, results):
+        if isinstance(results, str) or not results:
+            return None, []
+        chunks = [format_web_results([result]) for result in results]
+        return self.generate_agent.build_inputs(question, [chunks])
+
+    def fallback(self, state):
+        """
+        Graph node: answer once the retrieval budget is spent.
+
+        Args:
+            state (messages): The current state
+
+        Returns:
+            dict: The updated state with the fallback answer appended to messages
+        """
+        logger.debug("fallback called")
+        if self.web_search_tool is not None and self.generate_agent is not None:
+            question = latest_question(state["messages"])
+            try:
+                results = self.web_search_tool.invoke(question)
+            except Exception as e:
+                logger.warning("fallback web search failed: %s", e)
+                results = None
+            inputs, references = self._web_inputs(question, results)
+            if inputs:
+                response = self.generate_agent.rag_chain.invoke(inputs)
+                return {"messages": [response], "tokens_used": token_usage(response), "sources": references}
+        return {"messages": [AIMessage(content=NO_ANSWER)]}
+
+    async def afallback(self, state):
+        """
+        Async version of fallback().
+        """
+        logger.debug("fallback called (async)")
+        if self.web_search_tool is not None and self.generate_agent is not None:
+            question = latest_question(state["messages"])
+            try:
+                results = await self.web_search_tool.ainvoke(question)
+            except Exception as e:
+                logger.warning("fallback web search failed: %s", e)
+                results = None
+            inputs, references = self._web_inputs(question, results)
+            if inputs:
+                response = await self.generate_agent.rag_chain.ainvoke(inputs)
+                return {"messages": [response], "tokens_used": token_usage(response), "sources": references}
+        return {"messages": [AIMessage(content=NO_ANSWER)]}
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import Tool
+
+logger = logging.getLogger(__name__)
+
+# Web results carry their own header so they are never mistaken for internal documents.
+WEB_SOURCE_HEADER = "[Web source: {url}]"
+
+
+def format_web_results(results):
+    """
+    Render web search results as labelled chunks, one per result.
+    """
+    if isinstance(results, str):
+        return results
+    return "\n\n".join(
+        WEB_SOURCE_HEADER.format(url=r.get("url", "unknown")) + "\n" + str(r.get("content", "")) for r in results or []
+    )
+
+
+def stub_web_search_tool(results=None, name="tavily_search_results_json"):
+    """
+    Offline stand-in for the Tavily tool, returning fixed results without a network call.
+    """
+    results = results or [{"url": "https://example.com/stub", "content": "Stub web search result."}]
+    return Tool(
+        name=name,
+        func=lambda query: results,
+        description="A search engine. Useful for when you need to answer questions about current events. Input should be a search query.",
+    )
+
+
+class RetrievalNode:
+    """
+    Executes every tool call of the agent's last message concurrently.
+
+    Internal retrieval (Chroma/BM25, spreadsheet lookup) and web search run in
+    parallel, each under its own timeout, so asking for both costs one round trip
+    instead of two. Web results are labelled with WEB_SOURCE_HEADER; internal
+    chunks keep their "[Source: file]" headers. A tool that fails or times out
+    yields an error ToolMessage and does not hold up the others.
+
+    Each turn gets its own worker threads, one per tool call, so concurrent
+    sessions never queue behind each other and a timeout counts from the moment
+    the call starts. A timed-out call is abandoned: its thread finishes in the
+    background without occupying a worker that a later turn needs.
+
+    Args:
+        tools (list): Every tool the agent may call
+        web_tools (list): The subset of `tools` that searches the web
+        timeouts (dict): Per-tool timeout in seconds, keyed by tool name
+        default_timeout (float): Timeout for tools not listed in `timeouts`
+    """
+
+    def __init__(self, tools, web_tools=(), timeouts=None, default_timeout=20):
+        self.tools = {tool.name: tool for tool in tools}
+        self.web_tool_names = {tool.name for tool in web_tools}
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+
+    def _timeout(self, name):
+        return self.timeouts.get(name, self.default_timeout)
+
+    def _tool_message(self, call, content, status="success"):
+        if call["name"] in self.web_tool_names and status == "success":
+            content = format_web_results(content)
+        return ToolMessage(content=str(content), name=call["name"], tool_call_id=call["id"], status=status)
+
+    def _error_message(self, call, error):
+        logger.warning("tool %s failed: %s", call["name"], error)
+        return self._tool_message(call, f"Error: {call['name']} failed: {error}", status="error")
+
+    def _run(self, call):
+        tool = self.tools.get(call["name"])
+        if tool is None:
+            raise ValueError(f"{call['name']} is not a valid tool, try one of {sorted(self.tools)}")
+        return tool.invoke(call["args"])
+
+    def _submit(self, executor, call):
+        """
+        Submit one tool call. Returns its future, an Event set when it starts and a list that receives its start time.
+        """
+        started, started_at = threading.Event(), []
+
+        def run():
+            started_at.append(time.monotonic())
+            started.set()
+            return self._run(call)
+
+        return executor.submit(run), started, started_at
+
+    def _result(self, call, future, started, started_at):
+        started.wait()
+        remaining = max(0.0, started_at[0] + self._timeout(call["name"]) - time.monotonic())
+        try:
+            return self._tool_message(call, future.result(timeout=remaining))
+        except TimeoutError:
+            return self._error_message(call, f"timed out after {self._timeout(call['name'])}s")
+        except Exception as e:
+            return self._error_message(call, e)
+
+    def retrieve(self, state):
+        """
+        Graph node: run the agent's tool calls in parallel.
+
+        Args:
+            state (messages): The current state
+
+        Returns:
+            dict: One ToolMessage per tool call, in call order
+        """
+        logger.debug("retrieve called")
+        calls = state["messages"][-1].tool_calls
+        started = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=max(len(calls), 1), thread_name_prefix="retrieval")
+        try:
+            submitted = [self._submit(executor, call) for call in calls]
+            results = [self._result(call, *run) for call, run in zip(calls, submitted)]
+        finally:
+            # Do not wait for timed-out calls; their threads exit once the tool returns.
+            executor.shutdown(wait=False, cancel_futures=True)
+        logger.debug("retrieved %d tool results in %.2fs", len(calls), time.monotonic() - started)
+        return {"messages": results}
+
+    async def _arun(self, call):
+        try:
+            tool = self.tools.get(call["name"])
+            if tool is None:
+                raise ValueError(f"{call['name']} is not a valid tool, try one of {sorted(self.tools)}")
+            content = await asyncio.wait_for(tool.ainvoke(call["args"]), self._timeout(call["name"]))
+            return self._tool_message(call, content)
+        except asyncio.TimeoutError:
+            return self._error_message(call, f"timed out after {self._timeout(call['name'])}s")
+        except Exception as e:
+            return self._error_message(call, e)
+
+    async def aretrieve(self, state):
+        """
+        Async version of retrieve().
+        """
+        logger.debug("retrieve called (async)")
+        calls = state["messages"][-1].tool_calls
+        return {"messages": list(await asyncio.gather(*(self._arun(call) for call in calls)))}
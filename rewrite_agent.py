@@ -1,9 +1,27 @@
-from langchain_openai import ChatOpenAI
+import logging
+
 from langchain_core.messages import HumanMessage
+from conversation_history import latest_question
+from model_registry import get_default_registry
+from retrieval_budget import token_usage
+
+logger = logging.getLogger(__name__)
+
 
 class RewriteAgent:
-    def __init__(self):
-        pass
+    def __init__(self, model=None):
+        self.model = model or get_default_registry().get_chat_model("rewrite")
+
+    def _build_messages(self, messages):
+        question = latest_question(messages)
+
+        msg = [
+            HumanMessage(
+                content=f"""
+Look at the input and try to reason about the underlying semantic intent / meaning.\n\nHere is the initial question:\n-------\n{question}\n-------\nFormulate an improved question: """,
+            )
+        ]
+        return msg
 
     def rewrite(self, state):
         """
@@ -13,21 +31,16 @@ class RewriteAgent:
             state (messages): The current state
 
         Returns:
-            dict: The updated state with re-phrased question
+            dict: The updated state with re-phrased question and the turn's rewrite count
         """
-        print('BT - rewrite called...')
-        print("---TRANSFORM QUERY---")
-        messages = state["messages"]
-        question = messages[0].content
-
-        msg = [
-            HumanMessage(
-                content=f"""
-Look at the input and try to reason about the underlying semantic intent / meaning.\n\nHere is the initial question:\n-------\n{question}\n-------\nFormulate an improved question: """,
-            )
-        ]
+        logger.debug("rewrite called")
+        response = self.model.invoke(self._build_messages(state["messages"]))
+        return {"messages": [response], "rewrites": state.get("rewrites", 0) + 1, "tokens_used": token_usage(response)}
 
-        # Grader
-        model = ChatOpenAI(temperature=0, model="gpt-4-0125-preview", streaming=True)
-        response = model.invoke(msg)
-        return {"messages": [response]}
+    async def arewrite(self, state):
+        """
+        Async version of rewrite().
+        """
+        logger.debug("rewrite called (async)")
+        response = await self.model.ainvoke(self._build_messages(state["messages"]))
+        return {"messages": [response], "rewrites": state.get("rewrites", 0) + 1, "tokens_used": token_usage(response)}
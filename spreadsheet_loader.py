@@ -0,0 +1,219 @@
+import json
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from langchain.schema import Document
+from langchain_core.tools import Tool
+
+ROW_SEPARATOR = " | "
+
+
+def _column_labels(columns):
+    # Header-less columns come back from pandas as "Unnamed: 3"; keep only their values.
+    return ["" if str(c).startswith("Unnamed:") else str(c).strip() for c in columns]
+
+
+def rows_to_text(df):
+    """
+    Build one "column: value | column: value" string per row without iterating rows in Python.
+    """
+    labels = _column_labels(df.columns)
+    values = df.astype(str).where(df.notna(), "")
+    parts = []
+    for label, column in zip(labels, values.columns):
+        cells = values[column].str.strip()
+        prefix = f"{label}: " if label else ""
+        parts.append(np.where(cells != "", prefix + cells + ROW_SEPARATOR, ""))
+    if not parts:
+        return pd.Series([], dtype=str)
+    joined = pd.DataFrame(np.column_stack(parts), index=df.index).sum(axis=1)
+    return joined.str.slice(0, -len(ROW_SEPARATOR)).where(joined != "", "")
+
+
+def group_rows(token_counts, max_tokens):
+    """
+    Greedily group consecutive rows so each group stays under max_tokens.
+
+    Returns:
+        list: (start, end) index pairs, end exclusive
+    """
+    groups = []
+    start, used = 0, 0
+    for i, count in enumerate(token_counts):
+        if i > start and used + count > max_tokens:
+            groups.append((start, i))
+            start, used = i, 0
+        used += count
+    if start < len(token_counts):
+        groups.append((start, len(token_counts)))
+    return groups
+
+
+def load_spreadsheet(file_path, max_chunk_tokens=500, table_store_path=None):
+    """
+    Read every sheet of a workbook into column-aware, token-bounded Documents.
+
+    Each row is rendered as "column: value" pairs, consecutive rows are packed
+    into chunks of at most max_chunk_tokens, and every chunk carries its sheet
+    name and the Excel row range it covers. When table_store_path is given the
+    parsed sheets are also written to SQLite for exact lookups.
+
+    Returns:
+        list: Documents that are already chunked and need no further splitting
+    """
+    filename = os.path.basename(file_path)
+    sheets = pd.read_excel(file_path, sheet_name=None)
+    if table_store_path:
+        SpreadsheetTableStore(table_store_path).save_workbook(file_path, sheets)
+
+    docs = []
+    for sheet_name, df in sheets.items():
+        df = df.dropna(how="all")
+        if df.empty:
+            continue
+        row_text = rows_to_text(df)
+        # Rough token count (~4 characters per token) keeps grouping fully vectorized.
+        token_counts = (row_text.str.len() // 4 + 1).to_numpy()
+        # Excel row numbers: the header is row 1, so DataFrame index 0 is row 2.
+        excel_rows = df.index.to_numpy() + 2
+        for start, end in group_rows(token_counts, max_chunk_tokens):
+            lines = [line for line in row_text.iloc[start:end] if line]
+            if not lines:
+                continue
+            row_start, row_end = int(excel_rows[start]), int(excel_rows[end - 1])
+            header = f"Sheet: {sheet_name} (rows {row_start}-{row_end})"
+            docs.append(
+                Document(
+                    page_content=header + "\n" + "\n".join(lines),
+                    metadata={
+                        "source": filename,
+                        "file_name": filename,
+                        "sheet": str(sheet_name),
+                        "row_start": row_start,
+                        "row_end": row_end,
+                    },
+                )
+            )
+    return docs
+
+
+def _table_name(file_key, sheet_name):
+    return "t_" + re.sub(r"\W+", "_", f"{os.path.basename(file_key)}_{sheet_name}").strip("_").lower()
+
+
+class SpreadsheetTableStore:
+    """
+    SQLite copy of every indexed sheet so questions like "what bands does the
+    MTCDT-L4G1 support" can be answered by an exact row lookup instead of an
+    embedding search.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS _tables "
+                    "(table_name TEXT PRIMARY KEY, file_key TEXT, source TEXT, sheet TEXT, columns TEXT)"
+                )
+                yield conn
+        finally:
+            conn.close()
+
+    def save_workbook(self, file_key, sheets):
+        file_key = os.path.normpath(file_key)
+        with self._connect() as conn:
+            self._drop_tables(conn, file_key)
+            for sheet_name, df in sheets.items():
+                df = df.dropna(how="all")
+                if df.empty:
+                    continue
+                table_name = _table_name(file_key, sheet_name)
+                labels = _column_labels(df.columns)
+                frame = df.astype(str).where(df.notna(), None)
+                frame.columns = [f"c{i}" for i in range(len(labels))]
+                frame.insert(0, "excel_row", df.index.to_numpy() + 2)
+                frame.to_sql(table_name, conn, if_exists="replace", index=False)
+                conn.execute(
+                    "INSERT OR REPLACE INTO _tables VALUES (?, ?, ?, ?, ?)",
+                    (table_name, file_key, os.path.basename(file_key), str(sheet_name), json.dumps(labels)),
+                )
+
+    def _drop_tables(self, conn, file_key):
+        rows = conn.execute("SELECT table_name FROM _tables WHERE file_key = ?", (file_key,)).fetchall()
+        for (table_name,) in rows:
+            conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+        conn.execute("DELETE FROM _tables WHERE file_key = ?", (file_key,))
+
+    def remove(self, file_key):
+        if not os.path.exists(self.db_path):
+            return
+        with self._connect() as conn:
+            self._drop_tables(conn, os.path.normpath(file_key))
+
+    def lookup(self, query, limit=20):
+        """
+        Return rows in which every whitespace-separated term of `query` appears in some cell.
+
+        SKUs such as "MTCDT-L4G1" are listed in the band table by their radio
+        designation ("L4G1"), so if nothing matches, hyphenated terms are retried
+        with only their last segment.
+        """
+        terms = [t for t in query.split() if t]
+        if not terms or not os.path.exists(self.db_path):
+            return []
+        results = self._lookup_terms(terms, limit)
+        if not results and any("-" in t for t in terms):
+            results = self._lookup_terms([t.rsplit("-", 1)[-1] or t for t in terms], limit)
+        return results
+
+    def _lookup_terms(self, terms, limit):
+        results = []
+        with self._connect() as conn:
+            catalog = conn.execute("SELECT table_name, source, sheet, columns FROM _tables").fetchall()
+            for table_name, source, sheet, columns_json in catalog:
+                labels = json.loads(columns_json)
+                cells = [f"c{i}" for i in range(len(labels))]
+                any_cell = "(" + " OR ".join(f'"{c}" LIKE ? ESCAPE \'\\\'' for c in cells) + ")"
+                where = " AND ".join([any_cell] * len(terms))
+                params = []
+                for term in terms:
+                    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                    params.extend([f"%{escaped}%"] * len(cells))
+                rows = conn.execute(
+                    f'SELECT excel_row, {", ".join(cells)} FROM "{table_name}" WHERE {where} LIMIT ?',
+                    params + [limit - len(results)],
+                ).fetchall()
+                for row in rows:
+                    pairs = [
+                        f"{label}: {value}" if label else str(value)
+                        for label, value in zip(labels, row[1:])
+                        if value is not None
+                    ]
+                    results.append(f"[{source} / {sheet} / row {row[0]}] " + ROW_SEPARATOR.join(pairs))
+                if len(results) >= limit:
+                    break
+        return results
+
+    def as_tool(self):
+        def lookup_text(query):
+            rows = self.lookup(query)
+            return "\n".join(rows) if rows else "No matching spreadsheet rows found."
+
+        return Tool(
+            name="spreadsheet_table_lookup",
+            func=lookup_text,
+            description=(
+                "Exact lookup in indexed spreadsheets such as the Multitech Device Cellular Band & Frequency Table. "
+                "Input one or more exact terms (e.g. a model like 'MTCDT-L4G1' or a band like 'B13'); "
+                "returns every row containing all of them, with the source file, sheet and row number."
+            ),
+        )
@@ -0,0 +1,260 @@
+import re
+from collections import Counter
+
+from langchain_core.documents import Document
+
+from embedding_pipeline import estimate_tokens
+
+# Bump when chunk boundaries or chunk metadata change, so existing files are re-chunked under new chunk IDs.
+CHUNKER_VERSION = "structured-3"
+MAX_CHUNK_TOKENS = 800
+# Consecutive small sections are packed together until a chunk reaches this size.
+TARGET_CHUNK_TOKENS = 300
+
+# "AT+FOTA Firmware over the Air", "AT&W Save Configuration": a command followed by its title.
+AT_ENTRY_PATTERN = re.compile(r"^AT(?:[+&%$#^][A-Z0-9&+]*)?\s+[A-Z][^=:?]{2,80}$")
+MARKDOWN_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+)$")
+UNDERLINE_PATTERN = re.compile(r"^[=\-~]{3,}\s*$")
+# Shell commands, curl calls, JSON, HTTP responses and AT command/response examples.
+CODE_LINE_PATTERN = re.compile(
+    r"""^(
+        \$\s | curl\s | [{}\[\]] | "[^"]+"\s*: | HTTP/\d | [A-Z]\w*-[\w-]+:\s\S
+        | AT(?:[+&%$#^][A-Z0-9&+]*)?(?:[=?].*)?$ | OK$ | ERROR$ | help\sAT
+    )""",
+    re.VERBOSE,
+)
+
+
+def _normalize(line):
+    return re.sub(r"\s+", " ", re.sub(r"\d+", "#", line.lower())).strip()
+
+
+def _is_all_caps(line):
+    letters = [c for c in line if c.isalpha()]
+    return len(letters) >= 3 and all(c.isupper() for c in letters)
+
+
+def _is_heading(line):
+    """
+    Heuristic for headings in extracted PDF text: a short, title-cased line without
+    sentence punctuation and with few numbers (which would suggest a table row).
+    """
+    words = line.split()
+    if not 1 <= len(words) <= 8 or len(line) > 70 or line[-1] in ".,;:" or not line[0].isupper():
+        return False
+    if sum(any(c.isdigit() for c in w) for w in words) > len(words) * 0.3:
+        return False
+    alpha_words = [w for w in words if w[0].isalpha()]
+    return bool(alpha_words) and sum(w[0].isupper() for w in alpha_words) >= 0.6 * len(alpha_words)
+
+
+def strip_page_furniture(pages):
+    """
+    Remove running headers and footers from PDF pages.
+
+    Returns [(page_number, chapter, lines)], where `chapter` is the all-caps running
+    header naming the chapter the page belongs to (or None).
+    """
+    edges = [
+        [line.strip() for line in text.splitlines() if line.strip()][:3]
+        + [line.strip() for line in text.splitlines() if line.strip()][-2:]
+        for _, text in pages
+    ]
+    counts = Counter(norm for lines in edges for norm in {_normalize(line) for line in lines})
+    threshold = max(3, int(len(pages) * 0.3))
+
+    result = []
+    for (page_number, text), page_edges in zip(pages, edges):
+        lines = [line.strip() for line in text.splitlines()]
+        chapter = None
+        for line in page_edges[:2]:
+            if _is_all_caps(line) and counts[_normalize(line)] >= 2 and len(pages) >= 3:
+                chapter = line
+                break
+        furniture = {
+            line for line in page_edges
+            if (counts[_normalize(line)] >= threshold and len(pages) >= 3) or line == chapter
+        }
+        # Only the page's first and last lines can be furniture; the same text in the body is kept.
+        content = [i for i, line in enumerate(lines) if line]
+        edge_positions = set(content[:3] + content[-2:])
+        result.append(
+            (page_number, chapter, [line for i, line in enumerate(lines) if not (i in edge_positions and line in furniture)])
+        )
+    return result
+
+
+class _Section:
+    def __init__(self, chapter, path):
+        self.chapter = chapter
+        self.path = path
+        self.units = []  # [(text, page_number)], each unit is kept whole when possible
+
+    @property
+    def tokens(self):
+        return sum(estimate_tokens(text) for text, _ in self.units)
+
+
+def _sections(pages):
+    """
+    Walk the page lines and group them into sections, each made of atomic units
+    (a line of prose or a whole code/example block).
+    """
+    sections = []
+    chapter, heading = None, None
+    current = None
+    in_command_entry = False
+
+    def start(path):
+        nonlocal current
+        current = _Section(chapter, path)
+        sections.append(current)
+
+    for page_number, page_chapter, lines in pages:
+        if page_chapter and page_chapter != chapter:
+            chapter, heading, in_command_entry = page_chapter, None, False
+            start([chapter])
+        code_block = None
+        for i, line in enumerate(lines):
+            next_line = lines[i + 1] if i + 1 < len(lines) else ""
+            if UNDERLINE_PATTERN.match(line):
+                continue
+            markdown = MARKDOWN_HEADING_PATTERN.match(line)
+            is_command = bool(AT_ENTRY_PATTERN.match(line))
+            is_underlined = bool(line) and bool(UNDERLINE_PATTERN.match(next_line))
+            is_heading = (
+                markdown or is_command or is_underlined
+                or (not in_command_entry and _is_heading(line) and not CODE_LINE_PATTERN.match(line))
+            )
+            if current is None or (is_heading and line):
+                code_block = None
+                if is_heading and line:
+                    heading = markdown.group(2) if markdown else line
+                    in_command_entry = is_command
+                start([part for part in (chapter, heading) if part])
+                if is_heading and line:
+                    current.units.append((line, page_number))
+                    continue
+            if not line:
+                code_block = None
+                if current.units and current.units[-1][0] != "":
+                    current.units.append(("", page_number))
+                continue
+            if CODE_LINE_PATTERN.match(line) or (code_block is not None and lines[i].startswith((" ", "\t"))):
+                if code_block is None:
+                    code_block = len(current.units)
+                    current.units.append((line, page_number))
+                else:
+                    text, first_page = current.units[code_block]
+                    current.units[code_block] = (text + "\n" + line, first_page)
+                continue
+            code_block = None
+            current.units.append((line, page_number))
+    return [section for section in sections if any(text for text, _ in section.units)]
+
+
+def _split_large(text, max_tokens):
+    """
+    Split a single unit larger than max_tokens at line boundaries.
+    """
+    pieces, current = [], []
+    for line in text.split("\n"):
+        if current and estimate_tokens("\n".join(current + [line])) > max_tokens:
+            pieces.append("\n".join(current))
+            current = []
+        current.append(line)
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+
+class _ChunkBuilder:
+    def __init__(self, metadata, max_tokens, target_tokens, paged=True):
+        self.metadata = metadata
+        self.paged = paged
+        self.max_tokens = max_tokens
+        self.target_tokens = target_tokens
+        self.chunks = []
+        self._reset()
+
+    def _reset(self):
+        self.lines, self.pages, self.paths, self.tokens = [], [], [], 0
+        self.chapter = None
+
+    def flush(self):
+        text = "\n".join(self.lines).strip()
+        if text:
+            metadata = dict(self.metadata)
+            path = self.paths[0] if self.paths else []
+            metadata.update(
+                section_path=" > ".join(path),
+                sections=" | ".join(" > ".join(p) for p in self.paths),
+                chunk_index=len(self.chunks),
+            )
+            if self.paged:
+                metadata.update(page=min(self.pages), page_start=min(self.pages) + 1, page_end=max(self.pages) + 1)
+            self.chunks.append(Document(page_content=text, metadata=metadata))
+        self._reset()
+
+    def add(self, text, page_number, path, tokens):
+        if path not in self.paths:
+            self.paths.append(path)
+        self.lines.append(text)
+        self.pages.append(page_number)
+        self.tokens += tokens
+
+    def add_section(self, section):
+        tokens = section.tokens
+        new_chapter = section.chapter != self.chapter
+        if self.tokens and (new_chapter or self.tokens >= self.target_tokens or self.tokens + tokens > self.max_tokens):
+            self.flush()
+        self.chapter = section.chapter
+        if tokens <= self.max_tokens:
+            for text, page_number in section.units:
+                self.add(text, page_number, section.path, estimate_tokens(text))
+            return
+        # Oversized section: split between units, repeating the section path on continuation chunks.
+        header = " > ".join(section.path)
+        for text, page_number in section.units:
+            for piece in _split_large(text, self.max_tokens) if estimate_tokens(text) > self.max_tokens else [text]:
+                piece_tokens = estimate_tokens(piece)
+                if self.tokens and self.tokens + piece_tokens > self.max_tokens:
+                    self.flush()
+                    self.chapter = section.chapter
+                    if header:
+                        self.add(f"[{header}]", page_number, section.path, estimate_tokens(header))
+                self.add(piece, page_number, section.path, piece_tokens)
+
+
+def chunk_documents(docs, max_tokens=MAX_CHUNK_TOKENS, target_tokens=TARGET_CHUNK_TOKENS):
+    """
+    Split loaded pages of one file into structure-aware chunks without overlap.
+
+    Chunks break at headings, AT command entries ("AT+FOTA Firmware over the
+    Air") and chapter changes, never inside a code, curl or command/response
+    example block unless that block alone exceeds `max_tokens`. Running page
+    headers and footers are dropped. Small neighbouring sections are packed
+    together up to `target_tokens`. Each chunk carries `section_path` (first
+    section), `sections` (all sections in the chunk), `page_start`/`page_end`
+    (1-based, only when the loader reported pages) and `chunk_index` (position
+    in the file) alongside the loader's metadata.
+
+    Args:
+        docs (list[Document]): Pages of a single file, in order, as returned by the loader
+        max_tokens (int): Hard upper bound per chunk
+        target_tokens (int): Size at which a chunk stops absorbing further sections
+
+    Returns:
+        list[Document]: The chunks
+    """
+    if not docs:
+        return []
+    pages = [(doc.metadata.get("page", 0), doc.page_content) for doc in docs]
+    metadata = {k: v for k, v in docs[0].metadata.items() if k not in ("page", "page_label")}
+    # Text files load as one document without a page; their chunks must not cite "page 1".
+    paged = any("page" in doc.metadata for doc in docs)
+    builder = _ChunkBuilder(metadata, max_tokens, target_tokens, paged=paged)
+    for section in _sections(strip_page_furniture(pages)):
+        builder.add_section(section)
+    builder.flush()
+    return builder.chunks
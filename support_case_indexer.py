@@ -0,0 +1,406 @@
+import hashlib
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import lxml.html
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.tools import Tool
+
+logger = logging.getLogger(__name__)
+
+PORTAL_BASE_URL = os.getenv("SUPPORT_PORTAL_URL", "https://support.multitech.com/support/")
+# The portal's login form uses obfuscated field names: 'pas7urd' carries the user name, 'u32namb4' the password.
+PORTAL_USERNAME = os.getenv("SUPPORT_PORTAL_USERNAME")
+PORTAL_PASSWORD = os.getenv("SUPPORT_PORTAL_PASSWORD")
+CASE_LINK_MARKER = "case.html?action=view&id="
+CASE_COLLECTION = "support-cases"
+
+DATE_PATTERN = re.compile(
+    r"\d{4}-\d{2}-\d{2}(?:[ T]\d{1,2}:\d{2}(?::\d{2})?)?"
+    r"|\d{1,2}/\d{1,2}/\d{4}(?: \d{1,2}:\d{2}(?::\d{2})?(?: ?[AP]M)?)?",
+    re.IGNORECASE,
+)
+DATE_FORMATS = (
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M", "%Y-%m-%d",
+    "%m/%d/%Y %I:%M:%S %p", "%m/%d/%Y %I:%M %p", "%m/%d/%Y %I:%M%p", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%m/%d/%Y",
+)
+
+
+def parse_timestamp(text):
+    """
+    Normalise a portal date string to sortable ISO format, or None if it is not a date.
+    """
+    text = " ".join(text.split())
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_case_list(html, page_url):
+    """
+    Parse one dashboard page into [(case_id, case_url, updated)] and the last page number.
+
+    `updated` is the latest date shown in the case's row, or None if the row shows none.
+    """
+    tree = lxml.html.fromstring(html)
+    cases, seen = [], set()
+    for link in tree.xpath("//a[@href]"):
+        href = link.get("href")
+        if CASE_LINK_MARKER not in href:
+            continue
+        case_url = urllib.parse.urljoin(page_url, href)
+        case_id = urllib.parse.parse_qs(urllib.parse.urlparse(case_url).query).get("id", [None])[0]
+        if not case_id or case_id in seen:
+            continue
+        seen.add(case_id)
+        row = link.xpath("ancestor::tr[1]")
+        dates = [parse_timestamp(m) for m in DATE_PATTERN.findall(row[0].text_content())] if row else []
+        dates = [d for d in dates if d]
+        cases.append((case_id, case_url, max(dates) if dates else None))
+
+    last_page = None
+    for link in tree.xpath("//a"):
+        text = link.text_content().strip()
+        if text.startswith("Last("):
+            try:
+                last_page = int(text.strip("Last() "))
+            except ValueError:
+                logger.warning("cannot parse last page number: %s", text)
+            break
+    return cases, last_page
+
+
+def parse_case_description(html):
+    """
+    The text of a case page's "Description:" work item, or None if it has none.
+    """
+    tree = lxml.html.fromstring(html)
+    for row_class in ("unreadworkitem", "readworkitem"):
+        for tr in tree.xpath(f"//tr[contains(concat(' ', normalize-space(@class), ' '), ' {row_class} ')]"):
+            tds = tr.xpath("./td")
+            if tds and tds[0].text_content().strip() == "Description:" and len(tds) > 1:
+                div = tds[1].find(".//div")
+                if div is not None:
+                    return "\n".join(text.strip() for text in div.itertext() if text.strip())
+    return None
+
+
+def description_hash(description):
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+
+class SupportPortalClient:
+    """
+    Logged-in sessions against the support portal, shared by a bounded pool of workers.
+
+    Args:
+        base_url (str): Portal root; 'login.html', 'dashboard.html' and case links resolve against it
+        username (str): Portal user name, from SUPPORT_PORTAL_USERNAME by default
+        password (str): Portal password, from SUPPORT_PORTAL_PASSWORD by default
+        pool_size (int): Number of concurrent logged-in sessions
+    """
+
+    def __init__(self, base_url=PORTAL_BASE_URL, username=PORTAL_USERNAME, password=PORTAL_PASSWORD, pool_size=4, timeout=30):
+        self.base_url = base_url
+        self.login_url = urllib.parse.urljoin(base_url, "login.html")
+        self.dashboard_url = urllib.parse.urljoin(base_url, "dashboard.html")
+        self.username = username
+        self.password = password
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._sessions = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _login(self):
+        if not self.username or not self.password:
+            raise RuntimeError(
+                "Support portal credentials are not set; export SUPPORT_PORTAL_USERNAME and SUPPORT_PORTAL_PASSWORD."
+            )
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        payload = {"pas7urd": self.username, "u32namb4": self.password, "login": "Login"}
+        response = session.post(self.login_url, data=payload, timeout=self.timeout)
+        if "Dashboard" not in response.text:
+            raise RuntimeError("Support portal login failed.")
+        return session
+
+    @contextmanager
+    def session(self):
+        """
+        Borrow a logged-in session, logging in a new one while the pool is below pool_size.
+        """
+        try:
+            session = self._sessions.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.pool_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    session = self._login()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                session = self._sessions.get()
+        try:
+            yield session
+        finally:
+            self._sessions.put(session)
+
+    def list_page(self, page, row_count=50, search_term=""):
+        payload = {
+            "caseAJAX": "true",
+            "tabselect": "casesclosed",
+            "filter": "all",
+            "caseorder": "updated",
+            "page": page,
+            "row_count": row_count,
+            "searchinput": search_term,
+        }
+        with self.session() as session:
+            response = session.post(self.dashboard_url, data=payload, timeout=self.timeout)
+        return parse_case_list(response.text, self.dashboard_url)
+
+    def fetch_description(self, case_url):
+        with self.session() as session:
+            response = session.get(case_url, timeout=self.timeout)
+        return parse_case_description(response.text)
+
+    def close(self):
+        while not self._sessions.empty():
+            self._sessions.get_nowait().close()
+        self._created = 0
+
+
+class SupportCaseStore:
+    """
+    SQLite store of closed support cases keyed by case ID, plus the last sync watermark.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cases (case_id TEXT PRIMARY KEY, url TEXT, updated TEXT, "
+                "description TEXT, content_hash TEXT, synced_at REAL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, case_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT case_id, url, updated, description, content_hash FROM cases WHERE case_id = ?", (case_id,)
+            ).fetchone()
+        return dict(zip(("case_id", "url", "updated", "description", "content_hash"), row)) if row else None
+
+    def is_changed(self, case_id, description):
+        """
+        True if the case is not stored yet or its stored description differs.
+        """
+        existing = self.get(case_id)
+        return existing is None or existing["content_hash"] != description_hash(description)
+
+    def upsert(self, case_id, url, updated, description):
+        """
+        Store a case. Returns True if its description is new or changed.
+        """
+        changed = self.is_changed(case_id, description)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO cases (case_id, url, updated, description, content_hash, synced_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(case_id) DO UPDATE SET url = excluded.url, updated = excluded.updated, "
+                "description = excluded.description, content_hash = excluded.content_hash, synced_at = excluded.synced_at",
+                (case_id, url, updated, description, description_hash(description), time.time()),
+            )
+        return changed
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM cases").fetchone()[0]
+
+    @property
+    def watermark(self):
+        """
+        Latest 'updated' time seen by a completed sync, or None before the first sync.
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM sync_state WHERE key = 'watermark'").fetchone()
+        return row[0] if row else None
+
+    @watermark.setter
+    def watermark(self, value):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO sync_state (key, value) VALUES ('watermark', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (value,),
+            )
+
+
+class SupportCaseIndexer:
+    """
+    Offline sync of closed support-portal cases into a local store and their own Chroma collection.
+
+    The dashboard is listed newest-updated first; listing stops at the first page
+    whose cases are all older than the previous sync's watermark, and only new or
+    updated cases are fetched, using the client's pool of concurrent sessions.
+    Rows without a date cannot be compared with the watermark, so they are
+    fetched once, when first seen. Changed descriptions are (re-)embedded into
+    the 'support-cases' collection with the case ID as document ID, so the
+    search tool answers locally. A case is saved to the store only after its
+    vector is written, so a failed embedding is retried on the next run.
+    """
+
+    def __init__(self, client, store, embedding, persist_directory, max_pages=200):
+        self.client = client
+        self.store = store
+        self.embedding = embedding
+        self.persist_directory = persist_directory
+        self.max_pages = max_pages
+        self._vectorstore = None
+
+    def get_vectorstore(self):
+        if self._vectorstore is None:
+            self._vectorstore = Chroma(
+                collection_name=CASE_COLLECTION,
+                embedding_function=self.embedding,
+                persist_directory=self.persist_directory,
+            )
+        return self._vectorstore
+
+    def _is_fresh(self, case, watermark):
+        case_id, _, updated = case
+        if updated is None:
+            return self.store.get(case_id) is None
+        return watermark is None or updated > watermark
+
+    def _pending_cases(self, watermark):
+        pending, newest = [], watermark
+        page = 1
+        while page <= self.max_pages:
+            cases, last_page = self.client.list_page(page)
+            logger.info("found %d case links on page %d", len(cases), page)
+            if not cases:
+                break
+            fresh = [case for case in cases if self._is_fresh(case, watermark)]
+            pending.extend(fresh)
+            for _, _, updated in fresh:
+                if updated and (newest is None or updated > newest):
+                    newest = updated
+            # Newest-updated first: once a whole page predates the watermark, nothing older changed.
+            if watermark is not None and not fresh:
+                break
+            if last_page is None or page >= last_page:
+                break
+            page += 1
+        return pending, newest
+
+    def _fetch(self, case):
+        case_id, case_url, updated = case
+        try:
+            return case_id, case_url, updated, self.client.fetch_description(case_url), None
+        except Exception as e:
+            return case_id, case_url, updated, None, e
+
+    def sync(self):
+        """
+        Fetch and index the cases updated since the last sync. Returns a summary dict.
+        """
+        started = time.time()
+        watermark = self.store.watermark
+        pending, newest = self._pending_cases(watermark)
+        logger.info("%d cases to fetch (watermark: %s)", len(pending), watermark)
+
+        changed, documents, failed = [], [], 0
+        with ThreadPoolExecutor(max_workers=self.client.pool_size) as executor:
+            for case_id, case_url, updated, description, error in executor.map(self._fetch, pending):
+                if error is not None:
+                    failed += 1
+                    logger.warning("failed to fetch case %s: %s", case_id, error)
+                    continue
+                if not description:
+                    logger.warning("no description found for case: %s", case_url)
+                    continue
+                if not self.store.is_changed(case_id, description):
+                    self.store.upsert(case_id, case_url, updated, description)
+                    continue
+                changed.append((case_id, case_url, updated, description))
+                documents.append(
+                    Document(
+                        page_content=description,
+                        metadata={"case_id": case_id, "source": case_url, "updated": updated or ""},
+                    )
+                )
+
+        if documents:
+            self.get_vectorstore().add_documents(documents, ids=[doc.metadata["case_id"] for doc in documents])
+        # Hashes are saved only once the vectors are written, so a failed write is re-embedded next run.
+        for case in changed:
+            self.store.upsert(*case)
+        # Only advance the watermark when every fetch succeeded, so failed cases are retried next run.
+        if not failed and newest is not None:
+            self.store.watermark = newest
+        summary = {"fetched": len(pending), "indexed": len(documents), "failed": failed, "seconds": round(time.time() - started, 2)}
+        logger.info("support case sync: %s", summary)
+        return summary
+
+    def search(self, query, k=4):
+        if not len(self.store):
+            return []
+        return self.get_vectorstore().similarity_search(query, k=k)
+
+    def as_tool(self, k=4):
+        def search_text(query):
+            docs = self.search(query, k=k)
+            if not docs:
+                return "No matching support cases found."
+            return "\n\n".join(
+                f"[Source: support case {doc.metadata['case_id']} ({doc.metadata['source']})]\n{doc.page_content}"
+                for doc in docs
+            )
+
+        return Tool(
+            name="support_case_search",
+            func=search_text,
+            description=(
+                "Search previously closed Multitech support cases, indexed locally. "
+                "Input a description of the problem; returns the most similar case descriptions with their case URLs."
+            ),
+        )
+
+
+if __name__ == "__main__":
+    import resources
+
+    resources.configure_telemetry()
+    resources.get_support_case_indexer().sync()
@@ -1,30 +1,43 @@
+import logging
+
 import requests
 from bs4 import BeautifulSoup
 import urllib.parse
 import time
 from langchain_core.tools import tool
 
+from support_case_indexer import PORTAL_PASSWORD, PORTAL_USERNAME
+
+logger = logging.getLogger(__name__)
+
 def get_case_descriptions(search_term: str) -> str:
     """
     Scrapes case descriptions from the support site for the given search term,
     and returns a single combined string of all descriptions found.
+
+    This is the slow live scrape; the tool below answers from the local index
+    built by support_case_indexer.py instead.
     """
+    if not PORTAL_USERNAME or not PORTAL_PASSWORD:
+        raise RuntimeError(
+            "Support portal credentials are not set; export SUPPORT_PORTAL_USERNAME and SUPPORT_PORTAL_PASSWORD."
+        )
     session = requests.Session()
 
     # Step 1: Login
     login_url = 'https://support.multitech.com/support/login.html'
     dashboard_url = 'https://support.multitech.com/support/dashboard.html'
     payload = {
-        'pas7urd': 'btran@multitech.com',
-        'u32namb4': 'trong2',
+        'pas7urd': PORTAL_USERNAME,
+        'u32namb4': PORTAL_PASSWORD,
         'login': 'Login'
     }
 
     login_response = session.post(login_url, data=payload)
     if 'Dashboard' not in login_response.text:
-        print("[!] Login failed.")
+        logger.warning("support portal login failed")
         return ""
-    print("[+] Login successful.")
+    logger.info("support portal login successful")
 
     # Step 2: Prepare search payload
     search_payload = {
@@ -52,14 +65,14 @@ def get_case_descriptions(search_term: str) -> str:
                 if full_url not in case_links:
                     case_links.append(full_url)
 
-        print(f"[+] Found {len(case_links)} case links on page {search_payload['page']}.")
+        logger.info("found %d case links on page %d", len(case_links), search_payload['page'])
 
         if not case_links:
-            print("[!] No case links found. Stopping.")
+            logger.info("no case links found; stopping")
             break
 
         for case_url in case_links:
-            print(f"[*] Visiting case: {case_url}")
+            logger.debug("visiting case: %s", case_url)
             case_resp = session.get(case_url)
             case_soup = BeautifulSoup(case_resp.text, "html.parser")
 
@@ -73,7 +86,7 @@ def get_case_descriptions(search_term: str) -> str:
                             div = content_td.find("div")
                             if div:
                                 description_text = div.get_text(separator="\n", strip=True)
-                                print(f"[+] Found description in case: {case_url}")
+                                logger.debug("found description in case: %s", case_url)
                                 break
                 if description_text:
                     break
@@ -82,7 +95,7 @@ def get_case_descriptions(search_term: str) -> str:
                 combined_entry = f"URL: {case_url}\n{description_text}\n{'=' * 80}"
                 all_descriptions.append(combined_entry)
             else:
-                print(f"[!] No description found for case: {case_url}")
+                logger.warning("no description found for case: %s", case_url)
 
             time.sleep(0.5)
 
@@ -92,30 +105,30 @@ def get_case_descriptions(search_term: str) -> str:
             try:
                 last_page = int(pagination.text.strip("Last() "))
                 if search_payload['page'] >= last_page:
-                    print("[*] Reached last page.")
+                    logger.debug("reached last page")
                     break
                 else:
                     search_payload['page'] += 1
             except Exception as e:
-                print(f"[!] Error parsing last page number: {e}")
+                logger.warning("cannot parse last page number: %s", e)
                 break
         else:
-            print("[*] No pagination found. Assuming single page.")
+            logger.debug("no pagination found; assuming a single page")
             break
 
-    print(f"[✓] Total descriptions collected: {len(all_descriptions)}")
+    logger.info("collected %d case descriptions", len(all_descriptions))
     text = "\n\n".join(all_descriptions)
-
-    print(text)
-
+    logger.debug("case descriptions: %d characters", len(text))
     return text
 
 @tool
 def get_case_descriptions_wrapper(search_query: str) -> str:
     """
-    Wrapper to make get_case_descriptions compatible with LangChain Tools.
+    Search closed support cases in the local index kept current by support_case_indexer.py.
     """
-    print(f"[Tool] Searching support cases for: {search_query}")
-    return get_case_descriptions(search_term=search_query)
+    import resources
+
+    logger.debug("searching support cases for: %s", search_query)
+    return resources.get_support_case_tool().invoke(search_query)
 
 
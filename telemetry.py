@@ -0,0 +1,351 @@
+"""
+Metrics, traces and logging for the RAG graph and document ingestion.
+
+Graph runs report through GraphTelemetry, a callback handler attached to the
+compiled graph: node wall time, LLM latency and time-to-first-token, prompt and
+completion tokens, retrieved and graded chunk counts, and rewrite iterations per
+turn. Ingestion reports its load/split, embed/store and index stages through
+record_stage(). Everything is exported as Prometheus metrics (served by
+chat_service.py at /metrics) and, when a trace file is configured, appended to it
+as one JSON object per line.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import ToolMessage
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+from grade_document_edges import NO_RELEVANT_DOCUMENTS, split_chunks
+from retrieval_budget import turn_usage
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+# Client libraries that log every HTTP request at INFO.
+NOISY_LOGGERS = ("httpx", "httpcore", "openai", "urllib3", "chromadb", "watchdog")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+NODE_SECONDS = Histogram("rag_node_duration_seconds", "Wall time of one graph node run", ["node"], buckets=LATENCY_BUCKETS)
+NODE_ERRORS = Counter("rag_node_errors", "Graph node runs that raised", ["node"])
+LLM_SECONDS = Histogram("rag_llm_duration_seconds", "Latency of one LLM call", ["node", "model"], buckets=LATENCY_BUCKETS)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "rag_llm_time_to_first_token_seconds", "Time until a streamed LLM call produced its first token",
+    ["node", "model"], buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter("rag_llm_tokens", "LLM tokens by graph node", ["node", "model", "kind"])
+LLM_ERRORS = Counter("rag_llm_errors", "LLM calls that raised", ["node", "model"])
+LLM_CACHE_REQUESTS = Counter("rag_llm_cache_requests", "LLM cache lookups by role and result", ["role", "result"])
+EMBEDDING_CACHE_REQUESTS = Counter("rag_embedding_cache_requests", "Texts looked up in the embedding cache", ["kind", "result"])
+RETRIEVED_CHUNKS = Histogram("rag_retrieved_chunks", "Chunks returned by one tool call", ["tool"], buckets=COUNT_BUCKETS)
+TOOL_ERRORS = Counter("rag_tool_errors", "Tool calls that failed or timed out", ["tool"])
+GRADED_CHUNKS = Counter("rag_graded_chunks", "Retrieved chunks kept or dropped by grading", ["verdict"])
+TURN_SECONDS = Histogram("rag_turn_duration_seconds", "Wall time of one graph turn", buckets=LATENCY_BUCKETS)
+TURN_REWRITES = Histogram("rag_turn_rewrites", "Question rewrites in one turn", buckets=(0, 1, 2, 3, 4, 5))
+TURNS = Counter("rag_turns", "Graph turns by the node that answered", ["outcome"])
+INGESTION_SECONDS = Histogram(
+    "rag_ingestion_stage_duration_seconds", "Wall time of one ingestion stage for one file", ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+INGESTION_CHUNKS = Counter("rag_ingestion_chunks", "Chunks handled by ingestion stages", ["stage"])
+INGESTION_JOBS = Counter("rag_ingestion_jobs", "Finished ingestion jobs", ["action", "status"])
+
+
+class TraceWriter:
+    """
+    Appends trace events to a JSONL file, one JSON object per line.
+
+    Each write opens the file in append mode, so the chat service and the docs
+    watcher daemon can share one trace file. Once it grows past `max_bytes` it is
+    moved to `<path>.1`, replacing the previous one.
+
+    Args:
+        path (str): Trace file; an empty path disables tracing
+        max_bytes (int): Size at which the file is rotated, 0 for never
+    """
+
+    def __init__(self, path=None, max_bytes=50_000_000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def write(self, event_type, **fields):
+        if not self.path:
+            return
+        record = {"ts": round(time.time(), 3), "type": event_type, "pid": os.getpid(), **fields}
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning("cannot write trace event to %s: %s", self.path, e)
+
+
+# Process-wide trace file, set by configure(); disabled until then.
+tracer = TraceWriter()
+
+
+def configure_logging(level="INFO"):
+    """
+    Send this project's log records to stderr at `level`; "OFF" silences logging altogether.
+    """
+    level = str(level or "INFO").upper()
+    if level in ("OFF", "NONE", "0"):
+        logging.disable(logging.CRITICAL)
+        return
+    logging.disable(logging.NOTSET)
+    logging.basicConfig(format=LOG_FORMAT)
+    logging.getLogger().setLevel(level)
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).setLevel(max(logging.getLogger().level, logging.WARNING))
+
+
+def configure(log_level="INFO", trace_path=None, trace_max_bytes=50_000_000):
+    """
+    Set up logging and the process-wide trace file. Safe to call more than once.
+    """
+    configure_logging(log_level)
+    tracer.path = trace_path
+    tracer.max_bytes = trace_max_bytes
+
+
+def render_metrics():
+    """
+    The Prometheus text exposition of every metric, and its content type.
+
+    With PROMETHEUS_MULTIPROC_DIR set (several service workers), the values of all
+    worker processes are aggregated.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def record_stage(stage, seconds, file=None, chunks=None, trace_writer=None):
+    """
+    Record one ingestion stage (load_split, embed_store, lexical_index, delete) for one file.
+    """
+    INGESTION_SECONDS.labels(stage).observe(seconds)
+    if chunks:
+        INGESTION_CHUNKS.labels(stage).inc(chunks)
+    (trace_writer or tracer).write("ingestion", stage=stage, file=file, seconds=round(seconds, 4), chunks=chunks)
+
+
+@contextmanager
+def ingestion_stage(stage, file=None, chunks=None):
+    """
+    Time the body as one ingestion stage; a stage that raises is recorded too.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started, file=file, chunks=chunks)
+
+
+def record_job(job):
+    """
+    Count a finished ingestion job and trace it.
+    """
+    INGESTION_JOBS.labels(job.action, job.status).inc()
+    tracer.write(
+        "ingestion_job", action=job.action, file=job.file_name, status=job.status, error=job.error,
+        seconds=round(job.finished - job.created, 4) if job.finished and job.created else None,
+    )
+
+
+class _Turn:
+    def __init__(self, run_id, thread_id):
+        self.run_id = str(run_id)
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.nodes = []
+        # tool_call_id -> chunks the tool returned, so grading can count what it kept
+        self.retrieved = {}
+
+
+class GraphTelemetry(BaseCallbackHandler):
+    """
+    Callback handler that records metrics and trace events for every graph run.
+
+    A run of the graph is one turn. Inside it, each node's own run is timed (not the
+    prompts and parsers running inside it), and each chat model call is timed from
+    start to first streamed token and to the end, with its token usage attributed
+    to the node that made it.
+
+    Args:
+        trace_writer (TraceWriter): Where trace events go; defaults to the process-wide tracer
+    """
+
+    # Bookkeeping only; run in the caller's thread so node start and end events stay ordered.
+    run_inline = True
+
+    def __init__(self, trace_writer=None):
+        self.trace_writer = trace_writer
+        self._lock = threading.Lock()
+        self._roots = {}
+        self._turns = {}
+        self._nodes = {}
+        self._llm_calls = {}
+
+    def _write(self, event_type, **fields):
+        (self.trace_writer or tracer).write(event_type, **fields)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        node = metadata.get("langgraph_node")
+        with self._lock:
+            root = self._roots.get(parent_run_id, run_id)
+            self._roots[run_id] = root
+            if root == run_id:
+                self._turns[run_id] = _Turn(run_id, metadata.get("thread_id"))
+            # Only the node's own run, not a node function that happens to share the node's name.
+            if node and not node.startswith("__") and kwargs.get("name") == node:
+                if self._nodes.get(parent_run_id, (None,))[0] != node:
+                    self._nodes[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id, outputs)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, None, error)
+
+    def _finish(self, run_id, outputs, error=None):
+        with self._lock:
+            root = self._roots.pop(run_id, None)
+            node_run = self._nodes.pop(run_id, None)
+            turn = self._turns.pop(run_id, None) if root == run_id else self._turns.get(root)
+        if node_run and turn is not None:
+            node, started = node_run
+            self._node_finished(turn, node, time.perf_counter() - started, outputs, error)
+        if root == run_id and turn is not None:
+            self._turn_finished(turn, outputs, error)
+
+    def _node_finished(self, turn, node, seconds, outputs, error):
+        NODE_SECONDS.labels(node).observe(seconds)
+        turn.nodes.append(node)
+        fields = {}
+        if error is not None:
+            NODE_ERRORS.labels(node).inc()
+            fields["error"] = repr(error)
+        elif isinstance(outputs, dict):
+            if node == "use_tools":
+                fields["chunks"] = self._retrieved(turn, outputs)
+            elif node == "grade_documents":
+                fields["kept"], fields["retrieved"] = self._graded(turn, outputs)
+            elif node == "rewrite":
+                fields["rewrites"] = outputs.get("rewrites")
+            if outputs.get("tokens_used"):
+                fields["tokens"] = outputs["tokens_used"]
+        self._write("node", turn_id=turn.run_id, thread_id=turn.thread_id, node=node, seconds=round(seconds, 4), **fields)
+
+    def _retrieved(self, turn, outputs):
+        chunks = {}
+        for message in outputs.get("messages") or []:
+            if not isinstance(message, ToolMessage):
+                continue
+            if message.status == "error":
+                TOOL_ERRORS.labels(message.name).inc()
+                count = 0
+            else:
+                count = len(split_chunks(message.content))
+                RETRIEVED_CHUNKS.labels(message.name).observe(count)
+            turn.retrieved[message.tool_call_id] = count
+            chunks[message.name] = chunks.get(message.name, 0) + count
+        return chunks
+
+    def _graded(self, turn, outputs):
+        # Grading returns only the tool messages it changed; the others kept every chunk.
+        kept = dict(turn.retrieved)
+        for message in outputs.get("messages") or []:
+            if isinstance(message, ToolMessage) and message.tool_call_id in kept:
+                kept[message.tool_call_id] = 0 if message.content == NO_RELEVANT_DOCUMENTS else len(split_chunks(message.content))
+        total, kept_total = sum(turn.retrieved.values()), sum(kept.values())
+        turn.retrieved = {}
+        GRADED_CHUNKS.labels("kept").inc(kept_total)
+        GRADED_CHUNKS.labels("dropped").inc(max(total - kept_total, 0))
+        return kept_total, total
+
+    def _turn_finished(self, turn, outputs, error):
+        seconds = time.perf_counter() - turn.started
+        answered_by = [node for node in turn.nodes if node in ("agent", "generate", "fallback")]
+        outcome = "error" if error is not None else (answered_by[-1] if answered_by else "none")
+        usage = turn_usage(outputs) if isinstance(outputs, dict) else {"rewrites": None, "tokens": None}
+        TURN_SECONDS.observe(seconds)
+        TURNS.labels(outcome).inc()
+        if usage["rewrites"] is not None:
+            TURN_REWRITES.observe(usage["rewrites"])
+        self._write(
+            "turn", turn_id=turn.run_id, thread_id=turn.thread_id, seconds=round(seconds, 4), outcome=outcome,
+            nodes=turn.nodes, rewrites=usage["rewrites"], tokens=usage["tokens"],
+            error=repr(error) if error is not None else None,
+        )
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        with self._lock:
+            self._llm_calls[run_id] = {
+                "turn_id": str(self._roots.get(parent_run_id, "")) or None,
+                "thread_id": metadata.get("thread_id"),
+                "node": metadata.get("langgraph_node", "unknown"),
+                "model": metadata.get("ls_model_name", "unknown"),
+                "started": time.perf_counter(),
+                "first_token": None,
+            }
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        call = self._llm_calls.get(run_id)
+        if call is not None and call["first_token"] is None:
+            call["first_token"] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            call = self._llm_calls.pop(run_id, None)
+        if call is None:
+            return
+        seconds = time.perf_counter() - call["started"]
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+        labels = (call["node"], call["model"])
+        LLM_SECONDS.labels(*labels).observe(seconds)
+        first_token = call["first_token"] - call["started"] if call["first_token"] else None
+        if first_token is not None:
+            LLM_FIRST_TOKEN_SECONDS.labels(*labels).observe(first_token)
+        LLM_TOKENS.labels(*labels, "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(*labels, "completion").inc(completion_tokens)
+        self._write(
+            "llm", turn_id=call["turn_id"], thread_id=call["thread_id"], node=call["node"], model=call["model"],
+            seconds=round(seconds, 4), first_token_seconds=round(first_token, 4) if first_token is not None else None,
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+        )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            call = self._llm_calls.pop(run_id, None)
+        if call is None:
+            return
+        LLM_ERRORS.labels(call["node"], call["model"]).inc()
+        self._write(
+            "llm", turn_id=call["turn_id"], thread_id=call["thread_id"], node=call["node"], model=call["model"],
+            seconds=round(time.perf_counter() - call["started"], 4), error=repr(error),
+        )
@@ -0,0 +1,67 @@
+from langchain_core.embeddings import Embeddings
+
+from answer_cache import SemanticAnswerCache, identifier_terms, reference_sources
+
+
+class ConstantEmbedding(Embeddings):
+    """
+    Embeds every text to the same vector, so every stored question is a perfect semantic match.
+    """
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+class FakeManifest:
+    def __init__(self, files):
+        self.files = files
+
+    def get(self, file_key):
+        return self.files.get(file_key)
+
+    def find_by_source(self, source):
+        return [key for key, entry in self.files.items() if entry["source"] == source]
+
+
+def make_cache(tmp_path, manifest):
+    return SemanticAnswerCache(str(tmp_path / "answers.sqlite"), ConstantEmbedding(), manifest)
+
+
+def test_identifier_terms_keep_skus_and_at_commands_whole():
+    assert {"mtcdt-l4g1", "at+pp"} <= identifier_terms("Does the MTCDT-L4G1 support AT+PP?")
+    assert identifier_terms("How do I enable SSH via the API?") == frozenset()
+
+
+def test_lookup_requires_the_same_identifiers(tmp_path):
+    manifest = FakeManifest({"docs/bands.xlsx": {"source": "bands.xlsx", "sha256": "a"}})
+    cache = make_cache(tmp_path, manifest)
+    cache.store("What bands does MTCDT-L4G1 support?", "B2, B4, B12 [1]", ["bands.xlsx"])
+
+    assert cache.lookup("which bands does the MTCDT-L4G1 support") is not None
+    assert cache.lookup("What bands does MTCAP-L4E1 support?") is None
+
+
+def test_spreadsheet_answers_are_invalidated_when_the_workbook_changes(tmp_path):
+    manifest = FakeManifest({"docs/bands.xlsx": {"source": "bands.xlsx", "sha256": "a"}})
+    cache = make_cache(tmp_path, manifest)
+    references = [{"number": 1, "source": "bands.xlsx / LTE / row 7", "web": False}]
+    cache.store("What bands does MTCDT-L4G1 support?", "B2, B4, B12 [1]", reference_sources(references), references)
+
+    hit = cache.lookup("What bands does MTCDT-L4G1 support?")
+    assert hit["sources"] == ["bands.xlsx"] and hit["references"] == references
+
+    manifest.files["docs/bands.xlsx"]["sha256"] = "b"
+    assert cache.lookup("What bands does MTCDT-L4G1 support?") is None
+
+
+def test_answers_without_indexed_sources_are_not_stored(tmp_path):
+    cache = make_cache(tmp_path, FakeManifest({}))
+    web = [{"number": 1, "source": "https://example.com", "web": True}]
+    cache.store("What is LoRaWAN?", "A network protocol [1]", reference_sources(web), web)
+    cache.store("Hello", "Hi! How can I help?", [])
+
+    assert cache.lookup("What is LoRaWAN?") is None
+    assert cache.lookup("Hello") is None
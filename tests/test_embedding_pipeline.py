@@ -0,0 +1,137 @@
+import threading
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import embedding_pipeline
+from embedding_pipeline import EmbeddingPipeline, TokenRateLimiter, estimate_tokens
+
+
+class FakeEmbedding(Embeddings):
+    """
+    Local embedding that records every batch and can fail on chosen calls.
+    """
+
+    def __init__(self, fail_on_texts=()):
+        self.batches = []
+        self.fail_on_texts = set(fail_on_texts)
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.batches.append(list(texts))
+        if self.fail_on_texts.intersection(texts):
+            raise RuntimeError("provider unavailable")
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class FakeCollection:
+    def __init__(self):
+        self.rows = {}
+
+    def upsert(self, ids, texts, metadatas, embeddings):
+        for chunk_id, text, embedding in zip(ids, texts, embeddings):
+            self.rows[chunk_id] = (text, embedding)
+
+    def existing_ids(self, ids):
+        return [chunk_id for chunk_id in ids if chunk_id in self.rows]
+
+
+class FakeClock:
+    """
+    Replaces time.monotonic and time.sleep in embedding_pipeline, so waiting is instant and measurable.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(embedding_pipeline.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(embedding_pipeline.time, "sleep", clock.sleep)
+    return clock
+
+
+def make_chunks(count, chars=40):
+    docs = [Document(page_content=f"chunk {i:03d} " + "x" * chars, metadata={"source": "a.txt"}) for i in range(count)]
+    return docs, [f"id-{i}" for i in range(count)]
+
+
+def make_pipeline(embedding, collection, **kwargs):
+    return EmbeddingPipeline(
+        embedding,
+        upsert_fn=collection.upsert,
+        existing_ids_fn=collection.existing_ids,
+        **kwargs,
+    )
+
+
+def test_batches_stay_within_batch_size_and_token_limit(clock):
+    embedding, collection = FakeEmbedding(), FakeCollection()
+    docs, ids = make_chunks(10)
+    batch_tokens = 4 * estimate_tokens(docs[0].page_content)
+    pipeline = make_pipeline(embedding, collection, batch_size=4, max_workers=1, tokens_per_minute=batch_tokens)
+
+    assert pipeline.run(docs, ids) == 10
+    assert [len(batch) for batch in embedding.batches] == [4, 4, 2]
+    assert all(sum(estimate_tokens(text) for text in batch) <= batch_tokens for batch in embedding.batches)
+    assert sorted(collection.rows) == sorted(ids)
+
+
+def test_rate_limiter_waits_for_the_window_to_free_up(clock):
+    limiter = TokenRateLimiter(tokens_per_minute=100)
+    limiter.acquire(60)
+    limiter.acquire(40)
+    assert clock.sleeps == []
+
+    clock.now += 15
+    limiter.acquire(30)
+    assert sum(clock.sleeps) == pytest.approx(45)
+
+
+def test_pipeline_waits_when_batches_exceed_tokens_per_minute(clock):
+    embedding, collection = FakeEmbedding(), FakeCollection()
+    docs, ids = make_chunks(6)
+    per_batch = 2 * estimate_tokens(docs[0].page_content)
+    pipeline = make_pipeline(embedding, collection, batch_size=2, max_workers=1, tokens_per_minute=per_batch)
+
+    pipeline.run(docs, ids)
+    # One batch fits per minute, so the second and third each wait out a full window.
+    assert sum(clock.sleeps) == pytest.approx(120)
+    assert len(embedding.batches) == 3
+
+
+def test_resume_embeds_only_batches_missing_after_a_failure(clock):
+    docs, ids = make_chunks(6)
+    collection = FakeCollection()
+    failing = FakeEmbedding(fail_on_texts=[docs[4].page_content])
+    pipeline = make_pipeline(failing, collection, batch_size=2, max_workers=1, tokens_per_minute=0, max_retries=2)
+
+    with pytest.raises(RuntimeError):
+        pipeline.run(docs, ids)
+    assert sorted(collection.rows) == ids[:4]
+
+    progress = []
+    embedding = FakeEmbedding()
+    pipeline = make_pipeline(
+        embedding, collection, batch_size=2, max_workers=1, tokens_per_minute=0,
+        progress_callback=lambda done, total, elapsed: progress.append((done, total)),
+    )
+    assert pipeline.run(docs, ids) == 2
+    assert embedding.batches == [[docs[4].page_content, docs[5].page_content]]
+    assert sorted(collection.rows) == sorted(ids)
+    assert progress == [(6, 6)]
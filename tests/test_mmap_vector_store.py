@@ -0,0 +1,99 @@
+import hashlib
+import os
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from lexical_index import tokenize
+from mmap_vector_store import MmapVectorStore
+
+
+class HashingEmbedding(Embeddings):
+    """
+    Deterministic bag-of-words embedding, so texts sharing terms score close together.
+    """
+
+    def __init__(self, size=64):
+        self.size = size
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            vector[int.from_bytes(digest, "little") % self.size] += 1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def chunk_text(i):
+    return f"chunk {i} describes topic{i} on the gateway"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MmapVectorStore(str(tmp_path), HashingEmbedding(), compact_ratio=0.5)
+    store.upsert(
+        [f"id{i}" for i in range(10)],
+        [chunk_text(i) for i in range(10)],
+        [{"source": f"file{i % 2}.pdf", "kind": "even" if i % 2 == 0 else "odd"} for i in range(10)],
+    )
+    return store
+
+
+def test_upsert_replaces_an_existing_id(store):
+    store.upsert(["id3"], ["chunk 3 now covers topicnew"], [{"source": "file1.pdf", "kind": "odd"}])
+
+    assert store.count() == 10
+    assert store.get(ids=["id3"])["documents"] == ["chunk 3 now covers topicnew"]
+    best = store.similarity_search("topicnew", k=1)[0]
+    assert (best.id, best.page_content) == ("id3", "chunk 3 now covers topicnew")
+
+
+def test_delete_by_source(store):
+    store.delete(where={"source": "file0.pdf"})
+
+    assert store.count() == 5
+    assert sorted(store.get(include=[])["ids"]) == [f"id{i}" for i in (1, 3, 5, 7, 9)]
+    assert store.get(where={"source": "file0.pdf"}, include=[])["ids"] == []
+
+
+def test_search_filter_on_a_metadata_key(store):
+    results = store.similarity_search("topic4 gateway", k=3, filter={"kind": "odd"})
+
+    assert results
+    assert all(doc.metadata["kind"] == "odd" for doc in results)
+    assert "id4" not in {doc.id for doc in results}
+
+
+def test_compaction_keeps_ids_and_text(store):
+    before = {i: store.similarity_search(f"topic{i}", k=1)[0] for i in (1, 5, 9)}
+    generation = store._generation
+
+    # Half the rows die, which crosses compact_ratio and renumbers the survivors.
+    store.delete(where={"kind": "even"})
+
+    assert store._generation == generation + 1
+    assert len(store._ids) == 5
+    for i, doc in before.items():
+        after = store.similarity_search(f"topic{i}", k=1)[0]
+        assert (after.id, after.page_content, after.metadata) == (doc.id, doc.page_content, doc.metadata)
+
+
+def test_reopen_after_generation_bump(store, tmp_path):
+    store.delete(where={"kind": "even"})
+    generation = store._generation
+
+    reopened = MmapVectorStore(str(tmp_path), HashingEmbedding())
+
+    assert reopened._generation == generation
+    assert reopened.count() == 5
+    assert os.path.exists(os.path.join(str(tmp_path), f"int8-{generation}.i8"))
+    best = reopened.similarity_search("topic7", k=1)[0]
+    assert (best.id, best.page_content) == ("id7", chunk_text(7))
+    assert reopened.get(ids=["id7"], include=["metadatas"])["metadatas"] == [{"source": "file1.pdf", "kind": "odd"}]
@@ -0,0 +1,163 @@
+import threading
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from support_case_indexer import SupportCaseIndexer, SupportCaseStore, SupportPortalClient
+
+PAGE_SIZE = 2
+
+
+class Portal:
+    """
+    State of the local portal stand-in: closed cases as {case_id: (updated or None, description)}.
+    """
+
+    def __init__(self, cases):
+        self.cases = dict(cases)
+        self.case_requests = Counter()
+        self.logins = 0
+
+    def ordered(self):
+        # Newest-updated first, as the real dashboard lists them; undated rows last.
+        return sorted(self.cases.items(), key=lambda item: item[1][0] or "", reverse=True)
+
+    def dashboard(self, page):
+        cases = self.ordered()
+        last_page = max(1, -(-len(cases) // PAGE_SIZE))
+        rows = "".join(
+            f'<tr><td><a href="case.html?action=view&id={case_id}">Case {case_id}</a></td><td>{updated or ""}</td></tr>'
+            for case_id, (updated, _) in cases[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+        )
+        return f'<html><body><table>{rows}</table><a href="#">Last({last_page})</a></body></html>'
+
+    def case_page(self, case_id):
+        self.case_requests[case_id] += 1
+        description = self.cases[case_id][1]
+        return (
+            '<html><body><table><tr class="readworkitem"><td>Description:</td>'
+            f"<td><div>{description}</div></td></tr></table></body></html>"
+        )
+
+
+class PortalHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, status=200):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _form(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8"))
+
+    def do_POST(self):
+        portal = self.server.portal
+        form = self._form()
+        path = urllib.parse.urlparse(self.path).path
+        if path.endswith("/login.html"):
+            if form.get("pas7urd") == ["user"] and form.get("u32namb4") == ["secret"]:
+                portal.logins += 1
+                return self._reply("<html>Dashboard</html>")
+            return self._reply("<html>Login</html>")
+        if path.endswith("/dashboard.html"):
+            return self._reply(portal.dashboard(int(form["page"][0])))
+        self._reply("not found", status=404)
+
+    def do_GET(self):
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        case_id = query.get("id", [None])[0]
+        if case_id not in self.server.portal.cases:
+            return self._reply("not found", status=404)
+        self._reply(self.server.portal.case_page(case_id))
+
+
+class RecordingVectorStore:
+    def __init__(self):
+        self.documents = {}
+        self.fail = False
+
+    def add_documents(self, documents, ids):
+        if self.fail:
+            raise RuntimeError("embedding provider unavailable")
+        self.documents.update(zip(ids, documents))
+
+
+@pytest.fixture
+def portal():
+    portal = Portal({
+        "101": ("2026-03-04 09:00", "Gateway reboots after firmware upgrade"),
+        "102": ("2026-03-02 16:30", "How to enable SSH through the API"),
+        "103": ("2026-02-20 08:15", "LoRa packet forwarder loses the uplink"),
+        "104": (None, "Cellular APN settings for Verizon"),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PortalHandler)
+    server.portal = portal
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    portal.base_url = f"http://127.0.0.1:{server.server_address[1]}/support/"
+    yield portal
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def indexer(portal, tmp_path):
+    client = SupportPortalClient(base_url=portal.base_url, username="user", password="secret", pool_size=2, timeout=5)
+    indexer = SupportCaseIndexer(client, SupportCaseStore(str(tmp_path / "cases.sqlite")), embedding=None, persist_directory=str(tmp_path))
+    indexer._vectorstore = RecordingVectorStore()
+    yield indexer
+    client.close()
+
+
+def test_first_sync_fetches_and_indexes_every_case(portal, indexer):
+    summary = indexer.sync()
+
+    assert summary["fetched"] == 4 and summary["indexed"] == 4 and summary["failed"] == 0
+    assert sorted(indexer._vectorstore.documents) == ["101", "102", "103", "104"]
+    assert indexer.store.get("102")["description"] == "How to enable SSH through the API"
+    assert indexer.store.watermark == "2026-03-04T09:00:00"
+    assert portal.logins <= 2
+
+
+def test_later_sync_fetches_only_updated_cases(portal, indexer):
+    indexer.sync()
+    portal.case_requests.clear()
+    portal.cases["103"] = ("2026-03-05 11:00", "LoRa packet forwarder loses the uplink after a reboot")
+
+    summary = indexer.sync()
+
+    assert dict(portal.case_requests) == {"103": 1}
+    assert summary["indexed"] == 1
+    assert indexer._vectorstore.documents["103"].page_content.endswith("after a reboot")
+    assert indexer.store.watermark == "2026-03-05T11:00:00"
+
+
+def test_failed_vector_write_is_retried_next_sync(portal, indexer):
+    indexer._vectorstore.fail = True
+    with pytest.raises(RuntimeError):
+        indexer.sync()
+    assert len(indexer.store) == 0
+    assert indexer.store.watermark is None
+
+    indexer._vectorstore.fail = False
+    summary = indexer.sync()
+
+    assert summary["indexed"] == 4
+    assert sorted(indexer._vectorstore.documents) == ["101", "102", "103", "104"]
+
+
+def test_missing_credentials_fail_clearly(portal, tmp_path):
+    client = SupportPortalClient(base_url=portal.base_url, username=None, password=None)
+    indexer = SupportCaseIndexer(client, SupportCaseStore(str(tmp_path / "cases.sqlite")), embedding=None, persist_directory=str(tmp_path))
+
+    with pytest.raises(RuntimeError, match="SUPPORT_PORTAL_USERNAME"):
+        indexer.sync()
+    assert portal.logins == 0
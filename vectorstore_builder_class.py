@@ -1,127 +1,453 @@
 # vectorstore_loader.py
 
+import logging
+import multiprocessing
 import os
-import json
-import pandas as pd  # Add pandas for handling Excel files
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
 from langchain_community.document_loaders import (
     PyPDFLoader,
     TextLoader,
 )
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings
-from langchain.tools.retriever import create_retriever_tool
-from langchain.schema import Document  # Import Document class
+from langchain_core.tools import StructuredTool
+
+import telemetry
+from context_assembler import format_documents
+from embedding_pipeline import EmbeddingPipeline
+from hybrid_retriever import HybridRetriever
+from index_manifest import IndexManifest, file_sha256, make_chunk_id
+from lexical_index import LexicalIndex
+from mmap_vector_store import MmapVectorStore
+from spreadsheet_loader import SpreadsheetTableStore, load_spreadsheet
+from structured_chunker import CHUNKER_VERSION, chunk_documents
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".xlsx")
+VECTOR_BACKENDS = ("chroma", "mmap")
+
+logger = logging.getLogger(__name__)
+
+
+def load_file(file_path, table_store_path=None):
+    ext = os.path.splitext(file_path)[1].lower()
+    try:
+        if ext == ".pdf":
+            loader = PyPDFLoader(file_path)
+        elif ext == ".txt":
+            loader = TextLoader(file_path, encoding="utf-8")
+        elif ext == ".xlsx":
+            # All sheets, as column-aware row chunks that are already token-bounded
+            return load_spreadsheet(file_path, table_store_path=table_store_path)
+        else:
+            logger.warning("unsupported file type: %s", file_path)
+            return []
+
+        docs = loader.load()
+    except Exception as error:
+        logger.warning("failed to load %s: %s", file_path, error)
+        return []
+
+    filename = os.path.basename(file_path)
+    for doc in docs:
+        doc.metadata["source"] = filename
+        doc.metadata["file_name"] = filename  # Add file_name metadata for all docs
+    return docs
+
+
+def split_documents(docs):
+    # Structure-aware chunks (headings, AT command entries, code blocks) without overlap.
+    return chunk_documents(docs)
+
+
+def load_and_split_file(file_path, known_hash=None, table_store_path=None):
+    """
+    Hash, load and split one file. Runs inside a loader worker process.
+
+    Every failure is caught and returned, so one corrupt PDF never takes the
+    rest of the batch down with it.
+
+    Args:
+        file_path (str): Path of the file to process
+        known_hash (str): Content hash from the manifest; if it still matches, loading is skipped
+        table_store_path (str): SQLite file that receives the parsed tables of spreadsheets
+
+    Returns:
+        tuple: (file_path, content_hash, doc_splits or None if unchanged, error message or None)
+    """
+    try:
+        content_hash = file_sha256(file_path)
+        if content_hash == known_hash:
+            return file_path, content_hash, None, None
+        docs = load_file(file_path, table_store_path=table_store_path)
+        if file_path.lower().endswith(".xlsx"):
+            return file_path, content_hash, docs, None
+        return file_path, content_hash, split_documents(docs) if docs else [], None
+    except Exception as error:
+        return file_path, None, None, f"{type(error).__name__}: {error}"
+
+
+def _timed_load_and_split(*args):
+    # Timed where it runs, since a pooled worker's wall time is not visible to the parent.
+    started = time.perf_counter()
+    result = load_and_split_file(*args)
+    return result, time.perf_counter() - started
+
+
+def _record_load_split(timed):
+    result, seconds = timed
+    file_key, _, doc_splits, _ = result
+    # Files whose content hash was unchanged were not read, so only real loads are recorded.
+    if doc_splits is not None:
+        telemetry.record_stage("load_split", seconds, file=os.path.basename(file_key), chunks=len(doc_splits))
+    return result
 
 
 class VectorstoreBuilder:
-    def __init__(self, pdf_directory="./docs", persist_directory="./chroma_db"):
+    def __init__(
+        self,
+        pdf_directory="./docs",
+        persist_directory="./chroma_db",
+        embedding=None,
+        embed_batch_size=64,
+        embed_max_workers=4,
+        embed_tokens_per_minute=1_000_000,
+        load_max_workers=None,
+        vector_backend="chroma",
+    ):
+        if vector_backend not in VECTOR_BACKENDS:
+            raise ValueError(f"Unknown vector backend: {vector_backend}")
         self.pdf_directory = pdf_directory
         self.persist_directory = persist_directory
-        self.processed_files_record = os.path.join(persist_directory, "processed_files.json")
+        self.vector_backend = vector_backend
+        # Each backend keeps its own manifest and lexical index, so switching backends re-indexes into
+        # the new one instead of trusting a manifest written for the other.
+        self.index_directory = persist_directory if vector_backend == "chroma" else os.path.join(persist_directory, vector_backend)
+        self.manifest_path = os.path.join(self.index_directory, "index_manifest.json")
+        self.table_store = SpreadsheetTableStore(os.path.join(persist_directory, "tables.sqlite"))
+        self.lexical_index = LexicalIndex(os.path.join(self.index_directory, "lexical_index.json"))
+        self.embedding = embedding or OpenAIEmbeddings()
+        self.embed_batch_size = embed_batch_size
+        self.embed_max_workers = embed_max_workers
+        self.embed_tokens_per_minute = embed_tokens_per_minute
+        self.load_max_workers = load_max_workers
+        self._vectorstore = None
 
         # Ensure persist directory exists
-        os.makedirs(self.persist_directory, exist_ok=True)
+        os.makedirs(self.index_directory, exist_ok=True)
+        self.manifest = IndexManifest(self.manifest_path)
 
-    def robust_load_file(self, file_path):
-        ext = os.path.splitext(file_path)[1].lower()
-        try:
-            if ext == ".pdf":
-                loader = PyPDFLoader(file_path)
-            elif ext == ".txt":
-                loader = TextLoader(file_path, encoding="utf-8")
-            elif ext == ".xlsx":
-                # Load Excel file and convert it to a list of Document objects
-                docs = []
-                df = pd.read_excel(file_path)
-                for _, row in df.iterrows():
-                    content = " ".join(map(str, row.values))  # Combine all cell values in a row
-                    docs.append(Document(page_content=content, metadata={"source": os.path.basename(file_path), "file_name": os.path.basename(file_path)}))
-                return docs
+    @property
+    def embedding_model_name(self):
+        return getattr(self.embedding, "model", None) or type(self.embedding).__name__
+
+    def get_vectorstore(self):
+        """
+        Return the vectorstore (the Chroma collection or the memory-mapped store), opening it on first use.
+        """
+        if self._vectorstore is None:
+            if self.vector_backend == "mmap":
+                self._vectorstore = MmapVectorStore(self.index_directory, embedding_function=self.embedding)
             else:
-                print(f"Unsupported file type: {file_path}")
-                return []
+                self._vectorstore = Chroma(
+                    collection_name="rag-chroma",
+                    embedding_function=self.embedding,
+                    persist_directory=self.persist_directory
+                )
+        return self._vectorstore
 
-            docs = loader.load()
-        except Exception as error:
-            print(f"Failed to load {file_path}: {error}")
-            return []
+    def _collection(self):
+        # MmapVectorStore answers the same get/upsert/delete calls as a Chroma collection.
+        vectorstore = self.get_vectorstore()
+        return vectorstore if self.vector_backend == "mmap" else vectorstore._collection
 
-        filename = os.path.basename(file_path)
-        for doc in docs:
-            doc.metadata["source"] = filename
-            doc.metadata["file_name"] = filename  # Add file_name metadata for all docs
-        return docs
+    def robust_load_file(self, file_path):
+        return load_file(file_path, table_store_path=self.table_store.db_path)
 
-    def build_or_update_vectorstore(self):
-        if os.path.exists(self.processed_files_record):
-            with open(self.processed_files_record, "r") as f:
-                processed_files = set(json.load(f))
-        else:
-            processed_files = set()
+    def _existing_chunk_ids(self, ids):
+        return self._collection().get(ids=list(ids), include=[])["ids"]
+
+    def _upsert_embeddings(self, ids, texts, metadatas, embeddings):
+        self._collection().upsert(
+            ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings
+        )
 
-        vectorstore = Chroma(
-            collection_name="rag-chroma",
-            embedding_function=OpenAIEmbeddings(),
-            persist_directory=self.persist_directory
+    def embed_and_store(self, doc_splits, chunk_ids, progress_callback=None):
+        """
+        Embed chunks through the batched pipeline, checkpointing each batch into the collection.
+        """
+        pipeline = EmbeddingPipeline(
+            self.embedding,
+            upsert_fn=self._upsert_embeddings,
+            existing_ids_fn=self._existing_chunk_ids,
+            batch_size=self.embed_batch_size,
+            max_workers=self.embed_max_workers,
+            tokens_per_minute=self.embed_tokens_per_minute,
+            progress_callback=progress_callback,
         )
+        return pipeline.run(doc_splits, chunk_ids)
+
+    def split_documents(self, docs):
+        return split_documents(docs)
+
+    def list_source_files(self):
+        """
+        Return {file_path: stat} for every supported file in the docs directory.
+        """
+        files = {}
+        for filename in sorted(os.listdir(self.pdf_directory)):
+            file_path = os.path.join(self.pdf_directory, filename)
+            if filename.lower().endswith(SUPPORTED_EXTENSIONS) and os.path.isfile(file_path):
+                files[os.path.normpath(file_path)] = os.stat(file_path)
+        return files
+
+    @staticmethod
+    def _chunker(file_key):
+        # Spreadsheet rows are not re-chunked, so only the other files depend on the chunker.
+        return None if file_key.lower().endswith(".xlsx") else CHUNKER_VERSION
+
+    def _current_chunker(self, file_key):
+        entry = self.manifest.get(file_key)
+        return entry is not None and entry.get("chunker") == self._chunker(file_key)
+
+    def _needs_indexing(self, file_key, stat):
+        # A new CHUNKER_VERSION re-chunks unchanged files too.
+        return not (self.manifest.is_unchanged(file_key, stat, self.embedding_model_name) and self._current_chunker(file_key))
+
+    def _known_hash(self, file_key):
+        entry = self.manifest.get(file_key)
+        if entry and entry["embedding_model"] == self.embedding_model_name and self._current_chunker(file_key):
+            return entry["sha256"]
+        return None
+
+    def index_file(self, file_path, stat=None, progress_callback=None):
+        """
+        Bring one file's chunks in the vectorstore up to date with its content on disk.
 
-        new_documents = []
-
-        for filename in os.listdir(self.pdf_directory):
-            if filename.lower().endswith((".pdf", ".txt", ".xlsx")) and filename not in processed_files:
-                file_path = os.path.join(self.pdf_directory, filename)
-                print(f"Processing new file: {file_path}")
-                docs = self.robust_load_file(file_path)
-                if docs:
-                    new_documents.extend(docs)
-                    processed_files.add(filename)
-
-        if new_documents:
-            splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-                chunk_size=1000, chunk_overlap=300
-            )
-            new_doc_splits = splitter.split_documents(new_documents)
-            vectorstore = Chroma.from_documents(
-                documents=new_doc_splits,
-                collection_name="rag-chroma",
-                embedding=OpenAIEmbeddings(),
-                persist_directory=self.persist_directory
-            )
-
-            with open(self.processed_files_record, "w") as f:
-                json.dump(list(processed_files), f)
+        Unchanged files (same mtime, size and embedding model) are skipped without
+        being read. A touched file whose content hash is unchanged only has its stat
+        refreshed. Otherwise the file is re-split, its chunks are upserted under
+        deterministic IDs and any chunk IDs it no longer produces are deleted.
+
+        Returns:
+            bool: True if the vectorstore was modified
+        """
+        file_key = os.path.normpath(file_path)
+        stat = stat or os.stat(file_key)
+        if not self._needs_indexing(file_key, stat):
+            return False
+        result = _record_load_split(_timed_load_and_split(file_key, self._known_hash(file_key), self.table_store.db_path))
+        return self.store_loaded_file(result, stat, progress_callback=progress_callback)
+
+    def store_loaded_file(self, result, stat, progress_callback=None):
+        """
+        Embed and store the output of load_and_split_file() and record it in the manifest.
+
+        The manifest entry is written only after every batch is stored, so an
+        interrupted run resumes from the batches already checkpointed.
+        """
+        file_key, content_hash, doc_splits, error = result
+        if error:
+            logger.warning("failed to load %s: %s", file_key, error)
+            return False
+        model_name = self.embedding_model_name
+        entry = self.manifest.get(file_key)
+        if doc_splits is None:
+            # Touched but identical content: refresh the stat so the next run skips it without reading.
+            self.manifest.touch(file_key, stat)
+            self.manifest.save()
+            return False
+        if not doc_splits:
+            return self._store_empty_file(file_key, content_hash, stat, entry)
+
+        logger.info("processing new file: %s", file_key)
+        chunker = self._chunker(file_key)
+        chunk_ids = [make_chunk_id(file_key, content_hash, i, chunker) for i in range(len(doc_splits))]
+
+        vectorstore = self.get_vectorstore()
+        if entry is None:
+            # Vectors written before the manifest existed have random IDs; purge them by source,
+            # keeping any batches already checkpointed by an interrupted run.
+            stored = self._collection().get(where={"source": os.path.basename(file_key)}, include=[])["ids"]
+            orphan_ids = sorted(set(stored) - set(chunk_ids))
+            if orphan_ids:
+                vectorstore.delete(ids=orphan_ids)
+                self.lexical_index.remove(orphan_ids)
+
+        def report(done, total, elapsed):
+            if progress_callback:
+                progress_callback(os.path.basename(file_key), done, total, elapsed)
+
+        file_name = os.path.basename(file_key)
+        with telemetry.ingestion_stage("embed_store", file=file_name, chunks=len(chunk_ids)):
+            self.embed_and_store(doc_splits, chunk_ids, progress_callback=report)
+            stale_ids = sorted(set(entry["chunk_ids"]) - set(chunk_ids)) if entry else []
+            if stale_ids:
+                vectorstore.delete(ids=stale_ids)
+        with telemetry.ingestion_stage("lexical_index", file=file_name, chunks=len(chunk_ids)):
+            self.lexical_index.remove(stale_ids)
+            self.lexical_index.add(chunk_ids, [doc.page_content for doc in doc_splits])
+
+        self.manifest.set(file_key, content_hash, stat, chunk_ids, model_name, chunker=chunker)
+        self.manifest.save()
+        return True
+
+    def _store_empty_file(self, file_key, content_hash, stat, entry):
+        """
+        Record a file that loaded to no chunks, purging whatever it had indexed before.
+
+        The manifest keeps its hash with no chunk IDs, so an empty or unloadable file
+        is not reloaded on every rescan, only once its content changes.
+        """
+        logger.info("no chunks loaded from %s", file_key)
+        if entry is None:
+            stale_ids = self._collection().get(where={"source": os.path.basename(file_key)}, include=[])["ids"]
+        else:
+            stale_ids = entry["chunk_ids"]
+        with telemetry.ingestion_stage("delete", file=os.path.basename(file_key), chunks=len(stale_ids)):
+            if stale_ids:
+                self.get_vectorstore().delete(ids=list(stale_ids))
+                self.lexical_index.remove(stale_ids)
+            self.manifest.set(file_key, content_hash, stat, [], self.embedding_model_name, chunker=self._chunker(file_key))
+            self.manifest.save()
+        return bool(stale_ids)
+
+    def iter_loaded_files(self, file_keys):
+        """
+        Load and split files across a process pool, yielding each result as soon as it is ready.
+
+        PDF parsing and chunking are CPU-bound and hold the GIL, so they run in
+        separate processes. Results stream back in completion order, letting the caller
+        embed one file while the others are still being parsed. If a worker process dies
+        outright, the files it had not finished are processed in this process instead.
+        """
+        file_keys = list(file_keys)
+        if len(file_keys) <= 1 or self.load_max_workers == 1:
+            for file_key in file_keys:
+                yield _record_load_split(_timed_load_and_split(file_key, self._known_hash(file_key), self.table_store.db_path))
+            return
+
+        max_workers = min(self.load_max_workers or os.cpu_count() or 1, len(file_keys))
+        remaining = set(file_keys)
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = [
+                    executor.submit(_timed_load_and_split, file_key, self._known_hash(file_key), self.table_store.db_path)
+                    for file_key in file_keys
+                ]
+                for future in as_completed(futures):
+                    result = _record_load_split(future.result())
+                    remaining.discard(result[0])
+                    yield result
+        except BrokenProcessPool as error:
+            logger.warning("loader process pool failed (%s); loading remaining files in-process", error)
+            for file_key in sorted(remaining):
+                yield _record_load_split(_timed_load_and_split(file_key, self._known_hash(file_key), self.table_store.db_path))
+
+    def remove_file(self, file_key):
+        """
+        Purge a file's chunks from the vectorstore and drop it from the manifest.
+        """
+        entry = self.manifest.remove(file_key)
+        with telemetry.ingestion_stage("delete", file=os.path.basename(file_key), chunks=len(entry["chunk_ids"]) if entry else 0):
+            if entry and entry["chunk_ids"]:
+                self.get_vectorstore().delete(ids=entry["chunk_ids"])
+                self.lexical_index.remove(entry["chunk_ids"])
+            self.table_store.remove(file_key)
+            self.manifest.save()
+        return entry is not None
+
+    def build_or_update_vectorstore(self, progress_callback=None):
+        """
+        Incrementally sync the vectorstore with the docs directory.
+
+        Args:
+            progress_callback (callable): Optional progress_callback(file_name, done, total, elapsed_seconds)
+        """
+        vectorstore = self.get_vectorstore()
+        self.manifest.load()
+        if not self._lexical_index_complete():
+            self.rebuild_lexical_index()
+
+        source_files = self.list_source_files()
+        try:
+            for file_key in list(self.manifest.files):
+                if file_key not in source_files:
+                    logger.info("removing deleted file from vectorstore: %s", file_key)
+                    self.remove_file(file_key)
+
+            pending = [file_key for file_key, stat in source_files.items() if self._needs_indexing(file_key, stat)]
+            for result in self.iter_loaded_files(pending):
+                self.store_loaded_file(result, source_files[result[0]], progress_callback=progress_callback)
+        finally:
+            # Rewriting the whole BM25 file per file would make a cold build quadratic; save it once.
+            self.lexical_index.save_if_changed()
 
         return vectorstore
 
-    def get_retriever_tool(self):
-        vectorstore = self.build_or_update_vectorstore()
-        retriever = vectorstore.as_retriever()
+    def _lexical_index_complete(self):
+        """
+        True if the saved BM25 index holds every chunk in the manifest.
 
-        retriever_tool = create_retriever_tool(
-            retriever,
-            "technical_docs_retriever",
-            "Search and return information of how to configure or set up Multitech Gateway and or Dot/xDot. " \
+        The manifest is saved per file and the BM25 index once per build or job,
+        so a crash in between leaves chunks the BM25 index does not know yet.
+        """
+        if not self.lexical_index.exists():
+            return False
+        indexed = self.lexical_index.doc_lengths
+        return all(chunk_id in indexed for entry in self.manifest.files.values() for chunk_id in entry["chunk_ids"])
+
+    def rebuild_lexical_index(self):
+        """
+        Build the BM25 index from every chunk already stored in the collection.
+        """
+        stored = self._collection().get(include=["documents"])
+        self.lexical_index.add(stored["ids"], stored["documents"])
+        self.lexical_index.save()
+
+    def get_retriever_tool(self, vectorstore=None):
+        if vectorstore is None:
+            vectorstore = self.build_or_update_vectorstore()
+        retriever = HybridRetriever(vectorstore=vectorstore, lexical_index=self.lexical_index)
+
+        def search(query: str) -> str:
+            """query to look up in retriever"""
+            return format_documents(retriever.invoke(query))
+
+        async def asearch(query: str) -> str:
+            """query to look up in retriever"""
+            return format_documents(await retriever.ainvoke(query))
+
+        retriever_tool = StructuredTool.from_function(
+            func=search,
+            coroutine=asearch,
+            name="technical_docs_retriever",
+            description="Search and return information of how to configure or set up Multitech Gateway and or Dot/xDot. " \
             "It also shows how to configure the Multitech gateway to connect to other LNS server/Basic station like AWS." \
-            "If there is no information, please use the internet search tool. Please, include the source of the information in the response."           
+            "If there is no information, please use the internet search tool. Please, include the source of the information in the response.",
         )
+        # Each chunk is prefixed with its file name, pages/rows, section and chunk index, so answers can
+        # cite it, cached answers can track it and the context assembler can merge neighbouring chunks.
         return retriever_tool
 
     def delete_file_from_vectorstore(self, file_name):
         """
         Remove all documents from the vectorstore whose 'source' metadata matches file_name.
         """
-        # Load the vectorstore
-        vectorstore = Chroma(
-            collection_name="rag-chroma",
-            embedding_function=OpenAIEmbeddings(),
-            persist_directory=self.persist_directory
-        )
-        # Chroma supports deletion by filter
-        filter_dict = {"source": file_name}
-        try:
-            vectorstore._collection.delete(where=filter_dict)
-            print(f"Deleted all vectors with source={file_name} from vectorstore.")
-        except Exception as e:
-            print(f"Error deleting vectors for {file_name}: {e}")
+        vectorstore = self.get_vectorstore()
+        with telemetry.ingestion_stage("delete", file=file_name):
+            # Both backends support deletion by filter
+            filter_dict = {"source": file_name}
+            try:
+                self._collection().delete(where=filter_dict)
+                logger.info("deleted all vectors with source=%s from vectorstore", file_name)
+            except Exception as e:
+                logger.warning("error deleting vectors for %s: %s", file_name, e)
+            for file_key in self.manifest.find_by_source(file_name):
+                entry = self.manifest.remove(file_key)
+                self.lexical_index.remove(entry["chunk_ids"])
+                self.table_store.remove(file_key)
+            self.manifest.save()
         return vectorstore